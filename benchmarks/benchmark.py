@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from benchmarks.traffic_generator import SCENARIOS, generate, write_pcap
+from parsers.ethernet_parser import EthernetHeader
+from parsers.ip_parser import IPHeader
+from parsers.ipv6_parser import IPv6Header
+from parsers.tcp_parser import TCPHeader
+from sniffer.pipeline import Pipeline
+from sniffer.sniffer import Sniffer
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+def percentiles(samples: list[int]) -> dict:
+    """Returns the PERCENTILES of nanosecond samples, in microseconds."""
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    return {f"p{p:g}": samples[min(len(samples) - 1, int(len(samples) * p / 100))] / 1000 for p in PERCENTILES}
+
+
+class Benchmark:
+    """
+    A class for measuring the parser stack on a synthetic scenario.
+
+    Attributes:
+        scenario (str): The name of the scenario.
+        frames (list): The (frame, timestamp) pairs of the scenario.
+        pcap_path (str): A pcap file holding the same frames, used to build sniffers without a socket.
+        transactions (int): The number of HTTP messages reported by the last run.
+
+    Methods:
+        run_throughput(): Measures packets/s and transactions/s through `Sniffer.process_ip_packet`.
+        run_replay(): Measures packets/s when replaying the pcap file with `Sniffer.sniff_packets`.
+        run_pipeline(): Measures packets/s when replaying the pcap file through the capture and parse stages.
+        run_stages(): Measures the latency percentiles of each decoding stage.
+        run_memory(): Measures the peak memory allocated while processing the scenario.
+        run(repeat): Runs everything and returns the results as a dictionary.
+
+    Note:
+        Every measurement uses a fresh `Sniffer`, so no flow state leaks from one run to the next.
+        The stage timers add their own overhead, which is why throughput is measured separately.
+    """
+
+    def __init__(self, scenario: str, scale: float, directory: str):
+        self.scenario = scenario
+        self.frames = generate(scenario, scale)
+        self.pcap_path = os.path.join(directory, f"{scenario}.pcap")
+        write_pcap(self.pcap_path, self.frames)
+        self.transactions = 0
+
+    def new_sniffer(self) -> Sniffer:
+        return Sniffer(pcap_file=self.pcap_path)
+
+    def on_packet_received(self, *_) -> None:
+        self.transactions += 1
+
+    def run_throughput(self) -> dict:
+        sniffer = self.new_sniffer()
+        self.transactions = 0
+        total_bytes = sum(len(frame) for frame, _ in self.frames)
+
+        start = time.perf_counter()
+        for frame, timestamp in self.frames:
+            sniffer.process_ip_packet(frame, self.on_packet_received, timestamp)
+        elapsed = time.perf_counter() - start
+
+        return {
+            "seconds": elapsed,
+            "packets_per_second": len(self.frames) / elapsed,
+            "transactions_per_second": self.transactions / elapsed,
+            "megabytes_per_second": total_bytes / elapsed / 1e6,
+            "transactions": self.transactions,
+        }
+
+    def run_replay(self) -> dict:
+        sniffer = self.new_sniffer()
+        start = time.perf_counter()
+        sniffer.sniff_packets(threading.Event(), lambda *_: None)
+        elapsed = time.perf_counter() - start
+        return {"seconds": elapsed, "packets_per_second": len(self.frames) / elapsed}
+
+    def run_pipeline(self) -> dict:
+        pipeline = Pipeline(self.new_sniffer())
+        start = time.perf_counter()
+        pipeline.sniff_packets(threading.Event(), lambda *_: None)
+        elapsed = time.perf_counter() - start
+        return {"seconds": elapsed, "packets_per_second": len(self.frames) / elapsed, **pipeline.stats()}
+
+    def run_stages(self) -> dict:
+        sniffer = self.new_sniffer()
+        stages = {"ethernet": [], "ip": [], "tcp": [], "process_tcp_packet": []}
+        clock = time.perf_counter_ns
+
+        # Mirrors Sniffer.process_ip_packet, with a timer around every stage
+        for frame, timestamp in self.frames:
+            view = memoryview(frame)
+            start = clock()
+            ethernet = EthernetHeader(view)
+            after_ethernet = clock()
+            if ethernet.ethernet_type == 0x0800:
+                ip = IPHeader(view, ethernet.payload_offset)
+            else:
+                ip = IPv6Header(view, ethernet.payload_offset)
+            after_ip = clock()
+            tcp = TCPHeader(view, ip.payload_offset, ip.payload_end)
+            after_tcp = clock()
+            sniffer.process_tcp_packet(ip, tcp, lambda *_: None, timestamp)
+            end = clock()
+
+            stages["ethernet"].append(after_ethernet - start)
+            stages["ip"].append(after_ip - after_ethernet)
+            stages["tcp"].append(after_tcp - after_ip)
+            stages["process_tcp_packet"].append(end - after_tcp)
+
+        return {stage: percentiles(samples) for stage, samples in stages.items()}
+
+    def run_memory(self) -> dict:
+        sniffer = self.new_sniffer()
+        tracemalloc.start()
+        try:
+            for frame, timestamp in self.frames:
+                sniffer.process_ip_packet(frame, lambda *_: None, timestamp)
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return {"peak_bytes": peak, "retained_bytes": current}
+
+    def run(self, repeat: int) -> dict:
+        # The best of several runs is the least disturbed by the rest of the machine
+        throughput = max((self.run_throughput() for _ in range(repeat)),
+                         key=lambda result: result["packets_per_second"])
+        return {
+            "packets": len(self.frames),
+            "bytes": sum(len(frame) for frame, _ in self.frames),
+            "throughput": throughput,
+            "replay": self.run_replay(),
+            "pipeline": self.run_pipeline(),
+            "stage_latency_us": self.run_stages(),
+            "memory": self.run_memory(),
+        }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: dict) -> None:
+    print(f"{'scenario':<14}{'packets':>10}{'pkt/s':>12}{'tx/s':>10}{'MB/s':>8}"
+          f"{'tcp p50 us':>12}{'tcp p99 us':>12}{'peak MB':>9}")
+    for scenario, result in results["scenarios"].items():
+        throughput = result["throughput"]
+        tcp_latency = result["stage_latency_us"]["process_tcp_packet"]
+        print(f"{scenario:<14}{result['packets']:>10}{throughput['packets_per_second']:>12.0f}"
+              f"{throughput['transactions_per_second']:>10.0f}{throughput['megabytes_per_second']:>8.1f}"
+              f"{tcp_latency['p50']:>12.2f}{tcp_latency['p99']:>12.2f}{result['memory']['peak_bytes'] / 1e6:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sniffer parser stack on synthetic traffic")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, may be repeated (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply the number of flows per scenario")
+    parser.add_argument("--repeat", type=int, default=3, help="throughput runs per scenario, the best is kept")
+    parser.add_argument("--output", metavar="FILE", help="write the results as JSON to FILE")
+    args = parser.parse_args()
+
+    results = {
+        "revision": git_revision(),
+        "time": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scale": args.scale,
+        "scenarios": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for scenario in args.scenario or SCENARIOS:
+            print(f"Running {scenario}...")
+            results["scenarios"][scenario] = Benchmark(scenario, args.scale, directory).run(args.repeat)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import ipaddress
+import random
+import struct
+
+from sniffer.pcap_reader import PCAP_MAGIC_NANOSECONDS, LINKTYPE_ETHERNET
+from sniffer.pcap_writer import PCAP_HEADER, RECORD_HEADER, SNAPLEN
+
+FLAG_FIN, FLAG_SYN, FLAG_PSH, FLAG_ACK = 0x01, 0x02, 0x08, 0x10
+
+MSS = 1448
+CLIENT_MAC = bytes.fromhex("020000000001")
+SERVER_MAC = bytes.fromhex("020000000002")
+
+
+def build_frame(source: str, source_port: int, dest: str, dest_port: int, sequence: int, acknowledgment: int,
+                flags: int, payload: bytes = b"") -> bytes:
+    """
+    Builds an Ethernet frame holding a TCP segment over IPv4 or IPv6, depending on the addresses.
+
+    Checksums are left at zero, the parsers never verify them.
+    """
+    tcp = struct.pack("!HHLLHHHH", source_port, dest_port, sequence & 0xFFFFFFFF, acknowledgment & 0xFFFFFFFF,
+                      (5 << 12) | flags, 65535, 0, 0) + payload
+    source_address, dest_address = ipaddress.ip_address(source), ipaddress.ip_address(dest)
+    if source_address.version == 4:
+        ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(tcp), 0, 0x4000, 64, 6, 0,
+                         source_address.packed, dest_address.packed)
+        return SERVER_MAC + CLIENT_MAC + b"\x08\x00" + ip + tcp
+    ip = struct.pack("!IHBB16s16s", 6 << 28, len(tcp), 6, 64, source_address.packed, dest_address.packed)
+    return SERVER_MAC + CLIENT_MAC + b"\x86\xdd" + ip + tcp
+
+
+def build_request(method: str, path: str, host: str, body: bytes = b"") -> bytes:
+    headers = (f"{method} {path} HTTP/1.1\r\n"
+               f"Host: {host}\r\n"
+               f"User-Agent: benchmark/1.0\r\n"
+               f"Accept: */*\r\n"
+               f"Content-Length: {len(body)}\r\n\r\n")
+    return headers.encode() + body
+
+
+def build_response(body: bytes, content_type: str = "text/html") -> bytes:
+    headers = (f"HTTP/1.1 200 OK\r\n"
+               f"Server: benchmark/1.0\r\n"
+               f"Content-Type: {content_type}\r\n"
+               f"Content-Length: {len(body)}\r\n\r\n")
+    return headers.encode() + body
+
+
+class TcpFlow:
+    """
+    A class for generating the frames of one TCP connection carrying HTTP exchanges.
+
+    Attributes:
+        client (tuple): (address, port) of the client.
+        server (tuple): (address, port) of the server.
+        client_sequence (int): The next sequence number sent by the client.
+        server_sequence (int): The next sequence number sent by the server.
+
+    Methods:
+        handshake(): Returns the SYN, SYN-ACK and ACK frames.
+        send(from_client, data): Returns the segments carrying `data`, with an ACK every other segment.
+        exchange(request, response): Returns the frames of a request and its response.
+        close(): Returns the FIN exchange.
+    """
+
+    def __init__(self, client: tuple[str, int], server: tuple[str, int], rng: random.Random):
+        self.client = client
+        self.server = server
+        self.client_sequence = rng.getrandbits(32)
+        self.server_sequence = rng.getrandbits(32)
+
+    def _frame(self, from_client: bool, flags: int, payload: bytes = b"") -> bytes:
+        if from_client:
+            return build_frame(*self.client, *self.server, self.client_sequence, self.server_sequence, flags, payload)
+        return build_frame(*self.server, *self.client, self.server_sequence, self.client_sequence, flags, payload)
+
+    def handshake(self) -> list[bytes]:
+        frames = [self._frame(True, FLAG_SYN)]
+        self.client_sequence += 1
+        frames.append(self._frame(False, FLAG_SYN | FLAG_ACK))
+        self.server_sequence += 1
+        frames.append(self._frame(True, FLAG_ACK))
+        return frames
+
+    def send(self, from_client: bool, data: bytes) -> list[bytes]:
+        frames = []
+        for index, start in enumerate(range(0, len(data), MSS)):
+            segment = data[start:start + MSS]
+            frames.append(self._frame(from_client, FLAG_ACK | FLAG_PSH, segment))
+            if from_client:
+                self.client_sequence += len(segment)
+            else:
+                self.server_sequence += len(segment)
+            if index % 2:
+                frames.append(self._frame(not from_client, FLAG_ACK))
+        return frames
+
+    def exchange(self, request: bytes, response: bytes) -> list[bytes]:
+        return self.send(True, request) + self.send(False, response)
+
+    def close(self) -> list[bytes]:
+        frames = [self._frame(True, FLAG_FIN | FLAG_ACK)]
+        self.client_sequence += 1
+        frames.append(self._frame(False, FLAG_FIN | FLAG_ACK))
+        self.server_sequence += 1
+        frames.append(self._frame(True, FLAG_ACK))
+        return frames
+
+
+def client_address(index: int, ipv6: bool) -> str:
+    if ipv6:
+        return f"2001:db8::{index % 0xFFFF + 1:x}"
+    return f"10.{index >> 16 & 0xFF}.{index >> 8 & 0xFF}.{index & 0xFF}"
+
+
+def new_flow(index: int, rng: random.Random, ipv6: bool = False) -> TcpFlow:
+    server = ("2001:db8::ffff", 80) if ipv6 else ("192.0.2.80", 80)
+    return TcpFlow((client_address(index, ipv6), 10000 + index % 50000), server, rng)
+
+
+def small_gets(count: int, rng: random.Random, ipv6: bool = False) -> list[bytes]:
+    frames = []
+    for index in range(count):
+        flow = new_flow(index, rng, ipv6)
+        body = rng.randbytes(512)
+        frames += (flow.handshake() + flow.exchange(build_request("GET", f"/item/{index}", "example.com"),
+                                                    build_response(body)) + flow.close())
+    return frames
+
+
+def large_posts(count: int, rng: random.Random, body_size: int = 1024 * 1024) -> list[bytes]:
+    frames = []
+    for index in range(count):
+        flow = new_flow(index, rng)
+        request = build_request("POST", "/upload", "example.com", rng.randbytes(body_size))
+        frames += flow.handshake() + flow.exchange(request, build_response(b"{}", "application/json")) + flow.close()
+    return frames
+
+
+def many_flows(count: int, rng: random.Random, response_size: int = 16384) -> list[bytes]:
+    # Every flow is generated on its own, then their frames are interleaved round-robin
+    streams = []
+    for index in range(count):
+        flow = new_flow(index, rng)
+        streams.append(flow.handshake() + flow.exchange(build_request("GET", f"/page/{index}", "example.com"),
+                                                        build_response(rng.randbytes(response_size)))
+                       + flow.close())
+    frames = []
+    for position in range(max(len(stream) for stream in streams)):
+        frames += [stream[position] for stream in streams if position < len(stream)]
+    return frames
+
+
+def out_of_order(count: int, rng: random.Random, response_size: int = 32768, swap_rate: float = 0.2,
+                 retransmit_rate: float = 0.05) -> list[bytes]:
+    frames = []
+    for index in range(count):
+        flow = new_flow(index, rng)
+        handshake = flow.handshake()
+        request = flow.send(True, build_request("GET", f"/file/{index}", "example.com"))
+        response = flow.send(False, build_response(rng.randbytes(response_size)))
+        # Reorder neighbouring segments and duplicate a few of them, the first segment of each message is kept
+        # in place since a flow is only picked up from the start of a message
+        for position in range(1, len(response) - 1):
+            if rng.random() < swap_rate:
+                response[position], response[position + 1] = response[position + 1], response[position]
+        for position in range(len(response) - 1, 0, -1):
+            if rng.random() < retransmit_rate:
+                response.insert(position + rng.randint(1, 3), response[position])
+        frames += handshake + request + response + flow.close()
+    return frames
+
+
+def non_http(count: int, rng: random.Random, stream_size: int = 65536) -> list[bytes]:
+    # Long TLS-like streams, half of them picked up in the middle, with an HTTP exchange for every ten of them
+    frames = []
+    for index in range(count):
+        flow = TcpFlow((client_address(index, False), 20000 + index % 40000), ("192.0.2.43", 443), rng)
+        handshake = flow.handshake()
+        record = b"\x16\x03\x03" + rng.randbytes(stream_size)
+        frames += (handshake if index % 2 else []) + flow.exchange(record, record) + flow.close()
+        if index % 10 == 0:
+            frames += small_gets(1, rng)
+    return frames
+
+
+SCENARIOS = {
+    "small_gets": lambda scale, rng: small_gets(int(2000 * scale), rng),
+    "large_posts": lambda scale, rng: large_posts(max(1, int(8 * scale)), rng),
+    "many_flows": lambda scale, rng: many_flows(int(1000 * scale), rng),
+    "out_of_order": lambda scale, rng: out_of_order(int(500 * scale), rng),
+    "ipv6": lambda scale, rng: small_gets(int(2000 * scale), rng, ipv6=True),
+    "non_http": lambda scale, rng: non_http(int(200 * scale), rng),
+}
+
+
+def generate(scenario: str, scale: float = 1.0, seed: int = 0) -> list[tuple[bytes, float]]:
+    """
+    Generates the frames of a benchmark scenario.
+
+    Args:
+        scenario (str): One of the names in `SCENARIOS`.
+        scale (float): Multiplies the number of flows of the scenario.
+        seed (int): Seed of the random generator, the same seed always gives the same frames.
+
+    Returns:
+        list[tuple[bytes, float]]: (frame, timestamp) pairs, 10 microseconds apart.
+    """
+    rng = random.Random(seed)
+    frames = SCENARIOS[scenario](scale, rng)
+    return [(frame, 1_700_000_000 + index * 1e-5) for index, frame in enumerate(frames)]
+
+
+def write_pcap(path: str, frames: list[tuple[bytes, float]]) -> None:
+    with open(path, "wb") as file:
+        file.write(PCAP_HEADER.pack(PCAP_MAGIC_NANOSECONDS, 2, 4, 0, 0, SNAPLEN, LINKTYPE_ETHERNET))
+        for frame, timestamp in frames:
+            seconds = int(timestamp)
+            file.write(RECORD_HEADER.pack(seconds, int((timestamp - seconds) * 1e9), len(frame), len(frame)))
+            file.write(frame)
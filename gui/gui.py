@@ -1,6 +1,21 @@
 import tkinter as tk
 from tkinter import ttk
-import threading
+from bisect import bisect_left
+from heapq import heappush, heappop
+import queue
+
+from gui.request_store import RequestStore
+
+# The pending requests are drained this many times a second, at most MAX_BATCH_SIZE at a time
+FRAME_RATE = 30
+MAX_BATCH_SIZE = 2000
+# Requests arriving while this many are waiting to be displayed are dropped
+MAX_PENDING_REQUESTS = 100000
+
+# Position of the filterable columns in the request summaries
+FILTER_COLUMNS = {"source": 1, "destination": 2, "method": 3}
+# Height of a Treeview row in pixels, used to know how many rows fit in the window
+ROW_HEIGHT = 20
 
 
 class Gui:
@@ -13,19 +28,38 @@ class Gui:
         source_ip_var (tk.StringVar): Variable to store the selected source IP for filtering.
         destination_ip_var (tk.StringVar): Variable to store the selected destination IP for filtering.
         tree (ttk.Treeview): Widget to display the list of network requests.
-        lock (threading.Lock): A lock to ensure thread-safe operations on shared resources.
-        index (int): Counter to keep track of the number of requests.
-        additional_info_dict (dict): Stores additional information (headers and body) for each request.
-        request_info (dict): Stores basic information for each request.
+        scrollbar (ttk.Scrollbar): Scrolls through the requests matching the filters.
+        pending_requests (queue.Queue): Requests added by the sniffer threads, waiting to be displayed.
+        dropped (int): The number of requests dropped because the GUI could not keep up.
+        status_label (tk.Label): Shows the number of dropped requests.
+        source_ips (set): The source IPs offered in the dropdown.
+        destination_ips (set): The destination IPs offered in the dropdown.
+        indexes (dict): For each filterable column, the ids of the requests by value, in increasing order.
+        index_heaps (dict): For each filterable column, a heap of (oldest id, value) with an entry per indexed value.
+        visible_ids (list | range): The ids of the requests matching the current filters, in increasing order,
+            a range while no filter is in use.
+        rendered_ids (tuple): The ids of the rows currently in the Treeview, which are also their item ids.
+        top (int): The position in `visible_ids` of the first row shown.
+        visible_rows (int): The number of rows that fit in the Treeview.
+        store (RequestStore): Stores the requests, with their headers and bodies on disk.
+        first_id (int): The oldest request id still in the indexes, older ones were retired by the store.
 
     Methods:
         on_method_or_ip_select(_): Handles the selection of filters (HTTP method, source IP, destination IP).
+        selected_filters(): Returns (column, value) of every filter in use.
+        matches(index: int, filters: list): Checks a request against the filters.
+        prune_retired(): Removes the requests retired by the store from the indexes and the view.
         display_dialog_box(message: str): Displays a dialog box with detailed information about a request.
         show_additional_info(): Displays additional information for a selected request in the GUI.
         start_gui(): Configures and starts the main GUI loop.
-        add_request(time, source, destination, request_type, info, body, headers): Adds a new request to the GUI.
-        update_ip_dropdowns(source: str, destination: str): Updates the source and destination IP dropdowns.
-        add_request_to_tree(index: int): Adds a request to the tree view based on the current filter criteria.
+        add_request(time, source, destination, request_type, info, body, headers): Queues a new request for the GUI.
+        drain_requests(): Displays the queued requests, called by the Tk main loop FRAME_RATE times a second.
+        update_ip_dropdowns(sources: set, destinations: set): Adds new IPs to the source and destination dropdowns.
+        add_request_to_tree(index: int, filters: list): Indexes a request, shows it if it matches the filters.
+        on_scroll(*args): Handles the scrollbar, which scrolls through `visible_ids` rather than the Treeview.
+        on_mouse_wheel(event): Scrolls with the mouse wheel.
+        on_resize(event): Recomputes how many rows fit in the Treeview.
+        render_rows(): Shows the rows of the current window in the Treeview.
 
     Usage:
         - Used to create and manage the graphical interface for a network packet sniffer.
@@ -34,9 +68,21 @@ class Gui:
 
     Note:
         The GUI is built using the Tkinter library and is designed to display network traffic.
+        Pass a `latency_report` callable returning text to get a button showing the latency of each endpoint.
+        Pass a `store` to choose where and how many requests are kept, by default they go to a temporary directory.
+
+        Tk widgets may only be used from the thread running the main loop. `add_request` is the only method meant
+        to be called from other threads: it puts the request in a bounded queue, which the main loop drains in
+        batches, so a burst of packets costs one redraw per frame instead of one per request. When the queue is
+        full, requests are counted as dropped instead of slowing down the capture.
+
+        The Treeview only ever holds the rows that fit in the window, the scrollbar moves that window over
+        `visible_ids`. Filtering starts from the shortest index list of the selected values and checks the other
+        filters on those requests only, so changing a dropdown costs the size of the result, not of the capture.
+        The view follows new requests as long as it is scrolled to the bottom.
     """
 
-    def __init__(self, stop_action):
+    def __init__(self, stop_action, latency_report=None, store: RequestStore | None = None):
         self.app = tk.Tk()
         self.app.title("Sniffer")
 
@@ -79,10 +125,20 @@ class Gui:
 
         self.destination_ip_dropdown['values'] = ('None',)
 
+        # Dropped requests, only shown once the GUI falls behind
+        self.status_label = tk.Label(top_frame, text="")
+        self.status_label.pack(side="right", padx=10)
+
         # Stop button
         stop_button = tk.Button(top_frame, text="Stop", command=stop_action)
         stop_button.pack(side="left", padx=10)
 
+        # Latency button, shows the response time percentiles of every endpoint
+        if latency_report is not None:
+            latency_button = tk.Button(top_frame, text="Latency",
+                                       command=lambda: self.display_dialog_box(latency_report()))
+            latency_button.pack(side="left", padx=10)
+
         # Frame for the Treeview (List of Requests) at the bottom
         bottom_frame = tk.Frame(self.app)
         bottom_frame.pack(side="bottom", fill="both", expand=True, padx=10, pady=10)
@@ -91,41 +147,79 @@ class Gui:
         self.tree_frame = tk.Frame(bottom_frame)
         self.tree_frame.pack(side="top", fill="both", expand=True)
 
-        # Create a Treeview widget
+        # Create a Treeview widget, with rows of a known height
+        ttk.Style(self.app).configure("Treeview", rowheight=ROW_HEIGHT)
         self.tree = ttk.Treeview(self.tree_frame,
                                  columns=("No.", "Time", "Source", "Destination", "Request Type", "Info"))
+        # Create a vertical scrollbar
+        self.scrollbar = ttk.Scrollbar(self.tree_frame, orient="vertical", command=self.on_scroll)
 
-        # Initialize the lock object
-        self.lock = threading.Lock()
+        # Filled by the sniffer threads, drained by the main loop
+        self.pending_requests = queue.Queue(maxsize=MAX_PENDING_REQUESTS)
+        self.dropped = 0
 
-        self.index = 0
+        self.source_ips = set()
+        self.destination_ips = set()
 
-        # Dictionary to store additional information for each item
-        self.additional_info_dict = {}
-        # Dictionary to store the information for each item
-        self.request_info = {}
+        # Secondary indexes for the filters, and the window of matching requests that is shown
+        self.indexes = {column: {} for column in FILTER_COLUMNS}
+        self.index_heaps = {column: [] for column in FILTER_COLUMNS}
+        # No filter is selected at first, so every request is visible
+        self.visible_ids: list[int] | range = range(0, 0)
+        self.rendered_ids: tuple[int, ...] = ()
+        self.top = 0
+        self.visible_rows = 1
+
+        # Summaries are kept in memory, headers and bodies are only read back when a request is opened
+        self.store = store if store is not None else RequestStore()
+        self.first_id = 0
 
     def on_method_or_ip_select(self, _):
         # Combined filtering logic for method, source IP, and destination IP
-        selected_method = self.method_var.get()
-        selected_source_ip = self.source_ip_var.get()
-        selected_destination_ip = self.destination_ip_var.get()
-
-        # Delete all requests from the list
-        for index in self.tree.get_children():
-            self.tree.delete(index)
-
-        # Add back requests conforming to the search criteria
-        for req_index in range(0, self.index):
-            req_info = self.request_info[req_index]
-            if (selected_method in ['', 'None', req_info[3]] and
-                    selected_source_ip in ['', 'None', req_info[1]] and
-                    selected_destination_ip in ['', 'None', req_info[2]]):
-                self.add_request_to_tree(req_index)
+        filters = self.selected_filters()
+        if not filters:
+            self.visible_ids = range(self.store.first_id, self.store.next_id)
+        else:
+            # Start from the fewest candidates, only they are checked against the other filters
+            candidates = min((self.indexes[column].get(value, []) for column, value in filters), key=len)
+            self.visible_ids = [req_index for req_index in candidates if self.matches(req_index, filters)]
+
+        # Show the most recent requests
+        self.top = max(0, len(self.visible_ids) - self.visible_rows)
+        self.render_rows()
+
+    def selected_filters(self) -> list[tuple[str, str]]:
+        selected = {"method": self.method_var.get(), "source": self.source_ip_var.get(),
+                    "destination": self.destination_ip_var.get()}
+        return [(column, value) for column, value in selected.items() if value not in ('', 'None')]
+
+    def matches(self, index: int, filters: list[tuple[str, str]]) -> bool:
+        req_info = self.store.summary(index)
+        return all(req_info[FILTER_COLUMNS[column]] == value for column, value in filters)
+
+    def prune_retired(self):
+        self.first_id = self.store.first_id
+        # Only the values holding retired ids are visited, found at the top of the heaps by their oldest id
+        for column, column_index in self.indexes.items():
+            heap = self.index_heaps[column]
+            while heap and heap[0][0] < self.first_id:
+                _, value = heappop(heap)
+                ids = column_index[value]
+                del ids[:bisect_left(ids, self.first_id)]
+                if ids:
+                    heappush(heap, (ids[0], value))
+                else:
+                    del column_index[value]
+        retired = bisect_left(self.visible_ids, self.first_id)
+        if isinstance(self.visible_ids, range):
+            self.visible_ids = self.visible_ids[retired:]
+        else:
+            del self.visible_ids[:retired]
+        self.top = max(0, self.top - retired)
 
     def display_dialog_box(self, message: str):
         info_window = tk.Toplevel(self.app)
-        info_window.title("HTTP Headers and Body")
+        info_window.title("Details")
         info_window.geometry("800x600")
 
         info_text = tk.Text(info_window, wrap="word")
@@ -143,7 +237,10 @@ class Gui:
             item_values = self.tree.item(selected_item[0], "values")
             item_no = int(item_values[0])
 
-            body, headers = self.additional_info_dict[item_no]
+            if item_no not in self.store:
+                self.display_dialog_box("This request is no longer kept.")
+                return
+            body, headers = self.store.details(item_no)
 
             try:
                 body_string: str = body.decode("utf-8") if len(body) > 0 else ''
@@ -172,50 +269,138 @@ class Gui:
         self.tree.column("#5", width=150)
         self.tree.column("#6", width=200)
 
-        # Create a vertical scrollbar
-        scrollbar = ttk.Scrollbar(self.tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-
-        # Pack the Treeview and scrollbar
+        # Pack the Treeview and scrollbar, which scrolls through the requests rather than the Treeview rows
         self.tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.tree.bind("<Configure>", self.on_resize)
+        self.tree.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.tree.bind("<Button-4>", self.on_mouse_wheel)
+        self.tree.bind("<Button-5>", self.on_mouse_wheel)
 
         # Bind a double click event to the Treeview to show additional info
         self.tree.bind("<Double-1>", lambda event: self.show_additional_info())
 
-        # Start the GUI main loop
-        self.app.mainloop()
+        # Start draining the requests queued by the sniffer threads, then the GUI main loop
+        self.app.after(1000 // FRAME_RATE, self.drain_requests)
+        try:
+            self.app.mainloop()
+        finally:
+            self.store.close()
 
     def add_request(self, time: float, source: str, destination: str, request_type: str, info: str, body: str,
                     headers: list[tuple[str, str]]) -> None:
-        # Lock is needed since this could be called by the IPv4 & IPv6 threads at the same time
-        with self.lock:
-            self.request_info[self.index] = (time, source, destination, request_type, info)
-            self.additional_info_dict[self.index] = (body, headers)
-            self.add_request_to_tree(self.index)
-            self.index += 1
-            self.update_ip_dropdowns(source, destination)
-
-    def update_ip_dropdowns(self, source: str, destination: str):
+        # Called by the sniffer threads, the widgets are only touched by the main loop
+        try:
+            self.pending_requests.put_nowait((time, source, destination, request_type, info, body, headers))
+        except queue.Full:
+            self.dropped += 1
+
+    def drain_requests(self) -> None:
+        try:
+            self.drain_pending_requests()
+        finally:
+            # Rescheduled even when a request fails to be stored, the updates must not stop for good
+            self.app.after(1000 // FRAME_RATE, self.drain_requests)
+
+    def drain_pending_requests(self) -> None:
+        # Keep following the new requests, unless the view was scrolled up
+        following = self.top + self.visible_rows >= len(self.visible_ids)
+        visible_count = len(self.visible_ids)
+        new_sources, new_destinations = set(), set()
+        filters = self.selected_filters()
+        for _ in range(MAX_BATCH_SIZE):
+            try:
+                time, source, destination, request_type, info, body, headers = self.pending_requests.get_nowait()
+            except queue.Empty:
+                break
+            request_id = self.store.append(time, source, destination, request_type, info, body, headers)
+            self.add_request_to_tree(request_id, filters)
+            if source not in self.source_ips:
+                new_sources.add(source)
+            if destination not in self.destination_ips:
+                new_destinations.add(destination)
+
+        if self.store.first_id != self.first_id:
+            self.prune_retired()
+            visible_count = -1
+        if len(self.visible_ids) != visible_count:
+            if following:
+                self.top = len(self.visible_ids) - self.visible_rows
+            self.render_rows()
+        if new_sources or new_destinations:
+            self.update_ip_dropdowns(new_sources, new_destinations)
+        if self.dropped:
+            self.status_label.config(text=f"Dropped: {self.dropped}")
+
+    def update_ip_dropdowns(self, sources: set, destinations: set):
         # Update source IP dropdown
-        if source not in self.source_ip_dropdown['values']:
-            self.source_ip_dropdown['values'] = (*self.source_ip_dropdown['values'], source)
+        if sources:
+            self.source_ips |= sources
+            self.source_ip_dropdown['values'] = (*self.source_ip_dropdown['values'], *sorted(sources))
 
         # Update destination IP dropdown
-        if destination not in self.destination_ip_dropdown['values']:
-            self.destination_ip_dropdown['values'] = (*self.destination_ip_dropdown['values'], destination)
-
-    def add_request_to_tree(self, index: int):
-        selected_method = self.method_var.get()
-        selected_source_ip = self.source_ip_var.get()
-        selected_destination_ip = self.destination_ip_var.get()
-
-        req_info = self.request_info[index]
-        # Add request to tree only if it conforms with the current search criteria
-        if (selected_method in ['', 'None', req_info[3]] and
-                selected_source_ip in ['', 'None', req_info[1]] and
-                selected_destination_ip in ['', 'None', req_info[2]]):
-            self.tree.insert("", "end",
-                             values=(
-                                 index, f"{req_info[0]:.3f}", req_info[1], req_info[2],
-                                 req_info[3], req_info[4]))
+        if destinations:
+            self.destination_ips |= destinations
+            self.destination_ip_dropdown['values'] = (*self.destination_ip_dropdown['values'], *sorted(destinations))
+
+    def add_request_to_tree(self, index: int, filters: list[tuple[str, str]]):
+        req_info = self.store.summary(index)
+        for column, position in FILTER_COLUMNS.items():
+            ids = self.indexes[column].get(req_info[position])
+            if ids is None:
+                self.indexes[column][req_info[position]] = [index]
+                heappush(self.index_heaps[column], (index, req_info[position]))
+            else:
+                ids.append(index)
+
+        # Add request to the visible ones only if it conforms with the current search criteria
+        if isinstance(self.visible_ids, range):
+            # Unfiltered, the ids stay a range however many requests arrive
+            self.visible_ids = range(self.visible_ids.start, index + 1)
+        elif self.matches(index, filters):
+            self.visible_ids.append(index)
+
+    def on_scroll(self, *args):
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * len(self.visible_ids))
+        elif args[0] == "scroll":
+            step = self.visible_rows if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.render_rows()
+
+    def on_mouse_wheel(self, event):
+        if event.num == 4 or event.delta > 0:
+            self.on_scroll("scroll", -3, "units")
+        else:
+            self.on_scroll("scroll", 3, "units")
+
+    def on_resize(self, event):
+        visible_rows = max(1, event.height // ROW_HEIGHT - 1)
+        if visible_rows != self.visible_rows:
+            self.visible_rows = visible_rows
+            self.render_rows()
+
+    def render_rows(self):
+        self.top = max(0, min(self.top, len(self.visible_ids) - self.visible_rows))
+        window = tuple(self.visible_ids[self.top:self.top + self.visible_rows])
+
+        # Only the rows entering or leaving the window are touched, the others keep their selection
+        if window != self.rendered_ids:
+            kept = set(window).intersection(self.rendered_ids)
+            stale = [str(index) for index in self.rendered_ids if index not in kept]
+            if stale:
+                self.tree.delete(*stale)
+            for position, index in enumerate(window):
+                if index not in kept:
+                    req_info = self.store.summary(index)
+                    self.tree.insert("", position, iid=str(index),
+                                     values=(
+                                         index, f"{req_info[0]:.3f}", req_info[1], req_info[2],
+                                         req_info[3], req_info[4]))
+            self.rendered_ids = window
+
+        if self.visible_ids:
+            self.scrollbar.set(self.top / len(self.visible_ids), (self.top + len(window)) / len(self.visible_ids))
+        else:
+            self.scrollbar.set(0, 1)
@@ -0,0 +1,198 @@
+import glob
+import os
+import shutil
+import struct
+import tempfile
+from array import array
+
+DEFAULT_MAX_REQUESTS = 1000000
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+# The front of the columns is only cut off once this many retired requests have piled up
+COMPACT_THRESHOLD = 4096
+
+# Every record of a segment file: headers length, body length, then the headers and the body
+RECORD_HEADER = struct.Struct("=II")
+
+
+class RequestStore:
+    """
+    A class for keeping the captured requests in compact columns, with their headers and bodies on disk.
+
+    Attributes:
+        directory (str): The directory holding the segment files, those of an earlier run are deleted on start.
+        max_requests (int): The number of requests kept, the oldest ones are retired first.
+        max_bytes (int): The size the segment files may take up on disk together.
+        segment_bytes (int): The size at which a new segment file is started.
+        first_id (int): The id of the oldest request still kept.
+        next_id (int): The id the next request will get.
+        base_id (int): The id of the request at position 0 of the columns.
+        values (list): The distinct source, destination and method strings, the columns hold their position.
+        times (array): The time of each request.
+        sources, destinations, methods (array): The position in `values` of each request's fields.
+        infos (list): The info text of each request.
+        statuses (array): The status code of each response, 0 for requests.
+        body_sizes (array): The body size of each request.
+        segments (list): [path, size, last id] of each segment file, oldest first.
+        offsets, lengths, segment_numbers (array): Where the headers and body of each request are on disk.
+
+    Methods:
+        code(value: str): Returns the position of a string in `values`, adding it if needed.
+        append(time, source, destination, request_type, info, body, headers): Stores a request, returns its id.
+        summary(request_id): Returns (time, source, destination, request_type, info) of a request.
+        details(request_id): Reads (body, headers) of a request back from disk.
+        close(): Closes the segment files, and deletes them if the directory was a temporary one.
+
+    Usage:
+        - Append requests as they arrive and keep their ids, ids below `first_id` have been retired.
+
+    Note:
+        Repeated strings (addresses and methods) are stored once, and numbers in typed arrays, so a request costs a
+        few dozen bytes of memory. Headers and bodies are only needed when a request is opened, so they are appended
+        to segment files and read back with a single `pread`. Retention works on whole requests: when there are
+        too many or the segments take too much room, the oldest requests are retired and the segment files with
+        only retired requests are deleted.
+    """
+
+    def __init__(self, directory: str | None = None, max_requests: int = DEFAULT_MAX_REQUESTS,
+                 max_bytes: int = DEFAULT_MAX_BYTES, segment_bytes: int = DEFAULT_SEGMENT_BYTES):
+        self.is_temporary = directory is None
+        self.directory = tempfile.mkdtemp(prefix="sniffer-") if directory is None else directory
+        os.makedirs(self.directory, exist_ok=True)
+        # Segments left by an earlier run have no index, they would only take up the disk budget
+        for path in glob.glob(os.path.join(self.directory, "requests-*.seg")):
+            os.remove(path)
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        # A few segments fit in the budget, so retiring one never frees more than a fraction of it
+        self.segment_bytes = min(segment_bytes, max(max_bytes // 4, 1))
+
+        self.first_id = 0
+        self.next_id = 0
+        self.base_id = 0
+
+        self.values: list[str] = []
+        self.value_codes: dict[str, int] = {}
+        self.times = array("d")
+        self.sources = array("I")
+        self.destinations = array("I")
+        self.methods = array("I")
+        self.infos: list[str] = []
+        self.statuses = array("I")
+        self.body_sizes = array("Q")
+
+        self.segments: list[list] = []
+        self.segment_count = 0
+        self.file = None
+        self.offsets = array("Q")
+        self.lengths = array("I")
+        self.segment_numbers = array("I")
+
+    def __len__(self) -> int:
+        return self.next_id - self.first_id
+
+    def __contains__(self, request_id: int) -> bool:
+        return self.first_id <= request_id < self.next_id
+
+    def code(self, value: str) -> int:
+        code = self.value_codes.get(value)
+        if code is None:
+            code = self.value_codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def append(self, time: float, source: str, destination: str, request_type: str, info: str, body: bytes,
+               headers: list[tuple[str, str]]) -> int:
+        request_id = self.next_id
+        self.next_id += 1
+
+        self.times.append(time)
+        self.sources.append(self.code(source))
+        self.destinations.append(self.code(destination))
+        self.methods.append(self.code(request_type))
+        self.infos.append(info)
+        status = info.split(" ", 1)[0]
+        # Status codes are 3 digits, anything longer is malformed and kept as 0 rather than overflowing the column
+        is_status = request_type == "HTTP Response" and status.isdigit() and len(status) <= 3
+        self.statuses.append(int(status) if is_status else 0)
+        self.body_sizes.append(len(body))
+
+        encoded_headers = "\r\n".join(f"{name}: {value}" for name, value in headers).encode("utf-8")
+        self.write_record(request_id, encoded_headers, body)
+
+        self.retire()
+        return request_id
+
+    def write_record(self, request_id: int, encoded_headers: bytes, body: bytes) -> None:
+        if self.file is None or self.segments[-1][1] >= self.segment_bytes:
+            self.start_segment()
+        segment = self.segments[-1]
+        self.offsets.append(self.file.tell())
+        self.lengths.append(RECORD_HEADER.size + len(encoded_headers) + len(body))
+        self.segment_numbers.append(self.segment_count - 1)
+        self.file.write(RECORD_HEADER.pack(len(encoded_headers), len(body)))
+        self.file.write(encoded_headers)
+        self.file.write(body)
+        segment[1] += self.lengths[-1]
+        segment[2] = request_id
+
+    def start_segment(self) -> None:
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.directory, f"requests-{self.segment_count:06d}.seg")
+        self.file = open(path, "w+b")
+        self.segments.append([path, 0, self.next_id - 1])
+        self.segment_count += 1
+
+    def retire(self) -> None:
+        first_id = max(self.first_id, self.next_id - self.max_requests)
+        # Whole segments are dropped, oldest first, until the rest fits on disk
+        while len(self.segments) > 1 and sum(segment[1] for segment in self.segments) > self.max_bytes:
+            first_id = max(first_id, self.segments[0][2] + 1)
+            self.delete_segment()
+        while len(self.segments) > 1 and self.segments[0][2] < first_id:
+            self.delete_segment()
+        self.first_id = first_id
+
+        if self.first_id - self.base_id >= max(COMPACT_THRESHOLD, (self.next_id - self.base_id) // 2):
+            retired = self.first_id - self.base_id
+            for column in (self.times, self.sources, self.destinations, self.methods, self.infos, self.statuses,
+                           self.body_sizes, self.offsets, self.lengths, self.segment_numbers):
+                del column[:retired]
+            self.base_id = self.first_id
+
+    def delete_segment(self) -> None:
+        path = self.segments.pop(0)[0]
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"Error deleting request segment: {e}")
+
+    def summary(self, request_id: int) -> tuple[float, str, str, str, str]:
+        position = request_id - self.base_id
+        return (self.times[position], self.values[self.sources[position]], self.values[self.destinations[position]],
+                self.values[self.methods[position]], self.infos[position])
+
+    def details(self, request_id: int) -> tuple[bytes, list[tuple[str, str]]]:
+        position = request_id - self.base_id
+        segment_number = self.segment_numbers[position]
+        self.file.flush()
+        if segment_number == self.segment_count - 1:
+            record = os.pread(self.file.fileno(), self.lengths[position], self.offsets[position])
+        else:
+            path = os.path.join(self.directory, f"requests-{segment_number:06d}.seg")
+            with open(path, "rb") as file:
+                record = os.pread(file.fileno(), self.lengths[position], self.offsets[position])
+
+        headers_length, body_length = RECORD_HEADER.unpack_from(record)
+        encoded_headers = record[RECORD_HEADER.size:RECORD_HEADER.size + headers_length].decode("utf-8", "replace")
+        body = record[RECORD_HEADER.size + headers_length:RECORD_HEADER.size + headers_length + body_length]
+        headers = [line.partition(": ")[::2] for line in encoded_headers.split("\r\n") if line]
+        return body, headers
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.is_temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
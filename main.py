@@ -1,8 +1,21 @@
-from sniffer.sniffer import Sniffer
-from gui.gui import Gui
+import argparse
+import contextlib
+import os
+import signal
+import sys
 import threading
 
+from sniffer.batch_receiver import DEFAULT_SLOT_SIZE
+from sniffer.jsonl_writer import FIELDS, DEFAULT_FIELDS
+from sniffer.ring_buffer import DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_COUNT, DEFAULT_RETIRE_TIMEOUT_MS, ring_layout_error
+from sniffer.stage_queue import OVERLOAD_POLICIES, BLOCK, DEFAULT_QUEUE_SIZE
+
+# The capture and GUI modules are imported where they are needed, so that the headless mode starts quickly
+# and never loads tkinter
+
 stop_event = threading.Event()
+# Set in --profile mode, times every stage of the packet path
+profiler = None
 
 
 def stop_action():
@@ -11,17 +24,238 @@ def stop_action():
     exit(0)
 
 
-def main():
-    gui = Gui(stop_action)
-    ipv4_sniffer = Sniffer(is_ipv6=False)
-    ipv6_sniffer = Sniffer(is_ipv6=True)
-    ipv4_sniffer_thread = threading.Thread(target=ipv4_sniffer.sniff_packets, args=(stop_event, gui.add_request))
-    ipv4_sniffer_thread.start()
-    ipv6_sniffer_thread = threading.Thread(target=ipv6_sniffer.sniff_packets, args=(stop_event, gui.add_request))
-    ipv6_sniffer_thread.start()
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="HTTP sniffer")
+    parser.add_argument("--filter", default="", metavar="EXPRESSION",
+                        help='only capture matching traffic, e.g. "port 80 or port 8080"')
+    parser.add_argument("--workers", type=int, default=0,
+                        help="capture with this many processes, each owning a share of the TCP flows")
+    parser.add_argument("--queue-size", type=int, default=0,
+                        help=f"queue this many frames, and messages, between capture, parse and output threads, "
+                             f"e.g. {DEFAULT_QUEUE_SIZE} (default: 0, everything on one thread). The queues absorb "
+                             f"bursts and a slow output, but every frame is copied out of the ring or receive "
+                             f"buffer: replaying the benchmark traffic is 2-15%% slower than on one thread")
+    parser.add_argument("--overload", choices=OVERLOAD_POLICIES, default=BLOCK,
+                        help="what a full queue does with new items: wait for room, or drop the newest or oldest")
+    parser.add_argument("--read", metavar="FILE", help="replay a pcap or pcapng file instead of a live capture")
+    parser.add_argument("--replay-speed", type=float, default=0.0,
+                        help="pace the replay, 1.0 for the original speed (default: as fast as possible)")
+    parser.add_argument("--write", metavar="DIR", help="record the captured frames to rotating pcap files in DIR")
+    parser.add_argument("--write-http-only", action="store_true", help="only record the frames of HTTP flows")
+    parser.add_argument("--rotate-mb", type=int, default=100, help="rotate the pcap files at this size")
+    parser.add_argument("--rotate-seconds", type=float, default=0, help="rotate the pcap files after this long")
+    parser.add_argument("--max-disk-mb", type=int, default=1024,
+                        help="delete the oldest pcap files to stay below this total size")
+    parser.add_argument("--max-body-kb", type=int, default=1024,
+                        help="keep at most this much of each HTTP body, the rest is counted and dropped")
+    parser.add_argument("--flow-timeout", type=float, default=120.0,
+                        help="forget a TCP flow after this many seconds without a packet")
+    parser.add_argument("--flow-memory-mb", type=int, default=256,
+                        help="evict the largest TCP flows when all of them together buffer more than this")
+    parser.add_argument("--http-port", type=int, action="append", default=[],
+                        help="a port carrying HTTP, its connections are never written off from a single segment")
+    parser.add_argument("--not-http-port", type=int, action="append", default=[],
+                        help="a port never carrying HTTP, its packets are dropped without looking at them")
+    parser.add_argument("--store-dir", metavar="DIR",
+                        help="keep the captured headers and bodies in DIR (default: a temporary directory)")
+    parser.add_argument("--max-requests", type=int, default=1000000, help="forget the oldest requests past this many")
+    parser.add_argument("--max-store-mb", type=int, default=1024,
+                        help="forget the oldest requests when their headers and bodies take more than this on disk")
+
+    capture = parser.add_argument_group("live capture")
+    capture.add_argument("--ring", action="store_true",
+                         help="read the frames from a TPACKET_V3 ring shared with the kernel, without a syscall each")
+    capture.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                         help="size of a ring block in bytes, a multiple of the page size")
+    capture.add_argument("--block-count", type=int, default=DEFAULT_BLOCK_COUNT, help="number of blocks in the ring")
+    capture.add_argument("--retire-timeout-ms", type=int, default=DEFAULT_RETIRE_TIMEOUT_MS,
+                         help="hand over a partly filled ring block after this long")
+    capture.add_argument("--batch-size", type=int, default=0,
+                         help="receive up to this many frames per recvmmsg call into reused buffers, 0 for one "
+                              "frame per call (ignored with --ring)")
+    capture.add_argument("--slot-size", type=int, default=DEFAULT_SLOT_SIZE,
+                         help="size of each batch receive buffer in bytes, longer frames are truncated")
+
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="serve Prometheus metrics on this port, at /metrics (default: off)")
+    parser.add_argument("--metrics-host", default="127.0.0.1", help="the address the metrics are served on")
+
+    profiling = parser.add_argument_group("profiling")
+    profiling.add_argument("--profile", action="store_true",
+                           help="time every stage of the packet path and print where the time went on exit")
+    profiling.add_argument("--profile-seconds", type=float, default=0.0,
+                           help="also run cProfile for this many seconds from the first frame (implies --profile)")
+    profiling.add_argument("--profile-output", metavar="FILE", help="dump the cProfile statistics to FILE")
+
+    headless = parser.add_argument_group("headless mode")
+    headless.add_argument("--headless", action="store_true",
+                          help="write every HTTP message as a JSON line instead of showing the GUI")
+    headless.add_argument("--output", metavar="FILE", help="append the JSON lines to FILE (default: stdout)")
+    headless.add_argument("--fields", default=",".join(DEFAULT_FIELDS),
+                          help=f"comma separated fields to write, out of: {', '.join(FIELDS)}")
+    headless.add_argument("--method", action="append", help="only write requests with this method, may be repeated")
+    headless.add_argument("--source", action="append", help="only write messages from this address, may be repeated")
+    headless.add_argument("--destination", action="append",
+                          help="only write messages to this address, may be repeated")
+    headless.add_argument("--flush-interval", type=float, default=1.0, help="flush the output this often, in seconds")
+    headless.add_argument("--stats-interval", type=float, default=10.0,
+                          help="print a stats line to stderr this often, in seconds, 0 for never")
+
+    args = parser.parse_args()
+    if args.write and args.workers > 1:
+        parser.error("--write cannot be combined with --workers")
+    if args.read and args.workers > 1:
+        parser.error("--read cannot be combined with --workers")
+    if args.ring and (error := ring_layout_error(args.block_size, args.block_count)) is not None:
+        parser.error(error)
+    if args.batch_size < 0 or args.slot_size <= 0:
+        parser.error("--batch-size cannot be negative and --slot-size must be positive")
+    args.profile = args.profile or args.profile_seconds > 0
+    args.fields = tuple(field.strip() for field in args.fields.split(",") if field.strip())
+    unknown = [field for field in args.fields if field not in FIELDS]
+    if unknown:
+        parser.error(f"unknown fields: {', '.join(unknown)}")
+    return args
+
+
+def create_sniffer(args: argparse.Namespace, pcap_writer):
+    from sniffer.sniffer import Sniffer
+    from sniffer.pipeline import Pipeline
+    from sniffer.protocol_classifier import DEFAULT_HTTP_PORTS, HTTP, NOT_HTTP
+
+    port_hints = dict.fromkeys(DEFAULT_HTTP_PORTS + tuple(args.http_port), HTTP)
+    port_hints.update(dict.fromkeys(args.not_http_port, NOT_HTTP))
+    flow_options = {"max_body_size": args.max_body_kb * 1024, "idle_timeout": args.flow_timeout,
+                    "max_buffered_bytes": args.flow_memory_mb * 1024 * 1024, "port_hints": port_hints}
+    capture_options = {"filter_expression": args.filter, "use_ring": args.ring, "block_size": args.block_size,
+                       "block_count": args.block_count, "retire_timeout_ms": args.retire_timeout_ms,
+                       "batch_size": args.batch_size, "slot_size": args.slot_size}
+    # A single sniffer captures both IPv4 and IPv6 in one loop, or worker processes share the flows
+    if args.read:
+        sniffer = Sniffer(pcap_file=args.read, replay_speed=args.replay_speed, pcap_writer=pcap_writer,
+                          record_http_only=args.write_http_only, **flow_options)
+    elif args.workers > 1:
+        from sniffer.fanout import FanoutCapture
+        return FanoutCapture(args.workers, **capture_options, **flow_options)
+    else:
+        sniffer = Sniffer(pcap_writer=pcap_writer, record_http_only=args.write_http_only, **capture_options,
+                          **flow_options)
+    # The capture, the parsers and the callback each get a thread, so a slow callback does not stall the socket
+    return Pipeline(sniffer, args.queue_size, args.overload) if args.queue_size > 0 else sniffer
+
+
+def output_callback(on_packet_received):
+    # The callback is the last stage of the packet path, it is timed with the others
+    return profiler.wrap_callback(on_packet_received) if profiler is not None else on_packet_received
+
 
+def run_gui(args: argparse.Namespace, sniffer) -> None:
+    from gui.gui import Gui
+    from gui.request_store import RequestStore
+
+    # The latency histograms live in the worker processes when capturing with several workers
+    latency_report = getattr(sniffer, "latency_report", None)
+    store = RequestStore(args.store_dir, max_requests=args.max_requests, max_bytes=args.max_store_mb * 1024 * 1024)
+    gui = Gui(stop_action, latency_report, store)
+    sniffer_thread = threading.Thread(target=sniffer.sniff_packets, args=(stop_event, output_callback(gui.add_request)))
+    sniffer_thread.start()
     gui.start_gui()
 
 
+def print_stats(metrics, interval: float) -> None:
+    previous_packets = 0
+    while not stop_event.wait(interval):
+        values = metrics.collect()
+        packets = sum(values["sniffer_packets_total"].values())
+        messages = sum(values["sniffer_http_messages_total"].values())
+        queue_drops = sum(values.get("sniffer_queue_dropped_total", {}).values())
+        print(f"Stats: {packets} frames ({(packets - previous_packets) / interval:.0f}/s), "
+              f"kernel drops {values['sniffer_kernel_drops_total']}, queue drops {queue_drops}, "
+              f"flows {values['sniffer_flows_active']}, "
+              f"buffered {values['sniffer_flow_buffered_bytes'] / 1e6:.1f} MB "
+              f"({values['sniffer_out_of_order_bytes'] / 1e6:.1f} MB out of order), messages {messages}, "
+              f"parse errors {values['sniffer_http_parse_errors_total']}, "
+              f"p99 frame {values['sniffer_packet_processing_seconds'].percentile(99) * 1e6:.0f} us",
+              file=sys.stderr)
+        previous_packets = packets
+
+
+def run_headless(args: argparse.Namespace, sniffer) -> None:
+    from sniffer.jsonl_writer import JsonlWriter, open_output
+
+    output = open_output(args.output)
+    if output is None:
+        print("Could not open output file, aborting...", file=sys.stderr)
+        exit(0)
+    writer = JsonlWriter(output, args.fields, set(args.method) if args.method else None,
+                         set(args.source) if args.source else None,
+                         set(args.destination) if args.destination else None, args.flush_interval)
+
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    # The metrics live in the worker processes when capturing with several workers
+    metrics = getattr(sniffer, "metrics", None)
+    if metrics is not None and args.stats_interval > 0:
+        threading.Thread(target=print_stats, args=(metrics, args.stats_interval), daemon=True).start()
+    try:
+        # Status messages go to stderr, stdout may be carrying the JSON lines
+        with contextlib.redirect_stdout(sys.stderr):
+            sniffer.sniff_packets(stop_event, output_callback(writer.write))
+    except BrokenPipeError:
+        # Whatever read the output is gone, e.g. `| head`, what is still buffered goes nowhere
+        os.dup2(os.open(os.devnull, os.O_WRONLY), output.fileno())
+    finally:
+        writer.close()
+        if output is not sys.stdout:
+            output.close()
+
+
+def main():
+    global profiler
+    args = parse_args()
+
+    pcap_writer = None
+    if args.write:
+        from sniffer.pcap_writer import PcapWriter
+        pcap_writer = PcapWriter(args.write, max_file_bytes=args.rotate_mb * 1024 * 1024,
+                                 max_file_seconds=args.rotate_seconds,
+                                 max_total_bytes=args.max_disk_mb * 1024 * 1024)
+
+    metrics_server = None
+    try:
+        # In headless mode stdout may be carrying the JSON lines, status messages go to stderr
+        setup_output = contextlib.redirect_stdout(sys.stderr) if args.headless else contextlib.nullcontext()
+        with setup_output:
+            sniffer = create_sniffer(args, pcap_writer)
+            if args.metrics_port:
+                if getattr(sniffer, "metrics", None) is None:
+                    print("Metrics are not available with --workers")
+                else:
+                    from sniffer.metrics_server import start_metrics_server
+                    metrics_server = start_metrics_server(sniffer.metrics, args.metrics_port, args.metrics_host)
+            if args.profile:
+                if args.workers > 1:
+                    print("Profiling is not available with --workers")
+                else:
+                    from sniffer.stage_profiler import StageProfiler
+                    profiler = StageProfiler(args.profile_seconds, args.profile_output)
+                    # A pipeline does its parsing with the sniffer it wraps
+                    profiler.install(getattr(sniffer, "sniffer", sniffer))
+
+        if args.headless:
+            run_headless(args, sniffer)
+        else:
+            run_gui(args, sniffer)
+    finally:
+        if profiler is not None:
+            profiler.uninstall()
+            print(profiler.report(), file=sys.stderr)
+        if metrics_server is not None:
+            metrics_server.close()
+        if pcap_writer is not None:
+            pcap_writer.close()
+            if pcap_writer.dropped:
+                print(f"Capture recording dropped {pcap_writer.dropped} frames", file=sys.stderr)
+
+
 if __name__ == "__main__":
     main()
@@ -1,4 +1,12 @@
 import struct
+from functools import lru_cache
+
+ETHERNET_TYPE = struct.Struct("!H")
+
+
+@lru_cache(maxsize=4096)
+def format_mac(address: bytes) -> str:
+    return ":".join(f"{byte:02x}" for byte in address)
 
 
 class EthernetHeader:
@@ -9,14 +17,15 @@ class EthernetHeader:
         destination_mac (str): The destination MAC address in human-readable format.
         source_mac (str): The source MAC address in human-readable format.
         ethernet_type (int): The Ethernet type (EtherType) field indicating the protocol encapsulated in the payload.
-        payload (bytes): The raw payload data following the Ethernet header.
+        payload_offset (int): The offset of the payload data following the Ethernet header.
+        payload (memoryview | bytes): The payload data, a view without copying if `raw_data` is a memoryview.
 
     Methods:
         display(): Prints the parsed Ethernet header information.
 
     Usage:
-        - Initialize with raw byte data representing an Ethernet frame.
-        - Parses the Ethernet header and extracts relevant fields.
+        - Initialize with raw byte data representing an Ethernet frame, preferably a memoryview.
+        - Parses the Ethernet header and extracts relevant fields, MAC addresses are only formatted on access.
         - Provides a method to display the parsed information in a human-readable format.
 
     Note:
@@ -26,11 +35,25 @@ class EthernetHeader:
         destination MAC           Source MAC          Ethernet type           Data
     """
 
-    def __init__(self, raw_data: bytes):
-        self.destination_mac, self.source_mac, self.ethernet_type = struct.unpack("! 6s 6s H", raw_data[:14])
-        self.destination_mac: str = ":".join(f"{byte:02x}" for byte in self.destination_mac)
-        self.source_mac: str = ":".join(f"{byte:02x}" for byte in self.source_mac)
-        self.payload = raw_data[14:]
+    __slots__ = ("raw_data", "offset", "ethernet_type", "payload_offset")
+
+    def __init__(self, raw_data: memoryview | bytes, offset: int = 0):
+        self.raw_data = raw_data
+        self.offset: int = offset
+        self.ethernet_type: int = ETHERNET_TYPE.unpack_from(raw_data, offset + 12)[0]
+        self.payload_offset: int = offset + 14
+
+    @property
+    def destination_mac(self) -> str:
+        return format_mac(bytes(self.raw_data[self.offset:self.offset + 6]))
+
+    @property
+    def source_mac(self) -> str:
+        return format_mac(bytes(self.raw_data[self.offset + 6:self.offset + 12]))
+
+    @property
+    def payload(self) -> memoryview | bytes:
+        return self.raw_data[self.payload_offset:]
 
     def display(self) -> None:
         print(f"Ethernet header:")
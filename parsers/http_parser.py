@@ -1,3 +1,5 @@
+from collections import deque
+
 from .split_buffer import SplitBuffer
 from parsers.info_http import InfoHTTP
 
@@ -18,85 +20,347 @@ from parsers.info_http import InfoHTTP
 
 HTTP_METHODS = [b'GET', b'POST', b'PUT', b'DELETE', b'HEAD', b'OPTIONS', b'PATCH', b'TRACE', b'CONNECT']
 
+# Verdicts on the first bytes of a stream: it starts an HTTP message, it does not, or more bytes are needed
+HTTP, NOT_HTTP, UNDECIDED = range(3)
+
+# The tokens a message starts with, by their first byte, so most streams are rejected by a single lookup
+START_TOKENS: dict[int, tuple[bytes, ...]] = {}
+for token in [method + b" " for method in HTTP_METHODS] + [b"HTTP/"]:
+    START_TOKENS[token[0]] = START_TOKENS.get(token[0], ()) + (token,)
+MAX_START_TOKEN_LENGTH = max(len(token) for tokens in START_TOKENS.values() for token in tokens)
+
+# Bytes of body kept per message, the rest is counted and dropped
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+# A start line or header block still unfinished past this many bytes is not HTTP
+MAX_HEADER_BLOCK_SIZE = 256 * 1024
+# Methods of the requests waiting for a response kept per parser, like the requests kept by the latency tracker
+MAX_REQUEST_METHODS = 64
+
+# Header names most messages carry: every message shares the same name objects instead of holding copies,
+# and their lower-case form is looked up instead of computed
+COMMON_HEADER_NAMES = [b"Host", b"User-Agent", b"Accept", b"Accept-Encoding", b"Accept-Language", b"Connection",
+                       b"Content-Length", b"Content-Type", b"Content-Encoding", b"Transfer-Encoding", b"Cache-Control",
+                       b"Cookie", b"Set-Cookie", b"Date", b"Server", b"Authorization", b"Referer", b"Origin",
+                       b"Location", b"ETag", b"Last-Modified", b"If-None-Match", b"If-Modified-Since", b"Vary",
+                       b"Keep-Alive", b"Upgrade", b"Expires", b"Pragma", b"X-Forwarded-For", b"X-Requested-With"]
+# (interned name, lower-case name) by the name as received, in its usual spelling or in lower case
+INTERNED_HEADER_NAMES = {spelling: (spelling, name.lower())
+                         for name in COMMON_HEADER_NAMES for spelling in (name, name.lower())}
+
+# Chunked transfer coding:
+# size in hex [; extensions]\r\n   data\r\n   ...   0\r\n   [trailer headers]\r\n
+CHUNK_SIZE, CHUNK_DATA, CHUNK_DATA_END, CHUNK_TRAILER = range(4)
+
 
 class HttpParser:
     """
     A parser for HTTP request and response messages.
 
     Attributes:
-        info_http (InfoHTTP): An object to handle parsed information.
+        info_http (InfoHTTP): An object to handle parsed information of the message in progress.
         buffer (SplitBuffer): Buffer to manage the incoming byte stream.
         done_parsing_start (bool): Indicates if the start line of HTTP message is parsed.
         done_parsing_headers (bool): Indicates if the headers of the HTTP message are parsed.
-        is_message_complete (bool): Indicates if the entire HTTP message is parsed.
-        expected_body_length (int): The expected length of the body content in bytes.
+        is_message_complete (bool): Indicates if the last HTTP message is parsed and no other one is in progress.
+        expected_body_length (int | None): The expected length of the body content in bytes (of the current chunk
+            for a chunked body), None if the body lasts until the connection is closed.
+        chunked (bool): Indicates if the body uses the chunked transfer coding.
+        chunk_state (int): Which part of a chunked body is expected next.
+        max_body_size (int): The number of body bytes kept per message, the rest is only counted.
+        completed_messages (list): The messages completed since the list was last emptied.
+        error (bool): Indicates that the stream could not be parsed, nothing more is parsed once set.
+        timestamp (float): The capture time of the data being parsed, messages are stamped with it.
+        header_scan_offset (int): How far the buffer was already searched for the end of the header block.
+        request_methods (deque): The methods of the requests sent the other way that the parsed responses answer,
+            oldest first, filled by the caller. Responses to HEAD, and 2xx responses to CONNECT, have no body.
 
     Methods:
-        feed_data(data: bytes): Feeds incoming data to the buffer and triggers parsing.
+        feed_data(data: bytes, timestamp: float): Feeds incoming data to the buffer and triggers parsing.
+        close(timestamp: float): Completes the message in progress when the connection is closed.
         parse(): Main parsing function, orchestrates the parsing of different parts of the HTTP message.
-        parse_header(): Parses HTTP headers.
+        parse_header_block(): Parses all the headers at once, when the whole header block has arrived.
         parse_line_start(): Parses the start line of an HTTP message.
+        parse_chunked(): Parses a chunked body, chunk by chunk.
+        answers_bodiless_request(): Takes the method of the request a response answers, returns whether it has no body.
+        read_body(size: int): Consumes up to `size` body bytes, keeping them if within `max_body_size`.
+        complete_message(): Records the message in progress and resets the parser for the next one.
 
     Usage:
         - Initialize an instance with an InfoHTTP object.
         - Continuously feed byte data to the parser using `feed_data`.
         - The parser will sequentially parse the HTTP message, updating the InfoHTTP object.
+        - Completed messages are appended to `completed_messages`, the caller empties the list.
+
+    Note:
+        A parser lives as long as its connection: after each message it resets in place and keeps parsing
+        the buffered bytes, so keep-alive connections and pipelined messages are handled by a single parser.
+        Body bytes past `max_body_size` are skipped straight out of the buffer, the message is marked as truncated,
+        so a large download only costs the memory of its first `max_body_size` bytes.
+        The headers are only parsed once the blank line ending them has arrived, in a single pass that splits the
+        block, interns the common names and indexes the values by lower-case name. `parse` is a loop over the
+        parts of the message, so neither many headers nor many pipelined messages grow the stack.
     """
 
-    def __init__(self, info_http: InfoHTTP):
+    def __init__(self, info_http: InfoHTTP, max_body_size: int = DEFAULT_MAX_BODY_SIZE):
         self.info_http: InfoHTTP = info_http
         self.buffer = SplitBuffer()
         self.done_parsing_start: bool = False
         self.done_parsing_headers: bool = False
         self.is_message_complete: bool = False
-        self.expected_body_length: int = 0
+        self.expected_body_length: int | None = None
+        self.chunked: bool = False
+        self.chunk_state: int = CHUNK_SIZE
+        self.max_body_size: int = max_body_size
+        self.completed_messages: list[InfoHTTP] = []
+        self.error: bool = False
+        self.timestamp: float = 0.0
+        self.header_scan_offset: int = 0
+        self.request_methods: deque[str] = deque(maxlen=MAX_REQUEST_METHODS)
 
-    def feed_data(self, data: bytes):
+    def feed_data(self, data: bytes, timestamp: float | None = None):
+        if self.error:
+            return
+        if timestamp is not None:
+            self.timestamp = timestamp
+        if (self.done_parsing_headers and not self.chunked and self.buffer.is_empty()
+                and self.info_http.body_length >= self.max_body_size):
+            # Already past the capture limit, the body bytes are counted and never reach the buffer
+            skipped = len(data) if self.expected_body_length is None else min(len(data), self.expected_body_length)
+            self.info_http.on_body_skipped(skipped)
+            if self.expected_body_length is not None:
+                self.expected_body_length -= skipped
+            data = data[skipped:]
         self.buffer.feed_data(data)
         self.parse()
 
-    def parse(self):
-        if not self.done_parsing_start:
-            self.parse_line_start()
-        elif not self.done_parsing_headers:
-            self.parse_header()
-        elif self.expected_body_length and not self.buffer.is_empty():
-            data = self.buffer.flush()
-            self.expected_body_length -= len(data)
-            self.info_http.on_body(data)
+    def close(self, timestamp: float | None = None):
+        # A body without a length ends with the connection, any other message is cut short
+        if timestamp is not None:
+            self.timestamp = timestamp
+        if self.done_parsing_start:
+            self.complete_message()
             self.parse()
-        elif self.expected_body_length == 0:
-            self.is_message_complete = True
 
-    def parse_header(self):
-        line = self.buffer.pop(separator=b"\r\n")
-        if line is not None:
-            if line:
-                name, value = line.strip().split(b": ", maxsplit=1)
-                if name.lower() == b"content-length":
-                    self.expected_body_length = int(value.decode("utf-8"))
-                self.info_http.on_header(name, value)
+    def parse(self):
+        # Each part returns whether it made progress, parsing stops once one of them needs more bytes
+        while not self.error:
+            if not self.done_parsing_start:
+                if not self.parse_line_start():
+                    return
+            elif not self.done_parsing_headers:
+                if not self.parse_header_block():
+                    return
+            elif self.chunked:
+                if not self.parse_chunked():
+                    return
+            elif self.expected_body_length is None:
+                while not self.buffer.is_empty():
+                    self.read_body(len(self.buffer))
+                return
+            elif self.expected_body_length:
+                if self.buffer.is_empty():
+                    return
+                # Only take this message's bytes, the rest belongs to the next pipelined message
+                self.expected_body_length -= self.read_body(self.expected_body_length)
             else:
-                self.done_parsing_headers = True
-            self.parse()
+                self.complete_message()
 
-    def parse_line_start(self):
-        line = self.buffer.pop(separator=b"\r\n")
-        if line is not None:
-            line_parts = line.strip().split()
-            http_method: bytes = line_parts[0]
-
-            if http_method in HTTP_METHODS:
-                # HTTP REQUEST
-                self.info_http.http_version = line_parts[2]
-                self.info_http.on_request(url=line_parts[1], http_method=http_method)
+    def complete_message(self):
+        self.info_http.end_time = self.timestamp
+        self.completed_messages.append(self.info_http)
+        self.info_http = InfoHTTP()
+        self.done_parsing_start = False
+        self.done_parsing_headers = False
+        self.expected_body_length = None
+        self.chunked = False
+        self.is_message_complete = True
+
+    def parse_header_block(self) -> bool:
+        if self.buffer.startswith(b"\r\n"):
+            # No headers at all, the start line is directly followed by the blank line
+            self.buffer.skip(2)
+            block = b""
+        else:
+            # Searched from where the previous attempt stopped, a header block spread over many segments
+            # is still only scanned once
+            block = self.buffer.pop(separator=b"\r\n\r\n", start=self.header_scan_offset)
+            if block is None:
+                self.header_scan_offset = max(len(self.buffer) - 3, 0)
+                if len(self.buffer) > MAX_HEADER_BLOCK_SIZE:
+                    self.error = True
+                return False
+        self.header_scan_offset = 0
+
+        raw_headers = []
+        header_index: dict[bytes, list[bytes]] = {}
+        lower_name = b""
+        for line in block.split(b"\r\n") if block else ():
+            if line[:1] in (b" ", b"\t") and raw_headers:
+                # A folded line continues the value of the previous header
+                name, value = raw_headers[-1]
+                value += b" " + line.strip()
+                raw_headers[-1] = (name, value)
+                header_index[lower_name][-1] = value
+                continue
+            # The space after the colon is optional, and so is any whitespace around the value
+            name, separator, value = line.partition(b":")
+            if not separator:
+                continue
+            name = name.strip()
+            interned = INTERNED_HEADER_NAMES.get(name)
+            if interned is None:
+                lower_name = name.lower()
             else:
-                # HTTP RESPONSE
-                self.info_http.http_version = line_parts[0]
-                self.info_http.on_response(status_code=line_parts[1], status_message=b' '.join(line_parts[2:]))
+                name, lower_name = interned
+            value = value.strip()
+            raw_headers.append((name, value))
+            values = header_index.get(lower_name)
+            if values is None:
+                header_index[lower_name] = [value]
+            else:
+                values.append(value)
+        self.info_http.on_header_block(raw_headers, header_index)
 
-            self.done_parsing_start = True
-            self.parse()
+        if self.answers_bodiless_request():
+            # Any Content-Length describes the body the request would have had, the next response follows directly
+            self.expected_body_length = 0
+            self.done_parsing_headers = True
+            return True
+
+        transfer_encodings = header_index.get(b"transfer-encoding")
+        content_lengths = header_index.get(b"content-length")
+        if transfer_encodings and transfer_encodings[-1].lower().endswith(b"chunked"):
+            # The chunk sizes take precedence over any Content-Length
+            self.chunked = True
+            self.chunk_state = CHUNK_SIZE
+            self.expected_body_length = 0
+        elif content_lengths:
+            # Repeated lengths must agree, otherwise the end of the message cannot be trusted
+            if any(not length.isdigit() or length != content_lengths[0] for length in content_lengths):
+                self.error = True
+                return False
+            self.expected_body_length = int(content_lengths[0])
+        elif not self.has_body_until_close():
+            self.expected_body_length = 0
+        self.done_parsing_headers = True
+        return True
+
+    def parse_chunked(self) -> bool:
+        # Loops instead of recursing, a body may be made of many small chunks
+        while True:
+            if self.chunk_state == CHUNK_DATA:
+                if self.expected_body_length:
+                    if self.buffer.is_empty():
+                        return False
+                    self.expected_body_length -= self.read_body(self.expected_body_length)
+                    continue
+                self.chunk_state = CHUNK_DATA_END
+                continue
+
+            line = self.buffer.pop(separator=b"\r\n")
+            if line is None:
+                return False
+            if self.chunk_state == CHUNK_SIZE:
+                try:
+                    self.expected_body_length = int(line.split(b";", maxsplit=1)[0].strip(), 16)
+                except ValueError:
+                    self.error = True
+                    return False
+                self.chunk_state = CHUNK_DATA if self.expected_body_length else CHUNK_TRAILER
+            elif self.chunk_state == CHUNK_DATA_END:
+                if line:
+                    self.error = True
+                    return False
+                self.chunk_state = CHUNK_SIZE
+            elif line:
+                # CHUNK_TRAILER, trailer fields are kept with the other headers
+                name, _, value = line.partition(b":")
+                self.info_http.on_header(name.strip(), value.strip())
+            else:
+                self.complete_message()
+                return True
+
+    def read_body(self, size: int) -> int:
+        # Bytes past the capture limit are dropped from the buffer without being copied
+        room = self.max_body_size - self.info_http.body_length
+        if room <= 0:
+            skipped = self.buffer.skip(size)
+            self.info_http.on_body_skipped(skipped)
+            return skipped
+        data = self.buffer.take(min(size, room))
+        self.info_http.on_body(data)
+        return len(data)
+
+    def answers_bodiless_request(self) -> bool:
+        # Each final response answers the oldest request, interim 1xx responses precede the final one
+        status_code = self.info_http.status_code
+        if self.info_http.is_request() or status_code < 200 or not self.request_methods:
+            return False
+        method = self.request_methods.popleft()
+        return method == "HEAD" or (method == "CONNECT" and status_code < 300)
+
+    def has_body_until_close(self) -> bool:
+        # Requests without a length have no body, and neither do 1xx, 204 and 304 responses
+        status_code = self.info_http.status_code
+        return not self.info_http.is_request() and status_code >= 200 and status_code not in (204, 304)
+
+    def parse_line_start(self) -> bool:
+        line = self.buffer.pop(separator=b"\r\n")
+        if line is None:
+            if len(self.buffer) > MAX_HEADER_BLOCK_SIZE:
+                self.error = True
+            return False
+        line_parts = line.strip().split()
+        if not line_parts:
+            # Empty lines between messages are allowed and ignored
+            return True
+
+        http_method: bytes = line_parts[0]
+
+        if http_method in HTTP_METHODS and len(line_parts) == 3:
+            # HTTP REQUEST
+            self.info_http.http_version = line_parts[2]
+            self.info_http.on_request(url=line_parts[1], http_method=http_method)
+        elif http_method.startswith(b"HTTP/") and len(line_parts) >= 2 and line_parts[1].isdigit():
+            # HTTP RESPONSE
+            self.info_http.http_version = line_parts[0]
+            self.info_http.on_response(status_code=line_parts[1], status_message=b' '.join(line_parts[2:]))
+        else:
+            # Not at the start of a message, the rest of the stream cannot be trusted
+            self.error = True
+            return False
+
+        self.info_http.start_time = self.timestamp
+        self.done_parsing_start = True
+        self.is_message_complete = False
+        return True
+
+
+def classify_http_data(data: bytes) -> int:
+    """
+    Classifies the first bytes of a stream.
+
+    Args:
+        data (bytes | memoryview): The first bytes of the stream.
+
+    Returns:
+        int: HTTP if the data starts with a method or an HTTP version, UNDECIDED if it is too short to tell,
+            NOT_HTTP otherwise.
+    """
+    if not data:
+        return UNDECIDED
+    tokens = START_TOKENS.get(data[0])
+    if tokens is None:
+        return NOT_HTTP
+    # Only the first bytes are copied, `data` may be a memoryview over a whole frame
+    prefix = bytes(data[:MAX_START_TOKEN_LENGTH])
+    verdict = NOT_HTTP
+    for token in tokens:
+        if prefix.startswith(token):
+            return HTTP
+        if len(prefix) < len(token) and token.startswith(prefix):
+            verdict = UNDECIDED
+    return verdict
 
 
 def is_http_data(data: bytes) -> bool:
@@ -104,7 +368,7 @@ def is_http_data(data: bytes) -> bool:
     Determines if the given data is the start of an HTTP message.
 
     Args:
-        data (bytes): The data to be checked.
+        data (bytes | memoryview): The data to be checked.
 
     Returns:
         bool: True if the data starts with an HTTP method or an HTTP version, False otherwise.
@@ -112,5 +376,4 @@ def is_http_data(data: bytes) -> bool:
     Usage:
         - Call with a byte stream to check if it's likely to be the start of an HTTP message.
     """
-    return (any(data.startswith(method) for method in HTTP_METHODS)
-            or data.lower().startswith(b'http'))
+    return classify_http_data(data) == HTTP
@@ -7,23 +7,45 @@ class InfoHTTP:
         http_method (str): The HTTP method used in the request.
         status_code (int): The status code from the HTTP response.
         status_message (str): The status message associated with the response status code.
-        headers (list): A list of tuples containing headers and their values.
+        raw_headers (list): A list of (name, value) tuples of the headers, as received.
+        header_index (dict): The values of each header, in order, by lower-case name.
+        headers (list): A list of tuples containing headers and their values, decoded on first access.
         http_version (str): The HTTP version used.
-        body (bytes): The body of the HTTP message.
+        body_chunks (list): The chunks of the body, in the order they were received.
+        body_length (int): The length of the body received so far.
+        skipped_length (int): The length of the body that was past the capture limit and not kept.
+        truncated (bool): Whether part of the body was not kept.
+        body (bytes): The body of the HTTP message, the chunks are joined on first access.
+        start_time (float): The capture time of the packet holding the start line.
+        end_time (float): The capture time of the packet that completed the message.
 
     Methods:
         on_request(url: bytes, http_method: bytes): Processes the request line from an HTTP request.
         on_response(status_code: bytes, status_message: bytes): Processes the status line from an HTTP response.
         on_header(name: bytes, value: bytes): Adds a header to the headers list.
+        on_header_block(raw_headers: list, header_index: dict): Sets all the headers at once, with their index.
+        get_header(name: bytes): Returns the first value of a header, whatever the case of its name, or None.
+        get_headers(name: bytes): Returns every value of a header, whatever the case of its name.
         on_body(body: bytes): Appends the given bytes to the message body.
+        on_body_skipped(length: int): Counts body bytes that were dropped instead of kept.
+        iter_body(): Yields the body chunks without joining them.
         is_request(): Determines if the parsed message is an HTTP request.
         display(): Prints the parsed HTTP message.
 
     Usage:
         - Used by the HttpParser to store and manipulate parsed HTTP request and response data.
         - The parser callbacks update the attributes of this object as it parses an HTTP message.
+
+    Note:
+        Appending to a single bytes object would copy the whole body again for every segment, so the body is
+        kept as a list of chunks instead. The record is slotted to keep in-flight messages small.
+        Headers are looked up through `header_index`, so finding Host or Content-Type does not scan the list.
     """
 
+    __slots__ = ("url", "http_method", "status_code", "status_message", "raw_headers", "header_index",
+                 "decoded_headers", "http_version", "body_chunks", "body_length", "skipped_length",
+                 "start_time", "end_time")
+
     def __init__(self):
         # Request
         self.url: str = ''
@@ -33,25 +55,77 @@ class InfoHTTP:
         self.status_message: str = ''
 
         # Common
-        self.headers = []
+        self.raw_headers: list[tuple[bytes, bytes]] = []
+        self.header_index: dict[bytes, list[bytes]] = {}
+        self.decoded_headers: list[tuple[str, str]] | None = None
         self.http_version: str = ''
-        self.body = b''
+        self.body_chunks: list[bytes] = []
+        self.body_length: int = 0
+        self.skipped_length: int = 0
+        self.start_time: float = 0.0
+        self.end_time: float = 0.0
 
     # parser callbacks
     def on_request(self, url: bytes, http_method: bytes) -> None:
-        self.http_method: str = http_method.decode("utf-8")
-        self.url: str = url.decode("utf-8")
-        self.headers = []
+        # Raw high bytes are not valid UTF-8, they are replaced rather than failing the whole stream
+        self.http_method: str = http_method.decode("utf-8", "replace")
+        self.url: str = url.decode("utf-8", "replace")
+        self.raw_headers = []
+        self.header_index = {}
+        self.decoded_headers = None
 
     def on_response(self, status_code: bytes, status_message: bytes) -> None:
         self.status_code: int = int(status_code)
-        self.status_message: str = status_message.decode("utf-8")
+        # The reason phrase may hold obs-text, bytes from a legacy charset
+        self.status_message: str = status_message.decode("utf-8", "replace")
 
     def on_header(self, name: bytes, value: bytes) -> None:
-        self.headers.append((name.decode("utf-8"), value.decode("utf-8")))
+        # Decoded on first access, most headers are never looked at
+        self.raw_headers.append((name, value))
+        self.header_index.setdefault(name.lower(), []).append(value)
+        self.decoded_headers = None
+
+    def on_header_block(self, raw_headers: list[tuple[bytes, bytes]],
+                        header_index: dict[bytes, list[bytes]]) -> None:
+        # The parser builds the index in the same pass that splits the headers
+        self.raw_headers = raw_headers
+        self.header_index = header_index
+        self.decoded_headers = None
+
+    def get_header(self, name: bytes) -> bytes | None:
+        values = self.header_index.get(name.lower())
+        return values[0] if values else None
+
+    def get_headers(self, name: bytes) -> list[bytes]:
+        return self.header_index.get(name.lower(), [])
+
+    def on_body(self, body: bytes | memoryview) -> None:
+        # Chunks are only joined when the whole body is asked for
+        self.body_chunks.append(bytes(body))
+        self.body_length += len(body)
+
+    def on_body_skipped(self, length: int) -> None:
+        self.skipped_length += length
+
+    @property
+    def truncated(self) -> bool:
+        return self.skipped_length > 0
+
+    @property
+    def headers(self) -> list[tuple[str, str]]:
+        if self.decoded_headers is None:
+            self.decoded_headers = [(name.decode("utf-8", "replace"), value.decode("utf-8", "replace"))
+                                    for name, value in self.raw_headers]
+        return self.decoded_headers
+
+    @property
+    def body(self) -> bytes:
+        if len(self.body_chunks) > 1:
+            self.body_chunks = [b"".join(self.body_chunks)]
+        return self.body_chunks[0] if self.body_chunks else b''
 
-    def on_body(self, body: bytes) -> None:
-        self.body += body
+    def iter_body(self):
+        yield from self.body_chunks
 
     def is_request(self) -> bool:
         if len(self.http_method) >= 3:
@@ -1,5 +1,13 @@
 import struct
 import socket
+from functools import lru_cache
+
+IP_HEADER = struct.Struct("!BBHHHBBH4s4s")
+
+
+@lru_cache(maxsize=65536)
+def format_ipv4(address: bytes) -> str:
+    return socket.inet_ntoa(address)
 
 
 class IPHeader:
@@ -9,18 +17,24 @@ class IPHeader:
     Attributes:
         version (int): The IP version number.
         ihl (int): Internet Header Length, the length of the IP header in bytes.
+        total_length (int): The length of the IP datagram in bytes, header included.
         ttl (int): Time to Live, indicating the remaining hops before the packet is discarded.
         protocol (int): The protocol used in the data portion of the IP datagram.
+        source_address (bytes): The packed source IP address.
+        dest_address (bytes): The packed destination IP address.
         source (str): The source IP address in human-readable format.
         dest (str): The destination IP address in human-readable format.
-        payload (bytes): The raw payload data following the IP header.
+        payload_offset (int): The offset of the payload data following the IP header.
+        payload_end (int): The offset where the payload data ends.
+        payload (memoryview | bytes): The payload data, a view without copying if `raw_data` is a memoryview.
 
     Methods:
         display(): Prints the parsed IP header information.
 
     Usage:
-        - Initialize with raw byte data representing an IP packet.
+        - Initialize with raw byte data containing an IP packet at `offset`, preferably a memoryview.
         - Parses the IP header and extracts fields like version, source IP, destination IP, etc.
+        - Addresses are only formatted on access, and each distinct address is formatted once.
         - Provides a method to display the parsed information in a human-readable format.
 
     Note:
@@ -35,16 +49,32 @@ class IPHeader:
                                                 Destination Address
     """
 
-    def __init__(self, raw_data: bytes):
-        ip_header = struct.unpack("!BBHHHBBH4s4s", raw_data[:20])
-        version_and_ihl = ip_header[0]
+    __slots__ = ("raw_data", "version", "ihl", "total_length", "ttl", "protocol", "source_address", "dest_address",
+                 "payload_offset", "payload_end")
+
+    def __init__(self, raw_data: memoryview | bytes, offset: int = 0):
+        version_and_ihl, _, total_length, _, _, self.ttl, self.protocol, _, self.source_address, self.dest_address = \
+            IP_HEADER.unpack_from(raw_data, offset)
+        self.raw_data = raw_data
         self.version: int = version_and_ihl >> 4
         self.ihl: int = (version_and_ihl & 0x0F) * 4
-        self.ttl: int = ip_header[5]
-        self.protocol: int = ip_header[6]
-        self.source: str = socket.inet_ntoa(ip_header[8])
-        self.dest: str = socket.inet_ntoa(ip_header[9])
-        self.payload: bytes = raw_data[self.ihl:]
+        self.total_length: int = total_length
+        self.payload_offset: int = offset + self.ihl
+        # Ethernet pads short frames, so the payload ends where the IP total length says
+        # A zero total length is seen on segmentation-offloaded frames, which are never padded
+        self.payload_end: int = min(offset + total_length, len(raw_data)) if total_length else len(raw_data)
+
+    @property
+    def source(self) -> str:
+        return format_ipv4(self.source_address)
+
+    @property
+    def dest(self) -> str:
+        return format_ipv4(self.dest_address)
+
+    @property
+    def payload(self) -> memoryview | bytes:
+        return self.raw_data[self.payload_offset:self.payload_end]
 
     def display(self):
         print(f"IP header:")
@@ -1,5 +1,13 @@
 import struct
 import socket
+from functools import lru_cache
+
+IPV6_HEADER = struct.Struct("!IHBB16s16s")
+
+
+@lru_cache(maxsize=65536)
+def format_ipv6(address: bytes) -> str:
+    return socket.inet_ntop(socket.AF_INET6, address)
 
 
 class IPv6Header:
@@ -7,22 +15,28 @@ class IPv6Header:
     A class for parsing and displaying the IPv6 header of a network packet.
 
     Attributes:
+        version_tc_fl (int): The first 32-bit word, holding the version, traffic class and flow label.
         version (int): The IPv6 version number.
         traffic_class (int): The traffic class field, related to Quality of Service.
         flow_label (int): The flow label used to identify packets from the same flow.
         payload_length (int): The length of the payload in bytes.
         protocol (int): The next header field, indicating the protocol of the encapsulated payload.
         hop_limit (int): The hop limit, similar to the TTL in IPv4, for limiting the packet's lifetime.
+        source_address (bytes): The packed source IPv6 address.
+        dest_address (bytes): The packed destination IPv6 address.
         source (str): The source IPv6 address in human-readable format.
         dest (str): The destination IPv6 address in human-readable format.
-        payload (bytes): The raw payload data following the IPv6 header.
+        payload_offset (int): The offset of the payload data following the IPv6 header.
+        payload_end (int): The offset where the payload data ends.
+        payload (memoryview | bytes): The payload data, a view without copying if `raw_data` is a memoryview.
 
     Methods:
         display(): Prints the parsed IPv6 header information.
 
     Usage:
-        - Initialize with raw byte data representing an IPv6 packet.
+        - Initialize with raw byte data containing an IPv6 packet at `offset`, preferably a memoryview.
         - Parses the IPv6 header and extracts various fields such as source and destination addresses, version, etc.
+        - Addresses are only formatted on access, and each distinct address is formatted once.
         - Provides a method to display the parsed information in a human-readable format.
 
     Note:
@@ -35,28 +49,46 @@ class IPv6Header:
         24 - 39: Destination address (128 bits)
     """
 
-    def __init__(self, raw_data: bytes):
-        # Unpack the first 40 bytes of data for the IPv6 header
-        unpacked_data = struct.unpack("!4sHBB16s16s", raw_data[:40])
+    __slots__ = ("raw_data", "version_tc_fl", "payload_length", "protocol", "hop_limit", "source_address",
+                 "dest_address", "payload_offset", "payload_end")
+
+    def __init__(self, raw_data: memoryview | bytes, offset: int = 0):
+        self.raw_data = raw_data
+
+        # Version, Traffic Class, and Flow Label, split up on access
+        # Payload Length, Next Header (actually next header, but for consistency it will also be called protocol),
+        # Hop Limit, Source and Destination Addresses
+        (self.version_tc_fl, self.payload_length, self.protocol, self.hop_limit, self.source_address,
+         self.dest_address) = IPV6_HEADER.unpack_from(raw_data, offset)
+
+        self.payload_offset: int = offset + 40
+        # A zero payload length is used by jumbograms and segmentation-offloaded frames
+        self.payload_end: int = min(self.payload_offset + self.payload_length, len(raw_data)) \
+            if self.payload_length else len(raw_data)
+
+    @property
+    def version(self) -> int:
+        return self.version_tc_fl >> 28
 
-        # Version, Traffic Class, and Flow Label
-        version_tc_fl = unpacked_data[0]
-        self.version = (version_tc_fl[0] >> 4) & 0x0F
-        self.traffic_class = ((version_tc_fl[0] & 0x0F) << 4) | (version_tc_fl[1] >> 4)
-        self.flow_label = ((version_tc_fl[1] & 0x0F) << 16) | (version_tc_fl[2] << 8) | version_tc_fl[3]
+    @property
+    def traffic_class(self) -> int:
+        return (self.version_tc_fl >> 20) & 0xFF
 
-        # Payload Length, Next Header, Hop Limit
-        self.payload_length = unpacked_data[1]
+    @property
+    def flow_label(self) -> int:
+        return self.version_tc_fl & 0xFFFFF
 
-        # Actually next header, but for consistency it will also be called protocol
-        self.protocol = unpacked_data[2]
-        self.hop_limit = unpacked_data[3]
+    @property
+    def source(self) -> str:
+        return format_ipv6(self.source_address)
 
-        # Source and Destination Addresses
-        self.source = socket.inet_ntop(socket.AF_INET6, unpacked_data[4])
-        self.dest = socket.inet_ntop(socket.AF_INET6, unpacked_data[5])
+    @property
+    def dest(self) -> str:
+        return format_ipv6(self.dest_address)
 
-        self.payload = raw_data[40:]
+    @property
+    def payload(self) -> memoryview | bytes:
+        return self.raw_data[self.payload_offset:self.payload_end]
 
     def display(self):
         print("IPv6 Header:")
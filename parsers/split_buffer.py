@@ -1,42 +1,82 @@
+# Consumed bytes are only dropped from the front of the buffer once there are this many of them
+# and they make up at least half of the buffer, so compaction stays amortized O(1) per byte
+COMPACT_THRESHOLD = 64 * 1024
+
+
 class SplitBuffer:
     """
     A class for managing a buffer that accumulates and splits binary data.
 
     Attributes:
-        data (bytes): The accumulated data in the buffer.
+        data (bytearray): The accumulated data in the buffer, including already consumed bytes.
+        offset (int): The read cursor, everything before it has already been consumed.
 
     Methods:
         feed_data(data: bytes): Appends more data to the buffer.
-        pop(separator: bytes): Splits the buffer at the first occurrence of the given separator.
+        pop(separator: bytes, start: int): Splits the buffer at the first occurrence of the given separator,
+            searching from `start` bytes past the cursor.
+        startswith(prefix: bytes): Checks if the unconsumed bytes start with `prefix`.
         is_empty(): Checks if the buffer is empty.
         flush(): Clears the buffer and returns its content.
+        take(size: int): Removes and returns at most `size` bytes from the front of the buffer.
+        skip(size: int): Drops at most `size` bytes from the front of the buffer without copying them.
 
     Usage:
         - Used to accumulate binary data streams and split or parse the data based on a specified separator.
 
     Note:
         The class is designed to handle and accumulate binary data.
+        Data is appended in place and consumed by moving `offset`, lines are found with `find` from the cursor,
+        so every byte is copied a constant number of times no matter how many lines a message has.
     """
 
     def __init__(self):
-        self.data = b""
+        self.data = bytearray()
+        self.offset = 0
 
-    def feed_data(self, data: bytes) -> None:
+    def feed_data(self, data: bytes | memoryview) -> None:
+        if self.offset:
+            if self.offset == len(self.data):
+                self.data.clear()
+                self.offset = 0
+            elif self.offset >= COMPACT_THRESHOLD and self.offset * 2 >= len(self.data):
+                del self.data[:self.offset]
+                self.offset = 0
         self.data += data
 
-    def pop(self, separator: bytes) -> bytes | None:
-        first, *rest = self.data.split(separator, maxsplit=1)
+    def pop(self, separator: bytes, start: int = 0) -> bytes | None:
+        index = self.data.find(separator, self.offset + start)
         # no split was possible
-        if not rest:
+        if index < 0:
             return None
-        else:
-            self.data = separator.join(rest)
-            return first
+        line = bytes(self.data[self.offset:index])
+        self.offset = index + len(separator)
+        return line
+
+    def startswith(self, prefix: bytes) -> bool:
+        return self.data.startswith(prefix, self.offset)
+
+    def __len__(self) -> int:
+        return len(self.data) - self.offset
 
     def is_empty(self) -> bool:
-        return self.data == b""
+        return self.offset == len(self.data)
+
+    def flush(self) -> memoryview:
+        # The remaining bytes are handed out without copying, and a fresh buffer takes over
+        remaining = memoryview(self.data)[self.offset:]
+        self.data = bytearray()
+        self.offset = 0
+        return remaining
+
+    def take(self, size: int) -> bytes | memoryview:
+        if size >= len(self.data) - self.offset:
+            return self.flush()
+        chunk = bytes(self.data[self.offset:self.offset + size])
+        self.offset += size
+        return chunk
 
-    def flush(self) -> bytes:
-        temp = self.data
-        self.data = b""
-        return temp
+    def skip(self, size: int) -> int:
+        size = min(size, len(self.data) - self.offset)
+        self.offset += size
+        return size
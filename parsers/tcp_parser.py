@@ -1,5 +1,7 @@
 import struct
 
+TCP_HEADER = struct.Struct("!HHLLHHH")
+
 
 class TCPHeader:
     """
@@ -12,17 +14,21 @@ class TCPHeader:
         acknowledgment (int): If the ACK flag is set, this field contains the value of the next sequence number.
         offset (int): The size of the TCP header in bytes.
         flag_ack (int): The acknowledgment flag.
+        flag_rst (int): The reset flag indicating the connection was aborted.
         flag_syn (int): The synchronize sequence numbers flag.
         flag_fin (int): The finish flag indicating the sender has finished sending data.
         window (int): The size of the received window.
         checksum (int): The checksum used for error-checking of the header and data.
-        payload (bytes): The raw payload data following the TCP header.
+        payload_offset (int): The offset of the payload data following the TCP header.
+        payload_end (int): The offset where the payload data ends, usually the end of the IP payload.
+        payload (memoryview | bytes): The payload data, a view without copying if `raw_data` is a memoryview.
 
     Methods:
         display(): Prints the parsed TCP header information.
 
     Usage:
-        - Initialize with raw byte data representing a TCP packet.
+        - Initialize with raw byte data containing a TCP segment at `offset`, preferably a memoryview,
+          and the `end` of the enclosing IP payload.
         - Parses the TCP header and extracts fields such as source port, destination port, sequence number, etc.
         - Provides a method to display the parsed information in a human-readable format.
 
@@ -41,25 +47,32 @@ class TCPHeader:
                           data
     """
 
-    def __init__(self, raw_data: bytes):
-        (self.source_port, self.dest_port, self.sequence, self.acknowledgment, offset_reserved_flags) = struct.unpack(
-            '!HHLLH', raw_data[:14])
+    __slots__ = ("raw_data", "source_port", "dest_port", "sequence", "acknowledgment", "offset", "flag_ack", "flag_rst",
+                 "flag_syn", "flag_fin", "window", "checksum", "payload_offset", "payload_end")
+
+    def __init__(self, raw_data: memoryview | bytes, offset: int = 0, end: int | None = None):
+        (self.source_port, self.dest_port, self.sequence, self.acknowledgment, offset_reserved_flags, self.window,
+         self.checksum) = TCP_HEADER.unpack_from(raw_data, offset)
+        self.raw_data = raw_data
         self.offset: int = (offset_reserved_flags >> 12) * 4
         # flag_urg = (offset_reserved_flags & 32) >> 5
         self.flag_ack: int = (offset_reserved_flags & 16) >> 4
         # flag_psh = (offset_reserved_flags & 8) >> 3
-        # flag_rst = (offset_reserved_flags & 4) >> 2
+        self.flag_rst: int = (offset_reserved_flags & 4) >> 2
         self.flag_syn: int = (offset_reserved_flags & 2) >> 1
         self.flag_fin: int = offset_reserved_flags & 1
-        self.window: int = struct.unpack('!H', raw_data[14:16])[0]
-        self.checksum: int = struct.unpack('!H', raw_data[16:18])[0]
         # urgent_pointer = struct.unpack('!H', raw_data[18:20])[0]
-        self.payload: bytes = raw_data[self.offset:]
+        self.payload_offset: int = offset + self.offset
+        self.payload_end: int = len(raw_data) if end is None else end
+
+    @property
+    def payload(self) -> memoryview | bytes:
+        return self.raw_data[self.payload_offset:self.payload_end]
 
     def display(self):
         print(f"TCP Header:")
         print(f"Source Port: {self.source_port}, Destination Port: {self.dest_port}")
         print(f"Sequence Number: {self.sequence}, Acknowledgment Number: {self.acknowledgment}")
         print(
-            f"Flags: ACK: {self.flag_ack}, SYN: {self.flag_syn}, FIN: {self.flag_fin}")
+            f"Flags: ACK: {self.flag_ack}, RST: {self.flag_rst}, SYN: {self.flag_syn}, FIN: {self.flag_fin}")
         print(f"Window Size: {self.window}, Checksum: {self.checksum}")
@@ -0,0 +1,153 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import socket
+import struct
+import time
+
+# Constants from <sys/socket.h> and <asm-generic/socket.h>
+MSG_DONTWAIT = 0x40
+SO_TIMESTAMPNS = 35
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_SLOT_SIZE = 65536
+
+# struct cmsghdr (len, level, type) followed by a struct timespec (sec, nsec)
+CMSG_HEADER = struct.Struct("@Nii")
+TIMESPEC = struct.Struct("@ll")
+CONTROL_SIZE = CMSG_HEADER.size + TIMESPEC.size
+
+
+class IoVec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class MsgHdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32),
+                ("msg_iov", ctypes.POINTER(IoVec)), ("msg_iovlen", ctypes.c_size_t),
+                ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class MMsgHdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", MsgHdr), ("msg_len", ctypes.c_uint)]
+
+
+def load_recvmmsg():
+    """
+    Looks up recvmmsg in the C library.
+
+    Returns:
+        The ctypes function, or None if it is not available on this platform.
+    """
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        recvmmsg = libc.recvmmsg
+    except (OSError, AttributeError):
+        return None
+    recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(MMsgHdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    recvmmsg.restype = ctypes.c_int
+    return recvmmsg
+
+
+class BatchReceiver:
+    """
+    A class for receiving frames in batches into a pool of preallocated buffers.
+
+    Attributes:
+        raw_socket (socket.socket): The socket frames are read from.
+        slots (list): The preallocated `bytearray` buffers, one per frame of a batch.
+        views (list): A memoryview over each slot, handed out to the parsers.
+        recvmmsg: The C library recvmmsg function, or None to fall back to one `recvmsg_into` per frame.
+        poller (select.poll): Used to wait for frames without blocking past the stop event.
+
+    Methods:
+        receive_batch(poll_timeout_ms): Returns a list of (memoryview, length, timestamp) entries.
+
+    Usage:
+        - Create with an AF_PACKET socket and call `receive_batch` in the capture loop.
+        - Process every entry of a batch before asking for the next one.
+
+    Note:
+        Slots are recycled by the next call to `receive_batch`, so the returned views are only valid until then
+        and anything that is kept must be copied. No memory is allocated per frame: with recvmmsg a whole batch
+        is read with a single syscall. Either way every frame keeps the kernel capture timestamp, read from its
+        SCM_TIMESTAMPNS message.
+    """
+
+    def __init__(self, raw_socket: socket.socket, batch_size: int = DEFAULT_BATCH_SIZE,
+                 slot_size: int = DEFAULT_SLOT_SIZE):
+        self.raw_socket = raw_socket
+        self.slots = [bytearray(slot_size) for _ in range(batch_size)]
+        self.views = [memoryview(slot) for slot in self.slots]
+        self.poller = select.poll()
+        self.poller.register(raw_socket.fileno(), select.POLLIN | select.POLLERR)
+
+        raw_socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        self.recvmmsg = load_recvmmsg()
+        if self.recvmmsg is not None:
+            self.controls = [bytearray(CONTROL_SIZE) for _ in range(batch_size)]
+            # The ctypes arrays pin the slots, so their addresses stay valid for the life of the receiver
+            self.slot_buffers = [(ctypes.c_char * slot_size).from_buffer(slot) for slot in self.slots]
+            self.control_buffers = [(ctypes.c_char * CONTROL_SIZE).from_buffer(control) for control in self.controls]
+            self.iovecs = (IoVec * batch_size)()
+            self.headers = (MMsgHdr * batch_size)()
+            for index in range(batch_size):
+                self.iovecs[index].iov_base = ctypes.addressof(self.slot_buffers[index])
+                self.iovecs[index].iov_len = slot_size
+                self.headers[index].msg_hdr.msg_iov = ctypes.pointer(self.iovecs[index])
+                self.headers[index].msg_hdr.msg_iovlen = 1
+                self.headers[index].msg_hdr.msg_control = ctypes.addressof(self.control_buffers[index])
+
+    def receive_batch(self, poll_timeout_ms: int = 100) -> list[tuple[memoryview, int, float]]:
+        if not self.poller.poll(poll_timeout_ms):
+            return []
+        if self.recvmmsg is not None:
+            return self._receive_recvmmsg()
+        return self._receive_recv_into()
+
+    def _receive_recvmmsg(self) -> list[tuple[memoryview, int, float]]:
+        for header in self.headers:
+            header.msg_hdr.msg_controllen = CONTROL_SIZE
+
+        count = self.recvmmsg(self.raw_socket.fileno(), self.headers, len(self.headers), MSG_DONTWAIT, None)
+        if count < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise OSError(error, os.strerror(error))
+
+        batch = []
+        for index in range(count):
+            header = self.headers[index]
+            timestamp = None
+            if header.msg_hdr.msg_controllen >= CONTROL_SIZE:
+                _, level, kind = CMSG_HEADER.unpack_from(self.controls[index])
+                if level == socket.SOL_SOCKET and kind == SCM_TIMESTAMPNS:
+                    sec, nsec = TIMESPEC.unpack_from(self.controls[index], CMSG_HEADER.size)
+                    timestamp = sec + nsec / 1e9
+            batch.append((self.views[index], header.msg_len, timestamp or time.time()))
+        return batch
+
+    def _receive_recv_into(self) -> list[tuple[memoryview, int, float]]:
+        batch = []
+        control_size = socket.CMSG_SPACE(TIMESPEC.size)
+        for view in self.views:
+            try:
+                length, ancillary, _, _ = self.raw_socket.recvmsg_into([view], control_size, MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            batch.append((view, length, capture_timestamp(ancillary)))
+        return batch
+
+
+def capture_timestamp(ancillary: list[tuple[int, int, bytes]]) -> float:
+    # The kernel stamps the frame when it is received, long before userspace gets to it
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == SCM_TIMESTAMPNS and len(data) >= TIMESPEC.size:
+            seconds, nanoseconds = TIMESPEC.unpack_from(data)
+            return seconds + nanoseconds / 1e9
+    return time.time()
@@ -0,0 +1,367 @@
+import ctypes
+import ipaddress
+import re
+import socket
+import struct
+
+# Socket option from <asm-generic/socket.h>, the socket module does not expose it
+SO_ATTACH_FILTER = 26
+
+# Classic BPF opcodes from <linux/bpf_common.h>
+BPF_LD, BPF_LDX, BPF_ALU, BPF_JMP, BPF_RET = 0x00, 0x01, 0x04, 0x05, 0x06
+BPF_W, BPF_H, BPF_B = 0x00, 0x08, 0x10
+BPF_ABS, BPF_MSH = 0x20, 0xa0
+BPF_JEQ, BPF_JSET = 0x10, 0x40
+BPF_AND = 0x50
+BPF_K = 0x00
+
+LD_W = BPF_LD | BPF_W | BPF_ABS
+LD_H = BPF_LD | BPF_H | BPF_ABS
+LD_B = BPF_LD | BPF_B | BPF_ABS
+LD_H_IND = BPF_LD | BPF_H | 0x40
+LDX_MSH = BPF_LDX | BPF_B | BPF_MSH
+AND_K = BPF_ALU | BPF_AND | BPF_K
+JEQ_K = BPF_JMP | BPF_JEQ | BPF_K
+JSET_K = BPF_JMP | BPF_JSET | BPF_K
+RET_K = BPF_RET | BPF_K
+
+# Number of bytes of an accepted frame that are copied to userspace
+SNAPLEN = 0x40000
+
+# Ancillary data load of the packet type, from <linux/filter.h> and <linux/if_packet.h>
+SKF_AD_PKTTYPE = -0x1000 + 4
+PACKET_OUTGOING = 4
+
+# Offsets inside an Ethernet frame, see the parsers package for the header layouts
+ETHERTYPE_OFFSET = 12
+IPV4_FLAGS_OFFSET, IPV4_PROTOCOL_OFFSET, IPV4_SOURCE_OFFSET, IPV4_DEST_OFFSET = 20, 23, 26, 30
+IPV6_NEXT_HEADER_OFFSET, IPV6_SOURCE_OFFSET, IPV6_DEST_OFFSET = 20, 22, 38
+IPV4_START, IPV6_TCP_START = 14, 54
+
+TOKEN_PATTERN = re.compile(r"\s*(\(|\)|&&|\|\||!|[^\s()!]+)")
+
+
+class FilterProgram:
+    """
+    A small assembler for classic BPF programs with forward-only symbolic labels.
+
+    Attributes:
+        instructions (list): (code, jt, jf, k) tuples, where jt and jf are label ids or None for fall-through.
+        label_positions (dict): The instruction index each placed label points to.
+
+    Methods:
+        new_label(): Returns a fresh label id.
+        place(label): Binds a label to the next emitted instruction.
+        emit(code, k, jt, jf): Appends an instruction.
+        assemble(): Resolves the labels into relative jump offsets.
+    """
+
+    def __init__(self):
+        self.instructions = []
+        self.label_positions = {}
+        self.label_count = 0
+
+    def new_label(self) -> int:
+        self.label_count += 1
+        return self.label_count
+
+    def place(self, label: int) -> None:
+        self.label_positions[label] = len(self.instructions)
+
+    def emit(self, code: int, k: int = 0, jt: int | None = None, jf: int | None = None) -> None:
+        self.instructions.append((code, jt, jf, k))
+
+    def assemble(self) -> list[tuple[int, int, int, int]]:
+        program = []
+        for index, (code, jt, jf, k) in enumerate(self.instructions):
+            program.append((code, self._offset(index, jt), self._offset(index, jf), k))
+        return program
+
+    def _offset(self, index: int, label: int | None) -> int:
+        if label is None:
+            return 0
+        offset = self.label_positions[label] - index - 1
+        if not 0 <= offset <= 0xff:
+            raise ValueError("Filter expression is too long")
+        return offset
+
+
+class FilterCompiler:
+    """
+    A class for compiling a host/port filter expression into a classic BPF program.
+
+    Attributes:
+        tokens (list): The tokens of the expression that are still to be parsed.
+        program (FilterProgram): The program being generated.
+
+    Methods:
+        compile(): Parses the expression and returns the assembled program.
+
+    Usage:
+        - FilterCompiler("host 10.0.0.1 and not port 443").compile()
+
+    Note:
+        The grammar is a small subset of the tcpdump one, combined with `and`/`&&`, `or`/`||`, `not`/`!`
+        and parentheses:
+
+        [src|dst] host ADDRESS          IPv4 or IPv6 address
+        [src|dst] net ADDRESS/PREFIX    IPv4 or IPv6 network
+        [tcp] [src|dst] port PORT       TCP port, fragments other than the first one never match
+        tcp | ip | ip6
+
+        Every program only accepts TCP over IPv4 or IPv6, since nothing else is ever used by the sniffer.
+        Frames sent by this host are rejected as well, so a socket bound to all protocols sees the same traffic
+        as the protocol-specific ones (and loopback traffic only once).
+    """
+
+    def __init__(self, expression: str):
+        self.tokens = TOKEN_PATTERN.findall(expression)
+        self.program = FilterProgram()
+
+    def compile(self) -> list[tuple[int, int, int, int]]:
+        tree = ("tcp",)
+        if self.tokens:
+            tree = ("and", tree, self._parse_or())
+            if self.tokens:
+                raise ValueError(f"Unexpected token in filter expression: {self.tokens[0]}")
+
+        accept, reject, incoming = self.program.new_label(), self.program.new_label(), self.program.new_label()
+        self.program.emit(LD_B, SKF_AD_PKTTYPE & 0xffffffff)
+        self.program.emit(JEQ_K, PACKET_OUTGOING, reject, incoming)
+        self.program.place(incoming)
+        self._generate(tree, accept, reject)
+        self.program.place(accept)
+        self.program.emit(RET_K, SNAPLEN)
+        self.program.place(reject)
+        self.program.emit(RET_K, 0)
+        return self.program.assemble()
+
+    # Parsing
+    def _next(self) -> str:
+        if not self.tokens:
+            raise ValueError("Unexpected end of filter expression")
+        return self.tokens.pop(0)
+
+    def _peek(self) -> str | None:
+        return self.tokens[0] if self.tokens else None
+
+    def _parse_or(self):
+        node = self._parse_and()
+        while self._peek() in ("or", "||"):
+            self._next()
+            node = ("or", node, self._parse_and())
+        return node
+
+    def _parse_and(self):
+        node = self._parse_not()
+        while self._peek() in ("and", "&&"):
+            self._next()
+            node = ("and", node, self._parse_not())
+        return node
+
+    def _parse_not(self):
+        token = self._peek()
+        if token in ("not", "!"):
+            self._next()
+            return ("not", self._parse_not())
+        if token == "(":
+            self._next()
+            node = self._parse_or()
+            if self._next() != ")":
+                raise ValueError("Missing ')' in filter expression")
+            return node
+        return self._parse_primitive()
+
+    def _parse_primitive(self):
+        token = self._next()
+        if token in ("ip", "ip6"):
+            return (token,)
+        if token == "tcp":
+            if self._peek() not in ("src", "dst", "port"):
+                return ("tcp",)
+            token = self._next()
+
+        direction = None
+        if token in ("src", "dst"):
+            direction, token = token, self._next()
+
+        if token == "host":
+            return ("net", direction, ipaddress.ip_network(self._next()))
+        if token == "net":
+            return ("net", direction, ipaddress.ip_network(self._next(), strict=False))
+        if token == "port":
+            port = int(self._next())
+            if not 0 <= port <= 0xffff:
+                raise ValueError(f"Invalid port in filter expression: {port}")
+            return ("port", direction, port)
+        raise ValueError(f"Unknown filter primitive: {token}")
+
+    # Code generation, every node jumps to either `on_true` or `on_false`
+    def _generate(self, node, on_true: int, on_false: int) -> None:
+        program = self.program
+        kind = node[0]
+
+        if kind in ("and", "or"):
+            middle = program.new_label()
+            if kind == "and":
+                self._generate(node[1], middle, on_false)
+            else:
+                self._generate(node[1], on_true, middle)
+            program.place(middle)
+            self._generate(node[2], on_true, on_false)
+        elif kind == "not":
+            self._generate(node[1], on_false, on_true)
+        elif kind == "ip":
+            self._generate_family(lambda: program.emit(JEQ_K, 0, on_true, on_true), None, on_false)
+        elif kind == "ip6":
+            self._generate_family(None, lambda: program.emit(JEQ_K, 0, on_true, on_true), on_false)
+        elif kind == "tcp":
+            self._generate_family(lambda: self._generate_byte(IPV4_PROTOCOL_OFFSET, 6, on_true, on_false),
+                                  lambda: self._generate_byte(IPV6_NEXT_HEADER_OFFSET, 6, on_true, on_false),
+                                  on_false)
+        elif kind == "net":
+            _, direction, network = node
+            offsets = self._address_offsets(direction, network.version)
+
+            def generate():
+                self._generate_either(offsets, lambda offset, matched, missed: self._generate_network(
+                    offset, network, matched, missed), on_true, on_false)
+
+            if network.version == 4:
+                self._generate_family(generate, None, on_false)
+            else:
+                self._generate_family(None, generate, on_false)
+        elif kind == "port":
+            _, direction, port = node
+            self._generate_family(lambda: self._generate_ipv4_port(direction, port, on_true, on_false),
+                                  lambda: self._generate_ipv6_port(direction, port, on_true, on_false),
+                                  on_false)
+
+    def _generate_family(self, ipv4, ipv6, on_false: int) -> None:
+        program = self.program
+        ipv4_label, ipv6_label, other_label = program.new_label(), program.new_label(), program.new_label()
+        program.emit(LD_H, ETHERTYPE_OFFSET)
+        program.emit(JEQ_K, 0x0800, ipv4_label if ipv4 else on_false, other_label)
+        program.place(other_label)
+        program.emit(JEQ_K, 0x86DD, ipv6_label if ipv6 else on_false, on_false)
+        if ipv4:
+            program.place(ipv4_label)
+            ipv4()
+        if ipv6:
+            program.place(ipv6_label)
+            ipv6()
+
+    def _generate_either(self, offsets: list[int], generate, on_true: int, on_false: int) -> None:
+        # Source or destination: try each offset in turn
+        for offset in offsets[:-1]:
+            next_label = self.program.new_label()
+            generate(offset, on_true, next_label)
+            self.program.place(next_label)
+        generate(offsets[-1], on_true, on_false)
+
+    def _generate_byte(self, offset: int, value: int, on_true: int, on_false: int) -> None:
+        self.program.emit(LD_B, offset)
+        self.program.emit(JEQ_K, value, on_true, on_false)
+
+    def _generate_network(self, offset: int, network, on_true: int, on_false: int) -> None:
+        address = network.network_address.packed
+        mask = network.netmask.packed
+        words = [(offset + i, struct.unpack("!I", address[i:i + 4])[0], struct.unpack("!I", mask[i:i + 4])[0])
+                 for i in range(0, len(address), 4)]
+        words = [word for word in words if word[2]] or words[:1]
+
+        for index, (word_offset, value, word_mask) in enumerate(words):
+            last = index == len(words) - 1
+            self.program.emit(LD_W, word_offset)
+            if word_mask != 0xffffffff:
+                self.program.emit(AND_K, word_mask)
+            next_label = on_true if last else self.program.new_label()
+            self.program.emit(JEQ_K, value, next_label, on_false)
+            if not last:
+                self.program.place(next_label)
+
+    def _generate_ipv4_port(self, direction: str | None, port: int, on_true: int, on_false: int) -> None:
+        program = self.program
+        is_tcp, not_fragment = program.new_label(), program.new_label()
+        program.emit(LD_B, IPV4_PROTOCOL_OFFSET)
+        program.emit(JEQ_K, 6, is_tcp, on_false)
+        program.place(is_tcp)
+        program.emit(LD_H, IPV4_FLAGS_OFFSET)
+        program.emit(JSET_K, 0x1fff, on_false, not_fragment)
+        program.place(not_fragment)
+        # X = IPv4 header length
+        program.emit(LDX_MSH, IPV4_START)
+
+        def generate(offset, matched, missed):
+            program.emit(LD_H_IND, offset)
+            program.emit(JEQ_K, port, matched, missed)
+
+        self._generate_either(self._port_offsets(direction, IPV4_START), generate, on_true, on_false)
+
+    def _generate_ipv6_port(self, direction: str | None, port: int, on_true: int, on_false: int) -> None:
+        program = self.program
+        is_tcp = program.new_label()
+        program.emit(LD_B, IPV6_NEXT_HEADER_OFFSET)
+        program.emit(JEQ_K, 6, is_tcp, on_false)
+        program.place(is_tcp)
+
+        def generate(offset, matched, missed):
+            program.emit(LD_H, offset)
+            program.emit(JEQ_K, port, matched, missed)
+
+        self._generate_either(self._port_offsets(direction, IPV6_TCP_START), generate, on_true, on_false)
+
+    @staticmethod
+    def _address_offsets(direction: str | None, version: int) -> list[int]:
+        source, dest = (IPV4_SOURCE_OFFSET, IPV4_DEST_OFFSET) if version == 4 else (IPV6_SOURCE_OFFSET,
+                                                                                     IPV6_DEST_OFFSET)
+        return {"src": [source], "dst": [dest]}.get(direction, [source, dest])
+
+    @staticmethod
+    def _port_offsets(direction: str | None, start: int) -> list[int]:
+        return {"src": [start], "dst": [start + 2]}.get(direction, [start, start + 2])
+
+
+class SockFilter(ctypes.Structure):
+    _fields_ = [("code", ctypes.c_uint16), ("jt", ctypes.c_uint8), ("jf", ctypes.c_uint8), ("k", ctypes.c_uint32)]
+
+
+class SockFprog(ctypes.Structure):
+    _fields_ = [("len", ctypes.c_uint16), ("filter", ctypes.POINTER(SockFilter))]
+
+
+def compile_filter(expression: str) -> list[tuple[int, int, int, int]]:
+    """
+    Compiles a filter expression into a classic BPF program.
+
+    Args:
+        expression (str): The filter expression, an empty string only keeps TCP traffic.
+
+    Returns:
+        list[tuple[int, int, int, int]]: The (code, jt, jf, k) instructions.
+
+    Raises:
+        ValueError: If the expression cannot be parsed.
+    """
+    return FilterCompiler(expression).compile()
+
+
+def attach_filter(raw_socket: socket.socket, program: list[tuple[int, int, int, int]]) -> bool:
+    """
+    Attaches a classic BPF program to a socket with SO_ATTACH_FILTER.
+
+    Args:
+        raw_socket (socket.socket): The AF_PACKET socket to filter.
+        program (list): The instructions returned by `compile_filter`.
+
+    Returns:
+        bool: True if the kernel accepted the program.
+    """
+    filters = (SockFilter * len(program))(*program)
+    fprog = SockFprog(len(program), filters)
+    try:
+        raw_socket.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, bytes(fprog))
+        return True
+    except OSError as e:
+        print(f"Error attaching socket filter: {e}")
+        return False
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+import queue
+import time
+
+from sniffer.sniffer import Sniffer
+
+
+def run_worker(group_id: int, start_time: float, stop_event, records, sniffer_options: dict) -> None:
+    """
+    Entry point of a fanout worker process.
+
+    Args:
+        group_id (int): The fanout group the worker socket joins.
+        start_time (float): The parent start time, so that every worker reports times on the same clock.
+        stop_event (multiprocessing.Event): Set by the parent to stop the worker.
+        records (multiprocessing.Queue): Completed transactions are put here for the parent.
+        sniffer_options (dict): Keyword arguments for the worker's `Sniffer`.
+    """
+    sniffer = Sniffer(fanout_group=group_id, **sniffer_options)
+    sniffer.start_time = start_time
+    # The queue pickles and writes from a feeder thread, so the capture loop only appends to a deque
+    sniffer.sniff_packets(stop_event, lambda *record: records.put(record))
+
+
+class FanoutCapture:
+    """
+    A class for capturing with several worker processes, each owning a disjoint set of TCP flows.
+
+    Attributes:
+        worker_count (int): The number of worker processes.
+        sniffer_options (dict): Keyword arguments passed to the `Sniffer` of every worker.
+        group_id (int): The PACKET_FANOUT group shared by the worker sockets.
+        start_time (float): The time when the capture was created.
+
+    Methods:
+        sniff_packets(stop_event, on_packet_received): Starts the workers and forwards their transactions.
+
+    Usage:
+        - Initialize with the number of workers and the usual `Sniffer` options.
+        - Call `sniff_packets` exactly like `Sniffer.sniff_packets`, the callback runs in the calling process.
+
+    Note:
+        Every worker has its own AF_PACKET socket in a PACKET_FANOUT_HASH group, so the kernel hashes each flow
+        to a single worker, which runs its own TCP reassembly and HTTP parsers with no shared state.
+        Only completed transactions cross the process boundary.
+    """
+
+    def __init__(self, worker_count: int, **sniffer_options):
+        self.worker_count = worker_count
+        self.sniffer_options = sniffer_options
+        self.group_id = os.getpid() & 0xFFFF
+        self.start_time = time.time()
+
+    def sniff_packets(self, stop_event, on_packet_received):
+        worker_stop_event = multiprocessing.Event()
+        records = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=run_worker, daemon=True,
+                                           args=(self.group_id, self.start_time, worker_stop_event, records,
+                                                 self.sniffer_options))
+                   for _ in range(self.worker_count)]
+        for worker in workers:
+            worker.start()
+
+        print(f"Sniffing with {self.worker_count} workers...")
+        try:
+            while not stop_event.is_set() and any(worker.is_alive() for worker in workers):
+                try:
+                    on_packet_received(*records.get(timeout=0.1))
+                except queue.Empty:
+                    continue
+        except KeyboardInterrupt:
+            print("Sniffing stopped")
+        finally:
+            worker_stop_event.set()
+            for worker in workers:
+                worker.join(1)
+                if worker.is_alive():
+                    worker.terminate()
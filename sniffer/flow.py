@@ -0,0 +1,53 @@
+from parsers.http_parser import HttpParser
+from sniffer.tcp_reassembler import TcpReassembler
+
+# Approximate memory of the objects of a flow, with its table entry, and of an HTTP parser with its empty message
+FLOW_OVERHEAD = 512
+PARSER_OVERHEAD = 1536
+
+
+class Flow:
+    """
+    A class holding the state of one direction of a TCP connection.
+
+    Attributes:
+        reassembler (TcpReassembler): Puts the payloads back in order.
+        http_parser (HttpParser | None): The HTTP parser of the connection, only created once its first payload
+            arrives.
+        identified (bool): Whether the stream is known to carry HTTP, flows started by a SYN are only identified
+            by their first payload bytes.
+        last_seen (float): The time of the last packet of the connection.
+        accounted_bytes (int): The memory usage last reported to the flow table.
+        accounted_out_of_order_bytes (int): The out-of-order bytes last reported to the flow table.
+        resynchronizing (bool): Whether data was lost, the stream is skipped until a segment starts a message.
+        held_frames (list | None): (frame, timestamp) of the frames seen before the stream was identified, held
+            back from an HTTP-only recording until it is known to be HTTP.
+
+    Methods:
+        memory_usage(): Returns the number of bytes the flow is holding on to.
+
+    Note:
+        The usage counts the payload bytes (out-of-order intervals, unparsed bytes and the body kept so far), which
+        is what grows with the traffic, plus a fixed estimate of the objects themselves, so that many flows without
+        any payload, e.g. from a SYN flood, still count against the memory budget.
+    """
+
+    __slots__ = ("reassembler", "http_parser", "identified", "last_seen", "accounted_bytes",
+                 "accounted_out_of_order_bytes", "resynchronizing", "held_frames")
+
+    def __init__(self, reassembler: TcpReassembler, http_parser: HttpParser | None = None, identified: bool = True,
+                 last_seen: float = 0.0):
+        self.reassembler: TcpReassembler = reassembler
+        self.http_parser: HttpParser | None = http_parser
+        self.identified: bool = identified
+        self.last_seen: float = last_seen
+        self.accounted_bytes: int = 0
+        self.accounted_out_of_order_bytes: int = 0
+        self.resynchronizing: bool = False
+        self.held_frames: list[tuple[bytes, float | None]] | None = None
+
+    def memory_usage(self) -> int:
+        if self.http_parser is None:
+            return FLOW_OVERHEAD + self.reassembler.buffered_bytes
+        return (FLOW_OVERHEAD + PARSER_OVERHEAD + self.reassembler.buffered_bytes + len(self.http_parser.buffer)
+                + self.http_parser.info_http.body_length)
@@ -0,0 +1,119 @@
+from collections import OrderedDict
+
+from sniffer.flow import Flow
+
+# Seconds without a packet after which a flow is forgotten
+DEFAULT_IDLE_TIMEOUT = 120.0
+# Payload bytes all the flows together may hold on to
+DEFAULT_MAX_BUFFERED_BYTES = 256 * 1024 * 1024
+# Flows started by a SYN and still waiting for their first payload, past this many the oldest ones are dropped
+DEFAULT_MAX_UNIDENTIFIED_FLOWS = 65536
+
+
+class FlowTable:
+    """
+    A class for tracking the TCP flows of a capture with bounded time and memory.
+
+    Attributes:
+        flows (OrderedDict): The flows by (source, dest, source_port, dest_port), least recently seen first.
+        idle_timeout (float): Seconds without a packet after which a flow is evicted.
+        max_buffered_bytes (int): The number of payload bytes all the flows together may hold on to.
+        max_unidentified_flows (int): The number of flows waiting for their first payload that are kept at most.
+        unidentified (OrderedDict): The flows waiting for their first payload, oldest first.
+        buffered_bytes (int): The number of bytes currently held by the flows, see `Flow.memory_usage`.
+        out_of_order_bytes (int): The part of `buffered_bytes` waiting in the reassemblers for a gap to be filled.
+        evicted_idle (int): The number of flows evicted for being idle.
+        evicted_memory (int): The number of flows evicted to stay within `max_buffered_bytes`.
+        evicted_unidentified (int): The number of flows evicted to stay within `max_unidentified_flows`.
+
+    Methods:
+        get(connection_key): Returns the flow of a connection, or None.
+        add(connection_key, flow): Starts tracking a flow.
+        touch(connection_key, flow, now): Records a packet of the flow and updates its memory usage.
+        remove(connection_key): Stops tracking a flow and returns it.
+        expire(now): Evicts and returns the flows that have been idle for `idle_timeout` seconds.
+        enforce_budget(): Evicts and returns the oldest unidentified flows past `max_unidentified_flows`, then the
+            largest flows until the table is within `max_buffered_bytes`.
+
+    Usage:
+        - Call `touch` after every packet of a flow, then `expire` and `enforce_budget`.
+        - The caller decides what to do with evicted flows, e.g. report the messages they were parsing.
+
+    Note:
+        Touching a flow moves it to the end of `flows`, so the idle flows are always at the front and `expire`
+        only looks at the flows it evicts, plus one. The largest flow is only searched for under memory pressure,
+        and evicting it frees enough room that the search does not repeat on the following packets.
+        Every SYN starts a flow, so a SYN flood or a port scan would fill the table with flows that never carry any
+        data, they are capped separately and the oldest are evicted in constant time.
+    """
+
+    def __init__(self, idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 max_buffered_bytes: int = DEFAULT_MAX_BUFFERED_BYTES,
+                 max_unidentified_flows: int = DEFAULT_MAX_UNIDENTIFIED_FLOWS):
+        self.flows: OrderedDict[tuple, Flow] = OrderedDict()
+        self.idle_timeout = idle_timeout
+        self.max_buffered_bytes = max_buffered_bytes
+        self.max_unidentified_flows = max_unidentified_flows
+        self.unidentified: OrderedDict[tuple, Flow] = OrderedDict()
+        self.buffered_bytes = 0
+        self.out_of_order_bytes = 0
+        self.evicted_idle = 0
+        self.evicted_memory = 0
+        self.evicted_unidentified = 0
+
+    def __len__(self) -> int:
+        return len(self.flows)
+
+    def __contains__(self, connection_key: tuple) -> bool:
+        return connection_key in self.flows
+
+    def get(self, connection_key: tuple) -> Flow | None:
+        return self.flows.get(connection_key)
+
+    def add(self, connection_key: tuple, flow: Flow) -> None:
+        self.flows[connection_key] = flow
+        if not flow.identified:
+            self.unidentified[connection_key] = flow
+
+    def touch(self, connection_key: tuple, flow: Flow, now: float) -> None:
+        flow.last_seen = now
+        self.flows.move_to_end(connection_key)
+        if flow.identified and self.unidentified:
+            self.unidentified.pop(connection_key, None)
+        usage = flow.memory_usage()
+        self.buffered_bytes += usage - flow.accounted_bytes
+        flow.accounted_bytes = usage
+        out_of_order = flow.reassembler.buffered_bytes
+        self.out_of_order_bytes += out_of_order - flow.accounted_out_of_order_bytes
+        flow.accounted_out_of_order_bytes = out_of_order
+
+    def remove(self, connection_key: tuple) -> Flow | None:
+        flow = self.flows.pop(connection_key, None)
+        if flow is not None:
+            self.unidentified.pop(connection_key, None)
+            self.buffered_bytes -= flow.accounted_bytes
+            self.out_of_order_bytes -= flow.accounted_out_of_order_bytes
+        return flow
+
+    def expire(self, now: float) -> list[tuple[tuple, Flow]]:
+        expired = []
+        while self.flows:
+            connection_key, flow = next(iter(self.flows.items()))
+            if now - flow.last_seen < self.idle_timeout:
+                break
+            expired.append((connection_key, self.remove(connection_key)))
+        self.evicted_idle += len(expired)
+        return expired
+
+    def enforce_budget(self) -> list[tuple[tuple, Flow]]:
+        evicted = []
+        while len(self.unidentified) > self.max_unidentified_flows:
+            connection_key = next(iter(self.unidentified))
+            evicted.append((connection_key, self.remove(connection_key)))
+        self.evicted_unidentified += len(evicted)
+        unidentified_count = len(evicted)
+        while self.flows and self.buffered_bytes > self.max_buffered_bytes:
+            connection_key = max(self.flows, key=lambda key: self.flows[key].accounted_bytes)
+            evicted.append((connection_key, self.remove(connection_key)))
+        self.evicted_memory += len(evicted) - unidentified_count
+        return evicted
@@ -0,0 +1,106 @@
+import base64
+import json
+import sys
+import threading
+
+FIELDS = ("time", "source", "destination", "type", "info", "headers", "body_size", "body")
+DEFAULT_FIELDS = ("time", "source", "destination", "type", "info", "headers", "body_size")
+DEFAULT_FLUSH_INTERVAL = 1.0
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class JsonlWriter:
+    """
+    A class for writing completed HTTP messages as JSON Lines.
+
+    Attributes:
+        file (file): The text file the lines are written to.
+        fields (tuple): The fields written for every message, out of FIELDS.
+        methods (set | None): Only requests with these methods are written, and all responses, None for all.
+        sources (set | None): Only messages from these addresses are written, None for all.
+        destinations (set | None): Only messages to these addresses are written, None for all.
+        flush_interval (float): The file is flushed at least this often while messages are written.
+        written (int): The number of messages written.
+        lock (threading.Lock): Guards the file between the capture thread and the flushing thread.
+
+    Methods:
+        write(time, source, destination, request_type, info, body, headers): Writes a message if it matches the
+            filters, it has the signature of the `on_packet_received` callback.
+        flush(): Writes out the buffered lines.
+        close(): Flushes and stops the flushing thread, the file itself is left open.
+
+    Usage:
+        - Pass `write` as the callback of `Sniffer.sniff_packets`, and call `close` once the capture is over.
+
+    Note:
+        Lines are buffered and flushed by a background thread every `flush_interval` seconds, so a busy capture
+        does not pay for a system call per message and a quiet one still gets its lines out promptly.
+        Bodies are written as text when they are valid UTF-8, and as base64 under `body_base64` otherwise.
+    """
+
+    def __init__(self, file, fields: tuple[str, ...] = DEFAULT_FIELDS, methods: set[str] | None = None,
+                 sources: set[str] | None = None, destinations: set[str] | None = None,
+                 flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.file = file
+        self.fields = fields
+        self.methods = methods
+        self.sources = sources
+        self.destinations = destinations
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, time: float, source: str, destination: str, request_type: str, info: str, body: bytes,
+              headers: list[tuple[str, str]]) -> None:
+        if self.methods is not None and request_type != "HTTP Response" and request_type not in self.methods:
+            return
+        if self.sources is not None and source not in self.sources:
+            return
+        if self.destinations is not None and destination not in self.destinations:
+            return
+
+        values = {"time": round(time, 6), "source": source, "destination": destination, "type": request_type,
+                  "info": info, "headers": headers, "body_size": len(body)}
+        record = {field: values[field] for field in self.fields if field != "body"}
+        if "body" in self.fields:
+            try:
+                record["body"] = body.decode("utf-8")
+            except UnicodeDecodeError:
+                record["body_base64"] = base64.b64encode(body).decode("ascii")
+
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.written += 1
+
+    def flush(self) -> None:
+        with self.lock:
+            self.file.flush()
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.thread.join()
+        self.flush()
+
+    def _run(self) -> None:
+        while not self.stop_event.wait(self.flush_interval):
+            self.flush()
+
+
+def open_output(path: str | None):
+    """
+    Opens the file JSON Lines are written to, stdout when no path is given.
+
+    Returns:
+        file | None: The file, or None if it could not be opened.
+    """
+    if path is None or path == "-":
+        return sys.stdout
+    try:
+        return open(path, "a", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+    except OSError as e:
+        print(f"Error opening output file: {e}")
+        return None
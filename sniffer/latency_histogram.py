@@ -0,0 +1,104 @@
+from array import array
+
+# Every power of two is split in 2 ** (SUB_BUCKET_BITS - 1) buckets, so values are kept to within about 1.6%
+SUB_BUCKET_BITS = 6
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+HALF_SUB_BUCKET_COUNT = SUB_BUCKET_COUNT >> 1
+# Latencies are recorded in microseconds, anything above an hour lands in the last bucket
+MAX_VALUE = 3600 * 1000 * 1000
+DEFAULT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def bucket_index(value: int) -> int:
+    if value < SUB_BUCKET_COUNT:
+        return value
+    exponent = value.bit_length() - SUB_BUCKET_BITS
+    return exponent * HALF_SUB_BUCKET_COUNT + (value >> exponent)
+
+
+def bucket_value(index: int) -> int:
+    """Returns the highest value that falls in a bucket."""
+    if index < SUB_BUCKET_COUNT:
+        return index
+    exponent = index // HALF_SUB_BUCKET_COUNT - 1
+    mantissa = index - exponent * HALF_SUB_BUCKET_COUNT
+    return ((mantissa + 1) << exponent) - 1
+
+
+class LatencyHistogram:
+    """
+    A class for recording latencies in a fixed amount of memory, HDR histogram style.
+
+    Attributes:
+        counts (array): The number of values recorded in each bucket.
+        count (int): The number of values recorded.
+        total (int): The sum of the values recorded, in microseconds.
+        min_value (int): The smallest value recorded, in microseconds.
+        max_value (int): The largest value recorded, in microseconds.
+
+    Methods:
+        record(seconds): Records a latency given in seconds.
+        percentile(percentile): Returns the latency in seconds below which `percentile` percent of the values are.
+        percentiles(percentiles): Returns a dictionary of percentiles in seconds, with the count, mean and max.
+        cumulative_counts(bounds): Returns the number of values at or below each bound, given in seconds.
+
+    Note:
+        Buckets are linear within each power of two and exponential across them, so the relative error is the same
+        from microseconds to minutes and recording is a couple of integer operations into a preallocated array.
+        Percentiles can be read from another thread while values are being recorded, they are only approximate
+        until the recording thread catches up.
+    """
+
+    __slots__ = ("counts", "count", "total", "min_value", "max_value")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * (bucket_index(MAX_VALUE) + 1)))
+        self.count = 0
+        self.total = 0
+        self.min_value = 0
+        self.max_value = 0
+
+    def record(self, seconds: float) -> None:
+        value = min(max(int(seconds * 1e6), 0), MAX_VALUE)
+        self.counts[bucket_index(value)] += 1
+        if not self.count or value < self.min_value:
+            self.min_value = value
+        if value > self.max_value:
+            self.max_value = value
+        self.count += 1
+        self.total += value
+
+    def percentile(self, percentile: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, round(self.count * percentile / 100))
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return min(bucket_value(index), self.max_value) / 1e6
+        return self.max_value / 1e6
+
+    def percentiles(self, percentiles: tuple[float, ...] = DEFAULT_PERCENTILES) -> dict:
+        summary = {f"p{percentile:g}": self.percentile(percentile) for percentile in percentiles}
+        summary["count"] = self.count
+        summary["mean"] = self.total / self.count / 1e6 if self.count else 0.0
+        summary["max"] = self.max_value / 1e6
+        return summary
+
+    def cumulative_counts(self, bounds: tuple[float, ...]) -> list[int]:
+        # A bucket is counted under a bound once all of its values are, so counts are never overstated
+        limits = [int(bound * 1e6) for bound in bounds]
+        counts = [0] * len(limits)
+        seen = 0
+        position = 0
+        for index, bucket_count in enumerate(self.counts):
+            while position < len(limits) and bucket_value(index) > limits[position]:
+                counts[position] = seen
+                position += 1
+            if position == len(limits):
+                break
+            seen += bucket_count
+        for remaining in range(position, len(limits)):
+            counts[remaining] = seen
+        return counts
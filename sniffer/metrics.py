@@ -0,0 +1,91 @@
+import threading
+
+from sniffer.latency_histogram import LatencyHistogram
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# The `le` bounds histograms are exported with, in seconds
+HISTOGRAM_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 0.1, 1.0)
+
+
+class MetricsRegistry:
+    """
+    A class for collecting the metrics of a capture and rendering them in the Prometheus text format.
+
+    Attributes:
+        metrics (dict): (kind, help, label names, collect) by metric name, in registration order.
+        hooks (list): Functions called before every collection, e.g. to read counters from the kernel.
+        lock (threading.Lock): Serializes collections, so hooks never run concurrently.
+
+    Methods:
+        register(name, kind, help_text, collect, labels): Adds a metric, `collect` returns its current value.
+        on_collect(hook): Adds a function called before every collection.
+        collect(): Returns the current value of every metric by name.
+        render(): Returns every metric in the Prometheus text exposition format.
+
+    Usage:
+        - Register each metric once with a function returning its value: a number, or for labelled metrics a
+          dictionary of numbers keyed by label value tuples. Histograms return a LatencyHistogram, or a
+          dictionary of them.
+        - Call `collect` or `render` from any thread, e.g. the metrics endpoint or a periodic stats line.
+
+    Note:
+        Nothing is recorded through the registry: the capture thread keeps incrementing plain integers on
+        its own objects, and the values are only read when someone asks for them. Reading an integer or copying
+        a dictionary is atomic in CPython, so the counters need no locking and cost nothing while unobserved.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, tuple[str, str, tuple[str, ...], object]] = {}
+        self.hooks: list = []
+        self.lock = threading.Lock()
+
+    def register(self, name: str, kind: str, help_text: str, collect, labels: tuple[str, ...] = ()) -> None:
+        self.metrics[name] = (kind, help_text, labels, collect)
+
+    def on_collect(self, hook) -> None:
+        self.hooks.append(hook)
+
+    def collect(self) -> dict:
+        with self.lock:
+            for hook in self.hooks:
+                hook()
+            return {name: collect() for name, (_, _, _, collect) in self.metrics.items()}
+
+    def render(self) -> str:
+        values = self.collect()
+        lines = []
+        for name, (kind, help_text, labels, _) in self.metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            samples = values[name] if labels else {(): values[name]}
+            for label_values, value in samples.items():
+                label_pairs = [f'{label}="{escape_label(str(label_value))}"'
+                               for label, label_value in zip(labels, label_values)]
+                if kind == HISTOGRAM:
+                    lines.extend(histogram_lines(name, label_pairs, value))
+                else:
+                    lines.append(f"{name}{format_labels(label_pairs)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def format_labels(label_pairs: list[str]) -> str:
+    return "{" + ",".join(label_pairs) + "}" if label_pairs else ""
+
+
+def histogram_lines(name: str, label_pairs: list[str], histogram: LatencyHistogram) -> list[str]:
+    lines = []
+    bounds = [f"{bound:g}" for bound in HISTOGRAM_BUCKETS] + ["+Inf"]
+    counts = histogram.cumulative_counts(HISTOGRAM_BUCKETS) + [histogram.count]
+    for bound, count in zip(bounds, counts):
+        bucket_labels = format_labels(label_pairs + ['le="' + bound + '"'])
+        lines.append(f"{name}_bucket{bucket_labels} {count}")
+    lines.append(f"{name}_sum{format_labels(label_pairs)} {histogram.total / 1e6}")
+    lines.append(f"{name}_count{format_labels(label_pairs)} {histogram.count}")
+    return lines
@@ -0,0 +1,68 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sniffer.metrics import MetricsRegistry
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """
+    A class for serving the metrics of a capture over HTTP, for Prometheus to scrape.
+
+    Attributes:
+        registry (MetricsRegistry): The metrics served at /metrics.
+        thread (threading.Thread): The thread running the server.
+
+    Methods:
+        start(): Starts serving in a daemon thread.
+        close(): Stops serving and closes the listening socket.
+
+    Usage:
+        - Use `start_metrics_server`, which reports an error instead of raising when the port is taken.
+
+    Note:
+        Every scrape renders the registry from the server thread, the capture itself is never interrupted.
+        Binding to the loopback address by default keeps the traffic statistics local to the machine.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        super().__init__((host, port), MetricsRequestHandler)
+        self.registry = registry
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def close(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are periodic, logging each of them would drown the capture output
+        pass
+
+
+def start_metrics_server(registry: MetricsRegistry, port: int, host: str = "127.0.0.1") -> MetricsServer | None:
+    try:
+        server = MetricsServer(registry, host, port)
+    except OSError as e:
+        print(f"Error starting metrics server: {e}")
+        return None
+    server.start()
+    return server
@@ -0,0 +1,185 @@
+import mmap
+import struct
+import time
+
+LINKTYPE_ETHERNET = 1
+
+PCAP_MAGIC_MICROSECONDS = 0xA1B2C3D4
+PCAP_MAGIC_NANOSECONDS = 0xA1B23C4D
+PCAPNG_SECTION_HEADER = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# pcapng block types
+INTERFACE_DESCRIPTION_BLOCK = 0x00000001
+SIMPLE_PACKET_BLOCK = 0x00000003
+ENHANCED_PACKET_BLOCK = 0x00000006
+
+# pcapng interface description options
+IF_TSRESOL = 9
+IF_TSOFFSET = 14
+
+
+class PcapReader:
+    """
+    A class for streaming frames out of a pcap or pcapng capture file.
+
+    Attributes:
+        path (str): The path of the capture file.
+        file (file): The open capture file.
+        data (mmap.mmap): A read-only mapping of the file, pages are only read in as they are reached.
+        is_pcapng (bool): Whether the file is in the pcapng format.
+        endian (str): The struct byte order prefix of a pcap file.
+        resolution (float): The timestamp resolution of a pcap file in seconds.
+
+    Methods:
+        frames(stop_event, replay_speed): Yields (frame, timestamp) for every Ethernet frame of the file,
+            the timestamp is None for pcapng simple packet blocks.
+        close(): Unmaps and closes the file.
+
+    Usage:
+        - Open the file with `open_pcap` and iterate over `frames` like over a live capture ring.
+        - Pass a `replay_speed` of 1.0 to pace the frames like they were originally captured.
+
+    Note:
+        The file is never loaded as a whole: frames are memoryviews into the mapping and are only valid until the
+        next frame is requested, so anything that is kept must be copied first. Only Ethernet link types are
+        supported, frames from other interfaces are skipped.
+
+        pcap:    global header | record header  frame | record header  frame | ...
+        pcapng:  section header | interface description | enhanced packet block | ...
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "rb")
+        self.data = None
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.is_pcapng = struct.unpack_from("=I", self.data, 0)[0] == PCAPNG_SECTION_HEADER
+            if not self.is_pcapng:
+                self._read_pcap_header()
+        except BaseException:
+            # Not a capture file, or an empty one that cannot be mapped
+            self.close()
+            raise
+
+    def frames(self, stop_event, replay_speed: float = 0.0):
+        view = memoryview(self.data)
+        first_timestamp = None
+        replay_start = time.time()
+        records = self._pcapng_records() if self.is_pcapng else self._pcap_records()
+        try:
+            for offset, length, timestamp in records:
+                if stop_event.is_set():
+                    break
+
+                if replay_speed and timestamp is not None:
+                    if first_timestamp is None:
+                        first_timestamp = timestamp
+                    delay = (timestamp - first_timestamp) / replay_speed - (time.time() - replay_start)
+                    if delay > 0:
+                        time.sleep(delay)
+
+                frame = view[offset:offset + length]
+                try:
+                    yield frame, timestamp
+                finally:
+                    frame.release()
+        finally:
+            view.release()
+
+    def _read_pcap_header(self) -> None:
+        magic = struct.unpack_from("<I", self.data, 0)[0]
+        self.endian = "<" if magic in (PCAP_MAGIC_MICROSECONDS, PCAP_MAGIC_NANOSECONDS) else ">"
+        magic = struct.unpack_from(self.endian + "I", self.data, 0)[0]
+        if magic not in (PCAP_MAGIC_MICROSECONDS, PCAP_MAGIC_NANOSECONDS):
+            raise ValueError(f"{self.path} is not a pcap or pcapng file")
+        if struct.unpack_from(self.endian + "I", self.data, 20)[0] & 0x0FFFFFFF != LINKTYPE_ETHERNET:
+            raise ValueError(f"{self.path} does not contain Ethernet frames")
+        self.resolution = 1e-9 if magic == PCAP_MAGIC_NANOSECONDS else 1e-6
+
+    def _pcap_records(self):
+        resolution = self.resolution
+        record_header = struct.Struct(self.endian + "IIII")
+        offset = 24
+        end = len(self.data)
+        while offset + record_header.size <= end:
+            seconds, fraction, captured_length, _ = record_header.unpack_from(self.data, offset)
+            offset += record_header.size
+            if offset + captured_length > end:
+                # Truncated file, e.g. still being written
+                break
+            yield offset, captured_length, seconds + fraction * resolution
+            offset += captured_length
+
+    def _pcapng_records(self):
+        endian = "<"
+        # Per interface of the current section: (link type, timestamp resolution, timestamp offset)
+        interfaces = []
+        offset = 0
+        end = len(self.data)
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(endian + "I", self.data, offset)[0]
+            if block_type == PCAPNG_SECTION_HEADER:
+                byte_order = struct.unpack_from("<I", self.data, offset + 8)[0]
+                endian = "<" if byte_order == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                interfaces = []
+
+            block_length = struct.unpack_from(endian + "I", self.data, offset + 4)[0]
+            if block_length < 12 or offset + block_length > end:
+                break
+            body = offset + 8
+
+            if block_type == INTERFACE_DESCRIPTION_BLOCK:
+                link_type = struct.unpack_from(endian + "H", self.data, body)[0]
+                interfaces.append((link_type, *self._interface_options(endian, body + 8, offset + block_length - 4)))
+            elif block_type == ENHANCED_PACKET_BLOCK:
+                interface_id, high, low, captured_length = struct.unpack_from(endian + "IIII", self.data, body)
+                # A packet of an interface that was never described has no known link type, and the frame never
+                # extends past its block
+                if interface_id < len(interfaces) and interfaces[interface_id][0] == LINKTYPE_ETHERNET:
+                    _, resolution, timestamp_offset = interfaces[interface_id]
+                    yield (body + 20, min(captured_length, max(block_length - 32, 0)),
+                           ((high << 32) | low) * resolution + timestamp_offset)
+            elif block_type == SIMPLE_PACKET_BLOCK and interfaces and interfaces[0][0] == LINKTYPE_ETHERNET:
+                # No timestamp is recorded, and the frame is only as long as the block
+                original_length = struct.unpack_from(endian + "I", self.data, body)[0]
+                yield body + 4, min(original_length, block_length - 16), None
+
+            offset += block_length
+
+    def _interface_options(self, endian: str, offset: int, end: int) -> tuple[float, int]:
+        resolution, timestamp_offset = 1e-6, 0
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(endian + "HH", self.data, offset)
+            if code == 0:
+                break
+            if code == IF_TSRESOL:
+                value = self.data[offset + 4]
+                resolution = 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+            elif code == IF_TSOFFSET:
+                timestamp_offset = struct.unpack_from(endian + "q", self.data, offset + 4)[0]
+            offset += 4 + (length + 3) // 4 * 4
+        return resolution, timestamp_offset
+
+    def close(self) -> None:
+        if self.data is not None:
+            self.data.close()
+        self.file.close()
+
+
+def open_pcap(path: str) -> PcapReader | None:
+    """
+    Opens a pcap or pcapng capture file for reading.
+
+    Args:
+        path (str): The path of the capture file.
+
+    Returns:
+        PcapReader | None: The reader, or None if the file could not be opened.
+    """
+    try:
+        return PcapReader(path)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Error opening capture file: {e}")
+        return None
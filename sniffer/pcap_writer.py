@@ -0,0 +1,153 @@
+import os
+import queue
+import struct
+import threading
+import time
+
+from sniffer.pcap_reader import PCAP_MAGIC_NANOSECONDS, LINKTYPE_ETHERNET
+
+PCAP_HEADER = struct.Struct("=IHHiIII")
+RECORD_HEADER = struct.Struct("=IIII")
+SNAPLEN = 0x40000
+
+DEFAULT_MAX_FILE_BYTES = 100 * 1024 * 1024
+DEFAULT_MAX_TOTAL_BYTES = 1024 * 1024 * 1024
+DEFAULT_QUEUE_SIZE = 16384
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class PcapWriter:
+    """
+    A class for recording frames to a rotating set of pcap files with bounded disk usage.
+
+    Attributes:
+        directory (str): The directory the files are written to.
+        prefix (str): The file name prefix, files are named `<prefix>-<date>-<time>-<number>.pcap`.
+        max_file_bytes (int): A file is rotated once it grows past this size.
+        max_file_seconds (float): A file is rotated once it spans this many seconds of capture, 0 to disable.
+        max_total_bytes (int): The oldest files are deleted so that all the files together stay below this size.
+        frames (queue.Queue): Frames waiting to be written by the writer thread.
+        dropped (int): The number of frames dropped because the writer thread could not keep up, or had failed.
+        error (OSError | None): The error that stopped the recording, e.g. a full disk.
+        files (list): (path, size) of every file currently on disk, oldest first.
+
+    Methods:
+        write(frame, timestamp): Queues a frame for writing, never blocks.
+        close(): Writes the queued frames and closes the current file.
+
+    Usage:
+        - Create a writer and pass it to `Sniffer` as `pcap_writer`.
+        - Call `close` when the capture is over.
+
+    Note:
+        Frames are copied and handed to a background thread, which writes them through a large buffer. The capture
+        loop never waits for the disk: when the queue is full, frames are counted in `dropped` and discarded.
+        Files left by a previous run with the same prefix count towards the disk budget.
+        A write error stops the recording, the capture goes on: the thread keeps emptying the queue, so `close`
+        never waits on it, and every later frame is counted as dropped.
+    """
+
+    def __init__(self, directory: str, prefix: str = "capture", max_file_bytes: int = DEFAULT_MAX_FILE_BYTES,
+                 max_file_seconds: float = 0, max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+                 queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_file_bytes = max_file_bytes
+        self.max_file_seconds = max_file_seconds
+        self.max_total_bytes = max_total_bytes
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.error: OSError | None = None
+
+        os.makedirs(directory, exist_ok=True)
+        existing = [os.path.join(directory, name) for name in os.listdir(directory)
+                    if name.startswith(prefix + "-") and name.endswith(".pcap")]
+        self.files = [[path, os.path.getsize(path)] for path in sorted(existing, key=os.path.getmtime)]
+
+        self.file = None
+        self.file_start = 0.0
+        self.file_number = len(self.files)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, frame: memoryview | bytes, timestamp: float | None = None) -> None:
+        if self.error is not None:
+            self.dropped += 1
+            return
+        try:
+            self.frames.put_nowait((bytes(frame), timestamp or time.time()))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        self.frames.put(None)
+        self.thread.join()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self.frames.get(timeout=0.5)
+            except queue.Empty:
+                # Idle, make what was written so far visible on disk
+                if self.file is not None:
+                    try:
+                        self.file.flush()
+                    except OSError as e:
+                        self._stop_recording(e)
+                continue
+            if item is None:
+                break
+            if self.error is not None:
+                self.dropped += 1
+                continue
+            try:
+                self._write_record(*item)
+            except OSError as e:
+                self.dropped += 1
+                self._stop_recording(e)
+
+        self._close_file()
+
+    def _stop_recording(self, error: OSError) -> None:
+        print(f"Error writing capture file, recording stopped: {error}")
+        self.error = error
+        self._close_file()
+
+    def _close_file(self) -> None:
+        if self.file is None:
+            return
+        try:
+            self.file.close()
+        except OSError as e:
+            # The buffered frames could not be written out
+            print(f"Error closing capture file: {e}")
+        self.file = None
+
+    def _write_record(self, frame: bytes, timestamp: float) -> None:
+        if (self.file is None or self.files[-1][1] >= self.max_file_bytes
+                or (self.max_file_seconds and timestamp - self.file_start >= self.max_file_seconds)):
+            self._rotate(timestamp)
+
+        seconds = int(timestamp)
+        self.file.write(RECORD_HEADER.pack(seconds, int((timestamp - seconds) * 1e9), len(frame), len(frame)))
+        self.file.write(frame)
+        self.files[-1][1] += RECORD_HEADER.size + len(frame)
+
+    def _rotate(self, timestamp: float) -> None:
+        self._close_file()
+
+        # Make room for a full new file, deleting the oldest ones first
+        while self.files and sum(size for _, size in self.files) + self.max_file_bytes > self.max_total_bytes:
+            oldest, _ = self.files.pop(0)
+            try:
+                os.remove(oldest)
+            except OSError as e:
+                print(f"Error deleting old capture file: {e}")
+
+        self.file_number += 1
+        name = f"{self.prefix}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(timestamp))}-{self.file_number:05d}.pcap"
+        path = os.path.join(self.directory, name)
+        self.file = open(path, "wb", buffering=WRITE_BUFFER_SIZE)
+        self.file.write(PCAP_HEADER.pack(PCAP_MAGIC_NANOSECONDS, 2, 4, 0, 0, SNAPLEN, LINKTYPE_ETHERNET))
+        self.file_start = timestamp
+        self.files.append([path, PCAP_HEADER.size])
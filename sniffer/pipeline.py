@@ -0,0 +1,133 @@
+import threading
+
+from sniffer.metrics import COUNTER, GAUGE
+from sniffer.sniffer import Sniffer
+from sniffer.stage_queue import StageQueue, BLOCK, DEFAULT_QUEUE_SIZE
+
+
+class Pipeline:
+    """
+    A class for running the capture, the parsers and the output callback of a Sniffer as separate stages.
+
+    Attributes:
+        sniffer (Sniffer): Reads the frames and owns the parsers and the flow state.
+        packets (StageQueue): The captured (frame, timestamp) pairs waiting for the parse stage.
+        messages (StageQueue): The completed messages waiting for the output stage.
+        captured (int): The number of frames read by the capture stage.
+        parsed (int): The number of frames processed by the parse stage.
+        delivered (int): The number of messages passed to the output callback.
+        metrics (MetricsRegistry): The metrics of the sniffer, with the queues of every stage added.
+
+    Methods:
+        capture(stop_event): The capture stage, reads frames into `packets` until stopped.
+        parse(): The parse stage, feeds `packets` through the sniffer into `messages`.
+        sniff_packets(stop_event, on_packet_received): Runs the stages, the output callback runs in the caller.
+        latency_report(): Returns the latency percentiles of the sniffer.
+        register_metrics(): Registers the counters and queue depths of every stage in `metrics`.
+        stats(): Returns the counters and queue statistics of every stage.
+        summary(): Returns the statistics as a single line of text.
+
+    Usage:
+        - Wrap a `Sniffer` and call `sniff_packets` exactly like `Sniffer.sniff_packets`.
+        - Pick the overload `policy` of the queues: BLOCK never loses anything but lets the kernel drop frames
+          once the queues are full, DROP_NEWEST and DROP_OLDEST keep the socket drained and count what they drop.
+
+    Note:
+        The capture stage does nothing but read and copy frames, so a slow parser or output callback no longer
+        keeps it from the socket, and bursts are absorbed by the queues instead of the kernel buffer.
+        The flow state is only touched by the parse stage, so there is no locking around the parsers.
+        The stages are threads, the socket reads release the GIL while waiting; to spread the parsing over
+        several cores, capture with several workers (`FanoutCapture`) instead.
+        Every frame is copied into the queue, which gives up the zero-copy ring and batch receive paths, and the
+        handoffs cost more than they save on steady traffic: replaying the benchmark scenarios is 2-15% slower
+        than processing inline, so the pipeline is only worth it for bursts or a slow output callback.
+    """
+
+    def __init__(self, sniffer: Sniffer, queue_size: int = DEFAULT_QUEUE_SIZE, policy: str = BLOCK):
+        self.sniffer = sniffer
+        self.packets = StageQueue("parse", queue_size, policy)
+        self.messages = StageQueue("output", queue_size, policy)
+        self.captured = 0
+        self.parsed = 0
+        self.delivered = 0
+        self.metrics = sniffer.metrics
+        self.register_metrics()
+
+    def capture(self, stop_event) -> None:
+        put = self.packets.put
+        try:
+            for frame, timestamp in self.sniffer.frames(stop_event):
+                # Copied, the frame may be a view into a ring block or a receive buffer that is about to be reused
+                put((bytes(frame), timestamp))
+                self.captured += 1
+        finally:
+            self.packets.close()
+
+    def parse(self) -> None:
+        put = self.messages.put
+        process_ip_packet = self.sniffer.process_ip_packet
+
+        def on_packet_received(*record):
+            put(record)
+
+        try:
+            while (batch := self.packets.get_batch(timeout=0.1)) is not None:
+                for frame, timestamp in batch:
+                    process_ip_packet(frame, on_packet_received, timestamp)
+                self.parsed += len(batch)
+        finally:
+            self.messages.close()
+
+    def sniff_packets(self, stop_event, on_packet_received):
+        print("Starting sniffing...")
+        stages = [threading.Thread(target=self.capture, args=(stop_event,), name="capture", daemon=True),
+                  threading.Thread(target=self.parse, name="parse", daemon=True)]
+        for stage in stages:
+            stage.start()
+
+        try:
+            while (batch := self.messages.get_batch(timeout=0.1)) is not None:
+                for record in batch:
+                    on_packet_received(*record)
+                self.delivered += len(batch)
+        except KeyboardInterrupt:
+            print("Sniffing stopped")
+        finally:
+            # Also reached when the callback fails, the other stages must not be left waiting on a full queue
+            stop_event.set()
+            self.packets.close()
+            self.messages.close()
+            for stage in stages:
+                stage.join(1)
+            print(self.summary())
+
+    def latency_report(self) -> str:
+        return self.sniffer.latency_report()
+
+    def register_metrics(self) -> None:
+        def by_stage(key: str) -> dict:
+            return {(queue.name,): queue.stats()[key] for queue in (self.packets, self.messages)}
+
+        self.metrics.register("sniffer_stage_items_total", COUNTER, "Items handled by each pipeline stage.",
+                              lambda: {("capture",): self.captured, ("parse",): self.parsed,
+                                       ("output",): self.delivered}, ("stage",))
+        self.metrics.register("sniffer_queue_depth", GAUGE, "Items waiting in front of each pipeline stage.",
+                              lambda: by_stage("depth"), ("stage",))
+        self.metrics.register("sniffer_queue_high_water", GAUGE, "Most items ever waiting in front of each stage.",
+                              lambda: by_stage("high_water"), ("stage",))
+        self.metrics.register("sniffer_queue_dropped_total", COUNTER, "Items dropped by the overload policy.",
+                              lambda: by_stage("dropped"), ("stage",))
+        self.metrics.register("sniffer_queue_blocked_total", COUNTER, "Times a stage waited for room in the queue.",
+                              lambda: by_stage("blocked"), ("stage",))
+
+    def stats(self) -> dict:
+        return {"capture": {"frames": self.captured},
+                "parse": {"frames": self.parsed, **self.packets.stats()},
+                "output": {"messages": self.delivered, **self.messages.stats()}}
+
+    def summary(self) -> str:
+        parse, output = self.packets.stats(), self.messages.stats()
+        return (f"Captured {self.captured} frames, parsed {self.parsed} "
+                f"(dropped {parse['dropped']}, blocked {parse['blocked']}, high water {parse['high_water']}), "
+                f"delivered {self.delivered} messages "
+                f"(dropped {output['dropped']}, blocked {output['blocked']}, high water {output['high_water']})")
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+from parsers.http_parser import classify_http_data, HTTP, NOT_HTTP
+
+# Seconds a verdict is trusted for, a stream rejected in the middle of a message gets another look after this long
+DEFAULT_VERDICT_TIMEOUT = 30.0
+# Verdicts past this many push out the oldest ones
+DEFAULT_MAX_VERDICTS = 262144
+# Ports whose streams are expected to be HTTP, a segment from the middle of one of their messages does not
+# get the whole connection rejected
+DEFAULT_HTTP_PORTS = (80, 3000, 5000, 8000, 8008, 8080, 8888)
+
+
+class ProtocolClassifier:
+    """
+    A class for deciding which TCP streams carry HTTP, remembering the streams that do not.
+
+    Attributes:
+        port_hints (dict): HTTP or NOT_HTTP by port, for the streams with either port in it.
+        verdict_timeout (float): Seconds a cached verdict is trusted for.
+        max_verdicts (int): The number of verdicts cached at most.
+        verdicts (OrderedDict): (verdict, expiry time) by connection key, oldest first.
+        cache_hits (int): The number of segments rejected by a cached verdict.
+
+    Methods:
+        classify(connection_key, source_port, dest_port, data, now): Returns the verdict on a segment of a stream
+            that has no flow, caching it when the stream is rejected.
+        reject(connection_key, now): Caches a NOT_HTTP verdict, e.g. for a stream the HTTP parser gave up on.
+        forget(connection_key): Drops the verdict of a connection, e.g. on a SYN starting a new one.
+        port_hint(source_port, dest_port): Returns the hint for a stream's ports, HTTP, NOT_HTTP or None.
+
+    Usage:
+        - Call `classify` for the segments of streams that are not tracked, and only track them on HTTP.
+          UNDECIDED means the segment is too short to tell, the HTTP parser is left to decide.
+        - Check `port_hint` on a SYN, before tracking a connection whose first bytes are yet to come.
+
+    Note:
+        The first byte of a stream selects the few tokens it could start with, so TLS, database and other binary
+        streams are rejected by a single lookup and nothing is copied. A rejected stream is cached, its following
+        segments cost one dictionary lookup until the verdict expires. A stream on an HTTP port is not cached
+        when a segment is rejected, it is most likely in the middle of a body and the next message will be seen.
+        Every verdict lives equally long, so the oldest ones are always at the front of `verdicts`.
+    """
+
+    def __init__(self, port_hints: dict[int, int] | None = None, verdict_timeout: float = DEFAULT_VERDICT_TIMEOUT,
+                 max_verdicts: int = DEFAULT_MAX_VERDICTS):
+        self.port_hints = dict.fromkeys(DEFAULT_HTTP_PORTS, HTTP) if port_hints is None else port_hints
+        self.verdict_timeout = verdict_timeout
+        self.max_verdicts = max_verdicts
+        self.verdicts: OrderedDict[tuple, tuple[int, float]] = OrderedDict()
+        self.cache_hits = 0
+
+    def __len__(self) -> int:
+        return len(self.verdicts)
+
+    def classify(self, connection_key: tuple, source_port: int, dest_port: int, data: bytes, now: float) -> int:
+        cached = self.verdicts.get(connection_key)
+        if cached is not None:
+            if now < cached[1]:
+                self.cache_hits += 1
+                return cached[0]
+            del self.verdicts[connection_key]
+
+        hint = self.port_hint(source_port, dest_port)
+        if hint == NOT_HTTP:
+            self.reject(connection_key, now)
+            return NOT_HTTP
+
+        verdict = classify_http_data(data)
+        if verdict == NOT_HTTP and hint != HTTP:
+            self.reject(connection_key, now)
+        return verdict
+
+    def reject(self, connection_key: tuple, now: float) -> None:
+        self.verdicts.pop(connection_key, None)
+        self.verdicts[connection_key] = (NOT_HTTP, now + self.verdict_timeout)
+        while self.verdicts:
+            oldest_key, (_, expiry) = next(iter(self.verdicts.items()))
+            if expiry > now and len(self.verdicts) <= self.max_verdicts:
+                break
+            del self.verdicts[oldest_key]
+
+    def forget(self, connection_key: tuple) -> None:
+        self.verdicts.pop(connection_key, None)
+
+    def port_hint(self, source_port: int, dest_port: int) -> int | None:
+        return self.port_hints.get(dest_port, self.port_hints.get(source_port))
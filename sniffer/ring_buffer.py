@@ -0,0 +1,152 @@
+import mmap
+import select
+import socket
+import struct
+
+# Constants from <linux/if_packet.h>, the socket module does not expose them
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+# struct tpacket_req3: block_size, block_nr, frame_size, frame_nr, retire_blk_tov, sizeof_priv, feature_req_word
+TPACKET_REQ3 = struct.Struct("=7I")
+
+# struct tpacket_block_desc: version, offset_to_priv, then tpacket_hdr_v1:
+# block_status, num_pkts, offset_to_first_pkt, ...
+BLOCK_DESC = struct.Struct("=IIIII")
+
+# struct tpacket3_hdr: next_offset, sec, nsec, snaplen, len, status, mac, net
+TPACKET3_HDR = struct.Struct("=IIIIIIHH")
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+DEFAULT_BLOCK_COUNT = 64
+DEFAULT_FRAME_SIZE = 1 << 11
+DEFAULT_RETIRE_TIMEOUT_MS = 60
+
+
+class RingBuffer:
+    """
+    A class for reading frames from a TPACKET_V3 memory-mapped receive ring.
+
+    Attributes:
+        raw_socket (socket.socket): The AF_PACKET socket the ring is attached to.
+        block_size (int): The size of a single ring block in bytes.
+        block_count (int): The number of blocks in the ring.
+        ring (mmap.mmap): The memory mapping shared with the kernel.
+        poller (select.poll): Used to wait for the kernel to retire a block.
+        current_block (int): Index of the next block to be read.
+
+    Methods:
+        frames(stop_event, poll_timeout_ms): Yields (frame, timestamp) for every captured frame.
+        close(): Unmaps the ring.
+
+    Usage:
+        - Create the ring with `create_rx_ring` on an AF_PACKET socket.
+        - Iterate over `frames` until the stop event is set.
+
+    Note:
+        The kernel fills whole blocks of frames and hands them over by setting TP_STATUS_USER in the block
+        descriptor. A block is read in one pass without any syscall, then handed back by writing TP_STATUS_KERNEL.
+        The yielded frames are memoryviews into the ring and are only valid until the next frame is requested,
+        so anything that is kept must be copied first:
+
+        block descriptor | tpacket3_hdr  frame | tpacket3_hdr  frame | ... (linked by tp_next_offset)
+    """
+
+    def __init__(self, raw_socket: socket.socket, block_size: int, block_count: int):
+        self.raw_socket = raw_socket
+        self.block_size = block_size
+        self.block_count = block_count
+        self.ring = mmap.mmap(raw_socket.fileno(), block_size * block_count,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        self.poller = select.poll()
+        self.poller.register(raw_socket.fileno(), select.POLLIN | select.POLLERR)
+        self.current_block = 0
+
+    def frames(self, stop_event, poll_timeout_ms: int = 100):
+        view = memoryview(self.ring)
+        try:
+            while not stop_event.is_set():
+                block_offset = self.current_block * self.block_size
+                _, _, block_status, num_packets, first_offset = BLOCK_DESC.unpack_from(self.ring, block_offset)
+
+                if not block_status & TP_STATUS_USER:
+                    # Wake up periodically so the stop event is honoured on an idle link
+                    self.poller.poll(poll_timeout_ms)
+                    continue
+
+                frame_offset = block_offset + first_offset
+                for _ in range(num_packets):
+                    next_offset, sec, nsec, snaplen, _, _, mac, _ = TPACKET3_HDR.unpack_from(self.ring, frame_offset)
+                    frame = view[frame_offset + mac:frame_offset + mac + snaplen]
+                    try:
+                        yield frame, sec + nsec / 1e9
+                    finally:
+                        frame.release()
+                    frame_offset += next_offset
+
+                # Give the block back to the kernel
+                struct.pack_into("=I", self.ring, block_offset + 8, TP_STATUS_KERNEL)
+                self.current_block = (self.current_block + 1) % self.block_count
+        finally:
+            view.release()
+
+    def close(self) -> None:
+        self.poller.unregister(self.raw_socket.fileno())
+        self.ring.close()
+
+
+def create_rx_ring(raw_socket: socket.socket, block_size: int = DEFAULT_BLOCK_SIZE,
+                   block_count: int = DEFAULT_BLOCK_COUNT,
+                   retire_timeout_ms: int = DEFAULT_RETIRE_TIMEOUT_MS) -> RingBuffer | None:
+    """
+    Switches an AF_PACKET socket to TPACKET_V3 and maps a receive ring into the process.
+
+    Args:
+        raw_socket (socket.socket): The AF_PACKET socket to attach the ring to.
+        block_size (int): Block size in bytes, must be a multiple of the page size.
+        block_count (int): Number of blocks in the ring.
+        retire_timeout_ms (int): How long the kernel waits before handing over a partially filled block.
+
+    Returns:
+        RingBuffer | None: The mapped ring, or None if the kernel refused the configuration.
+    """
+    error = ring_layout_error(block_size, block_count)
+    if error is not None:
+        print(error)
+        return None
+
+    frame_count = block_size // DEFAULT_FRAME_SIZE * block_count
+    try:
+        raw_socket.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        raw_socket.setsockopt(SOL_PACKET, PACKET_RX_RING,
+                              TPACKET_REQ3.pack(block_size, block_count, DEFAULT_FRAME_SIZE, frame_count,
+                                                retire_timeout_ms, 0, 0))
+        return RingBuffer(raw_socket, block_size, block_count)
+    except OSError as e:
+        print(f"Error creating packet ring: {e}")
+        return None
+
+
+def ring_layout_error(block_size: int, block_count: int) -> str | None:
+    """
+    Checks a ring layout against the rules of the kernel.
+
+    Args:
+        block_size (int): Block size in bytes.
+        block_count (int): Number of blocks in the ring.
+
+    Returns:
+        str | None: Which rule the layout breaks, or None if the kernel accepts it.
+    """
+    if block_size <= 0 or block_size % mmap.PAGESIZE:
+        return f"Ring block size must be a positive multiple of the page size ({mmap.PAGESIZE} bytes), got {block_size}"
+    if block_size % DEFAULT_FRAME_SIZE:
+        return f"Ring block size must be a multiple of the frame size ({DEFAULT_FRAME_SIZE} bytes), got {block_size}"
+    if block_count <= 0:
+        return f"Ring block count must be positive, got {block_count}"
+    return None
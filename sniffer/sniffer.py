@@ -1,13 +1,40 @@
 import socket
-import heapq
+import select
+import struct
 import time
 
 from parsers.ethernet_parser import EthernetHeader
 from parsers.ip_parser import IPHeader
 from parsers.ipv6_parser import IPv6Header
 from parsers.tcp_parser import TCPHeader
-from parsers.http_parser import HttpParser, is_http_data
+from parsers.http_parser import HttpParser, classify_http_data, HTTP, NOT_HTTP, DEFAULT_MAX_BODY_SIZE
 from parsers.info_http import InfoHTTP
+from sniffer.batch_receiver import BatchReceiver, DEFAULT_SLOT_SIZE, SO_TIMESTAMPNS, TIMESPEC, capture_timestamp
+from sniffer.bpf_filter import compile_filter, attach_filter
+from sniffer.flow import Flow
+from sniffer.flow_table import FlowTable, DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_BUFFERED_BYTES
+from sniffer.latency_histogram import LatencyHistogram
+from sniffer.metrics import MetricsRegistry, COUNTER, GAUGE, HISTOGRAM
+from sniffer.tcp_reassembler import TcpReassembler
+from sniffer.transaction_tracker import TransactionTracker
+from sniffer.pcap_reader import open_pcap
+from sniffer.protocol_classifier import ProtocolClassifier
+from sniffer.ring_buffer import (SOL_PACKET, create_rx_ring, DEFAULT_BLOCK_SIZE, DEFAULT_BLOCK_COUNT,
+                                 DEFAULT_RETIRE_TIMEOUT_MS)
+
+# Constants from <linux/if_packet.h>
+PACKET_FANOUT = 18
+PACKET_FANOUT_HASH = 0
+PACKET_FANOUT_FLAG_DEFRAG = 0x8000
+PACKET_STATISTICS = 6
+
+# struct tpacket_stats, the TPACKET_V3 version appends a counter that is not needed here
+PACKET_STATS = struct.Struct("=II")
+
+ETHERNET_TYPE_NAMES = {0x0800: "ipv4", 0x86DD: "ipv6", 0x0806: "arp"}
+
+# Frames of a flow held back from an HTTP-only recording until the flow is identified, enough for the handshake
+MAX_HELD_FRAMES = 8
 
 
 class Sniffer:
@@ -16,118 +43,463 @@ class Sniffer:
 
     Attributes:
         start_time (float): The time when the sniffer started.
-        tcp_buffers (dict): Buffers to hold packets for each TCP connection, using min-heaps.
-        next_expected_seq (dict): Dictionary to track the next expected sequence number for each TCP connection.
-        tcp_http_parser (dict): Dictionary holding an HTTP parser for each TCP connection.
+        flows (FlowTable): The state of each TCP connection, evicted when idle or over the memory budget.
+        classifier (ProtocolClassifier): Decides which untracked streams are HTTP, and caches those that are not.
+        transactions (TransactionTracker): Matches responses to requests and keeps latency histograms per endpoint.
+        max_body_size (int): The number of body bytes kept per HTTP message, longer bodies are truncated.
         raw_socket (socket.socket): The raw socket used for capturing packets.
+        filter_program (list): The classic BPF program attached to the raw socket.
+        ring (RingBuffer | None): The TPACKET_V3 receive ring, only set when capturing with `use_ring`.
+        batch_receiver (BatchReceiver | None): Receives frames into preallocated buffers, only set with `batch_size`.
+        pcap_reader (PcapReader | None): The capture file frames are read from instead of a socket.
+        replay_speed (float): Pacing of the capture file replay, 1.0 for the original speed and 0 for no pacing.
+        pcap_writer (PcapWriter | None): Records the captured frames to rotating pcap files.
+        record_http_only (bool): Only record the frames of HTTP flows instead of every captured frame.
+        packets_by_type, bytes_by_type (dict): The number of frames and bytes processed, by ethernet type.
+        kernel_packets, kernel_drops (int): The frames the kernel received and dropped for the socket.
+        short_frames (int): The number of frames skipped because they were too short for their headers.
+        gaps_skipped, gap_bytes (int): The holes in TCP streams given up on, and the bytes they were missing.
+        requests_completed, responses_completed (int): The number of HTTP messages parsed.
+        parse_errors (int): The number of flows dropped because their stream could not be parsed.
+        truncated_bodies (int): The number of messages whose body was longer than `max_body_size`.
+        processing_time (LatencyHistogram): The time spent processing each frame.
+        metrics (MetricsRegistry): Reads all of the above, for the metrics endpoint and the stats line.
 
     Methods:
-        process_tcp_packet(ip, tcp, on_packet_received): Processes a single TCP packet.
-        process_ip_packet(raw_data, on_packet_received): Processes a single IP packet.
+        process_tcp_packet(ip, tcp, on_packet_received, timestamp): Processes a single TCP packet.
+        report_messages(connection_key, flow, on_packet_received, timestamp): Reports the completed messages of a flow.
+        record_frame(connection_key, flow, frame, timestamp): Records a frame of an HTTP flow, with its handshake.
+        create_parser(connection_key): Returns a new HTTP parser for a flow, knowing the requests it answers.
+        skip_gap(connection_key, flow, on_packet_received, timestamp): Drops the parser of a flow that lost data.
+        close_flow(connection_key, flow, on_packet_received, timestamp): Reports what a flow parsed and forgets it.
+        latency_report(): Returns the latency percentiles of every endpoint seen so far as text.
+        register_metrics(): Registers the counters of the sniffer, its flows and its transactions in `metrics`.
+        update_kernel_statistics(): Adds the kernel's frame and drop counters of the socket since the last call.
+        process_ip_packet(raw_data, on_packet_received, timestamp): Processes a single IP packet.
+        frames(stop_event): Yields the captured (frame, timestamp) pairs, whatever they are read from.
         sniff_packets(stop_event, on_packet_received): Main loop for sniffing packets.
 
     Usage:
-        - Initialize the Sniffer class, specifying whether to capture IPv4 or IPv6 traffic.
+        - Initialize the Sniffer class, by default both IPv4 and IPv6 traffic is captured on a single socket.
+          Pass `is_ipv6` to only capture one of the families.
+        - Pass a `filter_expression` (e.g. "port 80 or port 8080") to drop unwanted traffic in the kernel.
+        - Pass `use_ring=True` to read frames from a memory-mapped ring instead of one `recvfrom` per frame.
+        - Otherwise, pass a `batch_size` to receive frames in batches into preallocated buffers.
+        - Pass a `pcap_file` to replay a pcap or pcapng capture instead, no socket (and no root) is needed.
+        - Pass a `pcap_writer` to record the raw frames, or only those of HTTP flows with `record_http_only`.
+        - Pass `port_hints` ({port: HTTP or NOT_HTTP}) to tell the classifier what runs on which ports.
+        - Pass a `fanout_group` to share the traffic with other sockets of the group, each flow going to one socket.
         - Call `sniff_packets` to start the packet sniffing process.
         - Processed packet data is provided to a callback function for further handling.
 
     Note:
         This sniffer is designed to work with both IPv4 and IPv6 packets and focuses on TCP and HTTP protocols.
-        It handles out-of-order TCP packets and reassembles HTTP messages.
+        It handles out-of-order, overlapping and retransmitted TCP packets and reassembles HTTP messages.
+        A connection keeps its parser for as long as it is open, so keep-alive and pipelined messages are
+        all reported, and it is dropped on FIN, RST, after `idle_timeout` seconds without traffic, or when the
+        flows together buffer more than `max_buffered_bytes`, the largest one first.
     """
 
-    def __init__(self, is_ipv6=False):
+    def __init__(self, is_ipv6=None, filter_expression="", use_ring=False, block_size=DEFAULT_BLOCK_SIZE,
+                 block_count=DEFAULT_BLOCK_COUNT, retire_timeout_ms=DEFAULT_RETIRE_TIMEOUT_MS, batch_size=0,
+                 slot_size=DEFAULT_SLOT_SIZE, fanout_group=None, pcap_file=None, replay_speed=0.0, pcap_writer=None,
+                 record_http_only=False, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_buffered_bytes=DEFAULT_MAX_BUFFERED_BYTES, max_body_size=DEFAULT_MAX_BODY_SIZE, port_hints=None):
         self.start_time = time.time()
 
-        # This dictionary will hold the packets for each TCP connection in a min-heap
-        # The keys will be (source_ip, dest_ip, source_port, dest_port) tuples
-        self.tcp_buffers = {}
+        # The state of each TCP connection: the reassembler of its payloads and its HTTP parser,
+        # by (source_ip, dest_ip, source_port, dest_port) tuples
+        self.flows = FlowTable(idle_timeout, max_buffered_bytes)
+
+        # Remembers the streams that are not HTTP, so their packets are dropped with a single lookup
+        self.classifier = ProtocolClassifier(port_hints)
+
+        # Requests waiting for their responses and the latency histograms of each endpoint
+        self.transactions = TransactionTracker()
+        self.max_body_size = max_body_size
+
+        self.raw_socket = None
+        self.filter_program = []
+        self.ring = None
+        self.batch_receiver = None
+        self.pcap_reader = None
+        self.replay_speed = replay_speed
+        self.pcap_writer = pcap_writer
+        self.record_http_only = record_http_only and pcap_writer is not None
 
-        # This dictionary will hold the next expected sequence number for each TCP connection
-        self.next_expected_seq = {}
+        self.packets_by_type: dict[int, int] = {}
+        self.bytes_by_type: dict[int, int] = {}
+        self.kernel_packets = 0
+        self.kernel_drops = 0
+        self.short_frames = 0
+        self.gaps_skipped = 0
+        self.gap_bytes = 0
+        self.requests_completed = 0
+        self.responses_completed = 0
+        self.parse_errors = 0
+        self.truncated_bodies = 0
+        self.processing_time = LatencyHistogram()
+        self.metrics = MetricsRegistry()
+        self.register_metrics()
 
-        # This dictionary will hold the HTTP parser for each connection
-        self.tcp_http_parser = {}
+        if pcap_file is not None:
+            self.pcap_reader = open_pcap(pcap_file)
+            if self.pcap_reader is None:
+                print("Could not open capture file, aborting...")
+                exit(0)
+            return
 
-        self.raw_socket = create_ipv6_raw_socket() if is_ipv6 else create_ipv4_raw_socket()
+        if is_ipv6 is None:
+            self.raw_socket = create_raw_socket()
+        else:
+            self.raw_socket = create_ipv6_raw_socket() if is_ipv6 else create_ipv4_raw_socket()
         if self.raw_socket is None:
             print("Could not create socket, aborting...")
             exit(0)
 
-    def process_tcp_packet(self, ip: IPHeader | IPv6Header, tcp: TCPHeader, on_packet_received):
-        connection_key = (ip.source, ip.dest, tcp.source_port, tcp.dest_port)
+        # Even without an expression, only TCP frames are copied to userspace
+        try:
+            self.filter_program = compile_filter(filter_expression)
+        except ValueError as e:
+            print(f"Invalid filter expression: {e}")
+            exit(0)
+        if not attach_filter(self.raw_socket, self.filter_program):
+            print("Could not attach socket filter, aborting...")
+            exit(0)
+
+        if use_ring:
+            self.ring = create_rx_ring(self.raw_socket, block_size, block_count, retire_timeout_ms)
+            if self.ring is None:
+                print("Could not create packet ring, aborting...")
+                exit(0)
+
+        if batch_size and not use_ring:
+            self.batch_receiver = BatchReceiver(self.raw_socket, batch_size, slot_size)
+        elif not use_ring:
+            # Every frame is stamped by the kernel, the ring and the batch receiver have their own timestamps
+            try:
+                self.raw_socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+            except socket.error as e:
+                print(f"Error enabling capture timestamps: {e}")
 
-        # Initialize buffer and sequence tracking for a new connection
-        if connection_key not in self.tcp_buffers:
+        # Joined last, the kernel only starts spreading flows once the socket is fully set up
+        if fanout_group is not None and not join_fanout_group(self.raw_socket, fanout_group):
+            print("Could not join fanout group, aborting...")
+            exit(0)
+
+    def process_tcp_packet(self, ip: IPHeader | IPv6Header, tcp: TCPHeader, on_packet_received,
+                           timestamp: float | None = None):
+        connection_key = (ip.source, ip.dest, tcp.source_port, tcp.dest_port)
+        payload = tcp.payload
+        flow = self.flows.get(connection_key)
+        now = timestamp or time.time()
 
-            if not is_http_data(tcp.payload):
+        if tcp.flag_syn:
+            # A new connection, possibly reusing the ports of an old one: the SYN gives the initial sequence number
+            # and the stream is identified by its first bytes, whatever order they arrive in
+            if flow is not None and not flow.identified:
+                # Retransmitted SYN, no data has been seen yet
+                flow.reassembler.on_syn(tcp.sequence)
+            else:
+                if flow is not None:
+                    self.close_flow(connection_key, flow, on_packet_received, now)
+                self.classifier.forget(connection_key)
+                if self.classifier.port_hint(tcp.source_port, tcp.dest_port) == NOT_HTTP:
+                    # Never HTTP, the connection is not even tracked
+                    return
+                # The parser is only created with the first payload, most connections of a busy host are not HTTP
+                flow = Flow(TcpReassembler(tcp.sequence + 1), identified=False)
+                self.flows.add(connection_key, flow)
+        elif flow is None:
+            # Picked up in the middle of a connection, only from the start of an HTTP message
+            if not payload:
                 return
+            if self.classifier.classify(connection_key, tcp.source_port, tcp.dest_port, payload, now) == NOT_HTTP:
+                if tcp.flag_fin or tcp.flag_rst:
+                    self.classifier.forget(connection_key)
+                return
+            flow = Flow(TcpReassembler(tcp.sequence))
+            self.flows.add(connection_key, flow)
 
-            self.tcp_buffers[connection_key] = []
-            self.next_expected_seq[connection_key] = tcp.sequence + len(tcp.payload)
-            self.tcp_http_parser[connection_key] = HttpParser(InfoHTTP())
-            self.tcp_http_parser[connection_key].feed_data(tcp.payload)
-        else:
-            # We have already seen this connection
-            # Check if the packet is the next expected one
-            if tcp.sequence == self.next_expected_seq[connection_key]:
-                # Process the packet
-                self.tcp_http_parser[connection_key].feed_data(tcp.payload)
-
-                # Update the expected sequence number
-                self.next_expected_seq[connection_key] += len(tcp.payload)
-
-                # Check the buffer for the next packets
-                while (self.tcp_buffers[connection_key] and
-                       self.tcp_buffers[connection_key][0][0] <= self.next_expected_seq[connection_key]):
-
-                    # Handles retransmission
-                    if self.tcp_buffers[connection_key][0][0] < self.next_expected_seq[connection_key]:
-                        heapq.heappop(self.tcp_buffers[connection_key])
-                        continue
-
-                    _, buffered_payload = heapq.heappop(self.tcp_buffers[connection_key])
-                    self.tcp_http_parser[connection_key].feed_data(buffered_payload)
-                    self.next_expected_seq[connection_key] += len(buffered_payload)
+        data = flow.reassembler.add(tcp.sequence, payload, now)
+        if data is not None and flow.reassembler.last_gap:
+            self.skip_gap(connection_key, flow, on_packet_received, now)
+        if data is not None and flow.resynchronizing:
+            # Only a segment starting a message gets the parser going again, the rest of the cut message is lost
+            if classify_http_data(data) == HTTP:
+                flow.resynchronizing = False
             else:
-                # Add out-of-order packet to the buffer
-                heapq.heappush(self.tcp_buffers[connection_key], (tcp.sequence, tcp.payload))
+                data = None
+        if data is not None:
+            if not flow.identified:
+                # The real start of the stream, its verdict holds for the whole connection
+                if self.classifier.classify(connection_key, tcp.source_port, tcp.dest_port, data, now) == NOT_HTTP:
+                    self.flows.remove(connection_key)
+                    self.classifier.reject(connection_key, now)
+                    return
+                flow.identified = True
+            if flow.http_parser is None:
+                flow.http_parser = self.create_parser(connection_key)
+            flow.http_parser.feed_data(data, now)
+
+        self.flows.touch(connection_key, flow, now)
 
-        if tcp.flag_fin == 0x1 or self.tcp_http_parser[connection_key].is_message_complete:
-            info_http: InfoHTTP = self.tcp_http_parser[connection_key].info_http
+        if self.record_http_only:
+            # The TCP header was decoded from a view over the whole frame
+            self.record_frame(connection_key, flow, tcp.raw_data, timestamp)
 
-            request_type = info_http.http_method if info_http.is_request() else "HTTP Response"
-            on_packet_received(time.time() - self.start_time, connection_key[0], connection_key[1], request_type,
-                               str(info_http.status_code) + " " + info_http.status_message
-                               if not info_http.is_request() else "HTTP Request",
+        # Connections stay open across keep-alive requests, they are only dropped once closed, idle or too large
+        if tcp.flag_fin or tcp.flag_rst:
+            self.close_flow(connection_key, flow, on_packet_received, now)
+        else:
+            self.report_messages(connection_key, flow, on_packet_received, now)
+            if flow.http_parser is not None and flow.http_parser.error:
+                self.parse_errors += 1
+                self.flows.remove(connection_key)
+                self.classifier.reject(connection_key, now)
+
+        for evicted_key, evicted_flow in self.flows.expire(now) + self.flows.enforce_budget():
+            self.close_flow(evicted_key, evicted_flow, on_packet_received, now)
+
+    def record_frame(self, connection_key: tuple, flow: Flow, frame: memoryview, timestamp: float | None):
+        # The handshake comes before the first bytes tell whether the stream is HTTP, it is held back until then
+        if not flow.identified:
+            if flow.held_frames is None:
+                flow.held_frames = []
+            if len(flow.held_frames) < MAX_HELD_FRAMES:
+                flow.held_frames.append((bytes(frame), timestamp))
+            return
+        source, dest, source_port, dest_port = connection_key
+        reverse_flow = self.flows.get((dest, source, dest_port, source_port))
+        if flow.held_frames or (reverse_flow is not None and reverse_flow.held_frames):
+            # Both directions of the handshake are recorded once either of them is identified
+            held_frames = flow.held_frames or []
+            if reverse_flow is not None and reverse_flow.held_frames:
+                held_frames += reverse_flow.held_frames
+                reverse_flow.held_frames = None
+            flow.held_frames = None
+            for held_frame, held_timestamp in sorted(held_frames, key=lambda item: item[1] or 0.0):
+                self.pcap_writer.write(held_frame, held_timestamp)
+        self.pcap_writer.write(frame, timestamp)
+
+    def create_parser(self, connection_key: tuple) -> HttpParser:
+        http_parser = HttpParser(InfoHTTP(), self.max_body_size)
+        # The requests already seen the other way decide which of the responses have a body
+        http_parser.request_methods.extend(self.transactions.pending_methods(connection_key))
+        return http_parser
+
+    def report_messages(self, connection_key: tuple, flow: Flow, on_packet_received, timestamp: float):
+        if flow.http_parser is None:
+            return
+        for info_http in flow.http_parser.completed_messages:
+            if info_http.is_request():
+                self.requests_completed += 1
+                self.transactions.on_request(connection_key, info_http)
+                source, dest, source_port, dest_port = connection_key
+                response_flow = self.flows.get((dest, source, dest_port, source_port))
+                # A response direction without a parser yet gets the pending requests once it has one
+                if response_flow is not None and response_flow.http_parser is not None:
+                    response_flow.http_parser.request_methods.append(info_http.http_method)
+                request_type, info = info_http.http_method, "HTTP Request"
+            else:
+                self.responses_completed += 1
+                request_type = "HTTP Response"
+                info = str(info_http.status_code) + " " + info_http.status_message
+                transaction = self.transactions.on_response(connection_key, info_http)
+                if transaction is not None:
+                    request, latency = transaction
+                    info += f" to {request.http_method} {request.url} in {latency * 1e3:.1f} ms"
+            if info_http.truncated:
+                self.truncated_bodies += 1
+                info += f" (body truncated, {info_http.skipped_length} bytes not kept)"
+            # Messages are timed by the capture timestamp of their first packet
+            relative_time = (info_http.start_time or timestamp) - self.start_time
+            on_packet_received(relative_time, connection_key[0], connection_key[1], request_type, info,
                                info_http.body, info_http.headers)
-            self.tcp_buffers.pop(connection_key)
-            self.tcp_http_parser.pop(connection_key)
-            self.next_expected_seq.pop(connection_key)
+        flow.http_parser.completed_messages.clear()
+
+    def skip_gap(self, connection_key: tuple, flow: Flow, on_packet_received, timestamp: float):
+        # The message cut by the hole is reported as it is, like on a closed connection, and parsing starts over
+        self.gaps_skipped += 1
+        self.gap_bytes += flow.reassembler.last_gap
+        if flow.http_parser is not None:
+            flow.http_parser.close(timestamp)
+            self.report_messages(connection_key, flow, on_packet_received, timestamp)
+            flow.http_parser = None
+        flow.resynchronizing = True
+        # Which of the requests the lost responses answered is unknown, the next responses are not matched up
+        self.transactions.forget(connection_key)
 
-    def process_ip_packet(self, raw_data: bytes, on_packet_received):
-        ethernet_header = EthernetHeader(raw_data)
+    def close_flow(self, connection_key: tuple, flow: Flow, on_packet_received, timestamp: float):
+        # The message in progress is reported as it is, whether the flow ended or was evicted
+        self.flows.remove(connection_key)
+        if flow.http_parser is not None:
+            flow.http_parser.close(timestamp)
+        self.report_messages(connection_key, flow, on_packet_received, timestamp)
+        self.transactions.forget(connection_key)
 
-        assert ethernet_header.ethernet_type == 0x0800 or ethernet_header.ethernet_type == 0x86DD
+    def latency_report(self) -> str:
+        return self.transactions.report()
 
-        ip_header: IPHeader | IPv6Header = IPHeader(
-            ethernet_header.payload) if ethernet_header.ethernet_type == 0x0800 else IPv6Header(
-            ethernet_header.payload)
+    def register_metrics(self):
+        def by_type(counts: dict[int, int]) -> dict:
+            return {(ETHERNET_TYPE_NAMES.get(kind, f"0x{kind:04x}"),): count for kind, count in dict(counts).items()}
 
-        if ip_header.protocol == 6:  # TCP
-            tcp_header = TCPHeader(ip_header.payload)
-            self.process_tcp_packet(ip_header, tcp_header, on_packet_received)
+        metrics = self.metrics
+        metrics.register("sniffer_packets_total", COUNTER, "Frames processed.",
+                         lambda: by_type(self.packets_by_type), ("ethertype",))
+        metrics.register("sniffer_bytes_total", COUNTER, "Bytes of the frames processed.",
+                         lambda: by_type(self.bytes_by_type), ("ethertype",))
+        metrics.register("sniffer_kernel_packets_total", COUNTER, "Frames received by the kernel for the socket.",
+                         lambda: self.kernel_packets)
+        metrics.register("sniffer_kernel_drops_total", COUNTER, "Frames dropped by the kernel, the socket was full.",
+                         lambda: self.kernel_drops)
+        metrics.register("sniffer_short_frames_total", COUNTER, "Frames too short for their headers, skipped.",
+                         lambda: self.short_frames)
+        metrics.register("sniffer_flows_active", GAUGE, "TCP flows being tracked.", lambda: len(self.flows))
+        metrics.register("sniffer_flow_buffered_bytes", GAUGE, "Bytes held by the tracked flows, payload and objects.",
+                         lambda: self.flows.buffered_bytes)
+        metrics.register("sniffer_out_of_order_bytes", GAUGE, "Payload bytes waiting for a gap to be filled.",
+                         lambda: self.flows.out_of_order_bytes)
+        metrics.register("sniffer_tcp_gaps_skipped_total", COUNTER, "Holes in TCP streams given up on.",
+                         lambda: self.gaps_skipped)
+        metrics.register("sniffer_tcp_gap_bytes_total", COUNTER, "Stream bytes lost in the skipped holes.",
+                         lambda: self.gap_bytes)
+        metrics.register("sniffer_flows_evicted_total", COUNTER, "TCP flows evicted before they were closed.",
+                         lambda: {("idle",): self.flows.evicted_idle, ("memory",): self.flows.evicted_memory,
+                                  ("unidentified",): self.flows.evicted_unidentified},
+                         ("reason",))
+        metrics.register("sniffer_classifier_verdicts", GAUGE, "Streams remembered as not HTTP.",
+                         lambda: len(self.classifier))
+        metrics.register("sniffer_classifier_cache_hits_total", COUNTER, "Segments rejected by a remembered verdict.",
+                         lambda: self.classifier.cache_hits)
+        metrics.register("sniffer_http_messages_total", COUNTER, "HTTP messages parsed.",
+                         lambda: {("request",): self.requests_completed, ("response",): self.responses_completed},
+                         ("type",))
+        metrics.register("sniffer_http_parse_errors_total", COUNTER, "Flows dropped because they could not be parsed.",
+                         lambda: self.parse_errors)
+        metrics.register("sniffer_http_truncated_bodies_total", COUNTER, "HTTP bodies longer than the body limit.",
+                         lambda: self.truncated_bodies)
+        metrics.register("sniffer_unmatched_responses_total", COUNTER, "HTTP responses without a known request.",
+                         lambda: self.transactions.unmatched_responses)
+        metrics.register("sniffer_packet_processing_seconds", HISTOGRAM, "Time spent processing each frame.",
+                         lambda: self.processing_time)
+        if self.pcap_writer is not None:
+            metrics.register("sniffer_pcap_dropped_total", COUNTER, "Frames the capture recording dropped.",
+                             lambda: self.pcap_writer.dropped)
+        metrics.on_collect(self.update_kernel_statistics)
+
+    def update_kernel_statistics(self):
+        # Only one thread at a time, the kernel resets its counters on every read
+        if self.raw_socket is None:
+            return
+        statistics = read_packet_statistics(self.raw_socket)
+        if statistics is not None:
+            self.kernel_packets += statistics[0]
+            self.kernel_drops += statistics[1]
+
+    def process_ip_packet(self, raw_data: memoryview | bytes, on_packet_received, timestamp: float | None = None):
+        started = time.perf_counter()
+        # All headers are decoded in place from a single view over the frame, the payloads are never copied here
+        frame = memoryview(raw_data)
+        if self.pcap_writer is not None and not self.record_http_only:
+            self.pcap_writer.write(frame, timestamp)
+        try:
+            ethernet_header = EthernetHeader(frame)
+            ethernet_type = ethernet_header.ethernet_type
+            self.packets_by_type[ethernet_type] = self.packets_by_type.get(ethernet_type, 0) + 1
+            self.bytes_by_type[ethernet_type] = self.bytes_by_type.get(ethernet_type, 0) + len(frame)
+
+            # Frames queued before the socket filter was attached may be of any type
+            tcp_header = None
+            if ethernet_type == 0x0800 or ethernet_type == 0x86DD:
+                ip_header: IPHeader | IPv6Header = IPHeader(
+                    frame, ethernet_header.payload_offset) if ethernet_type == 0x0800 else IPv6Header(
+                    frame, ethernet_header.payload_offset)
+
+                if ip_header.protocol == 6:  # TCP
+                    tcp_header = TCPHeader(frame, ip_header.payload_offset, ip_header.payload_end)
+        except struct.error:
+            # A runt frame, or one cut short by the snapshot length, does not even hold its own headers
+            self.short_frames += 1
+            tcp_header = None
+
+        if tcp_header is not None:
+            self.process_tcp_packet(ip_header, tcp_header, on_packet_received, timestamp)
+
+        self.processing_time.record(time.perf_counter() - started)
+
+    def frames(self, stop_event):
+        """
+        Yields (frame, timestamp) pairs from the capture file, the ring, the batch receiver or the socket.
+
+        The frames may be views into buffers the next frame reuses, copy them to keep them any longer.
+        """
+        if self.pcap_reader is not None:
+            first_frame = True
+            for frame, timestamp in self.pcap_reader.frames(stop_event, self.replay_speed):
+                # Times are reported relative to the start of the capture, not of the replay
+                if first_frame and timestamp is not None:
+                    self.start_time = timestamp
+                    first_frame = False
+                yield frame, timestamp
+            print("Capture file done")
+        elif self.ring is not None:
+            yield from self.ring.frames(stop_event)
+        elif self.batch_receiver is not None:
+            while not stop_event.is_set():
+                # The buffers of a batch are reused by the next call, once the parsers are done with them
+                for buffer, length, timestamp in self.batch_receiver.receive_batch():
+                    yield buffer[:length], timestamp
+        else:
+            poller = select.poll()
+            poller.register(self.raw_socket.fileno(), select.POLLIN | select.POLLERR)
+            while not stop_event.is_set():
+                # Wake up periodically so the stop event is honoured on an idle link
+                if not poller.poll(100):
+                    continue
+                raw_data, ancillary, _, _ = self.raw_socket.recvmsg(65536, socket.CMSG_SPACE(TIMESPEC.size))
+                yield raw_data, capture_timestamp(ancillary)
 
     def sniff_packets(self, stop_event, on_packet_received):
         print("Starting sniffing...")
         try:
-            while not stop_event.is_set():
-                raw_data, _ = self.raw_socket.recvfrom(65536)
-                self.process_ip_packet(raw_data, on_packet_received)
+            for frame, timestamp in self.frames(stop_event):
+                self.process_ip_packet(frame, on_packet_received, timestamp)
         except KeyboardInterrupt:
             print("Sniffing stopped")
 
 
+def read_packet_statistics(raw_socket: socket.socket) -> tuple[int, int] | None:
+    try:
+        # The counters cover the time since the previous read, and the received frames include the dropped ones
+        return PACKET_STATS.unpack_from(raw_socket.getsockopt(SOL_PACKET, PACKET_STATISTICS, 12))
+    except (socket.error, struct.error) as e:
+        print(f"Error reading packet statistics: {e}")
+        return None
+
+
+def join_fanout_group(raw_socket: socket.socket, group_id: int) -> bool:
+    try:
+        # Flows are hashed symmetrically, so both directions of a connection land on the same socket
+        fanout = (group_id & 0xFFFF) | (PACKET_FANOUT_HASH | PACKET_FANOUT_FLAG_DEFRAG) << 16
+        # Packed by hand, the defrag flag does not fit in the signed int setsockopt would use
+        raw_socket.setsockopt(SOL_PACKET, PACKET_FANOUT, struct.pack("=I", fanout))
+        return True
+    except socket.error as e:
+        print(f"Error joining fanout group: {e}")
+        return False
+
+
+def create_raw_socket():
+    try:
+        # Capture every protocol, the socket filter only lets IPv4 and IPv6 through
+        return socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(0x0003))
+    except socket.error as e:
+        print(f"Error creating raw socket: {e}")
+        return None
+
+
 def create_ipv4_raw_socket():
     try:
         # Only capture IPv4
@@ -0,0 +1,119 @@
+import threading
+from collections import deque
+
+# What a full queue does with a new item
+BLOCK = "block"
+DROP_NEWEST = "drop-newest"
+DROP_OLDEST = "drop-oldest"
+OVERLOAD_POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST)
+
+DEFAULT_QUEUE_SIZE = 8192
+DEFAULT_BATCH_SIZE = 256
+
+
+class StageQueue:
+    """
+    A class for handing items from one pipeline stage to the next through a bounded queue.
+
+    Attributes:
+        name (str): The name of the stage consuming the queue, used in statistics.
+        max_size (int): The number of items the queue holds at most.
+        policy (str): What `put` does when the queue is full, one of OVERLOAD_POLICIES.
+        items (deque): The queued items, oldest first.
+        closed (bool): Set once the producer is done, the consumer then drains what is left.
+        put_count (int): The number of items accepted.
+        dropped (int): The number of items dropped, new ones with DROP_NEWEST and queued ones with DROP_OLDEST.
+        blocked (int): The number of times the producer had to wait for room with BLOCK.
+        high_water (int): The largest number of items queued at once.
+
+    Methods:
+        put(item): Queues an item, applying the overload policy when the queue is full.
+        get_batch(max_items, timeout): Returns up to `max_items` queued items, waiting up to `timeout` for the first,
+            or None once the queue is closed and drained.
+        close(): Wakes up both sides, no more items are accepted.
+        stats(): Returns the counters and the current depth as a dictionary.
+
+    Usage:
+        - One producer calls `put` and then `close`, one consumer calls `get_batch` until it returns None.
+
+    Note:
+        The consumer takes items in batches, so the lock is taken once per batch rather than once per item, and
+        the producer only signals when the consumer is actually waiting. With DROP_NEWEST and DROP_OLDEST the
+        producer never waits, which is what the capture stage needs to keep reading from the socket.
+    """
+
+    def __init__(self, name: str, max_size: int = DEFAULT_QUEUE_SIZE, policy: str = BLOCK):
+        if policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"unknown overload policy {policy!r}")
+        self.name = name
+        self.max_size = max(max_size, 1)
+        self.policy = policy
+        self.items = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.consumer_waiting = False
+        self.closed = False
+
+        self.put_count = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.high_water = 0
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def put(self, item) -> bool:
+        """
+        Queues an item.
+
+        Returns:
+            bool: False if the item was dropped, or the queue is closed.
+        """
+        with self.lock:
+            if len(self.items) >= self.max_size:
+                if self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.policy == DROP_OLDEST:
+                    self.items.popleft()
+                    self.dropped += 1
+                else:
+                    self.blocked += 1
+                    while len(self.items) >= self.max_size and not self.closed:
+                        self.not_full.wait()
+            if self.closed:
+                return False
+
+            self.items.append(item)
+            self.put_count += 1
+            if len(self.items) > self.high_water:
+                self.high_water = len(self.items)
+            if self.consumer_waiting:
+                self.not_empty.notify()
+            return True
+
+    def get_batch(self, max_items: int = DEFAULT_BATCH_SIZE, timeout: float | None = None) -> list | None:
+        with self.lock:
+            if not self.items and not self.closed:
+                self.consumer_waiting = True
+                self.not_empty.wait(timeout)
+                self.consumer_waiting = False
+            if not self.items and self.closed:
+                return None
+            count = min(len(self.items), max_items)
+            batch = [self.items.popleft() for _ in range(count)]
+            if count and self.policy == BLOCK:
+                self.not_full.notify()
+            return batch
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+            self.not_full.notify_all()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"depth": len(self.items), "high_water": self.high_water, "put": self.put_count,
+                    "dropped": self.dropped, "blocked": self.blocked}
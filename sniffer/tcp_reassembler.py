@@ -0,0 +1,150 @@
+from bisect import bisect_left
+
+SEQUENCE_MODULO = 1 << 32
+# Segments further ahead than this are not plausible in a TCP window and are dropped
+MAX_WINDOW = 1 << 30
+# Out-of-order data waits this long, and up to this many bytes, for a lost segment to be retransmitted,
+# past that the hole is skipped
+DEFAULT_MAX_GAP_SECONDS = 5.0
+DEFAULT_MAX_GAP_BYTES = 4 * 1024 * 1024
+
+
+def sequence_diff(a: int, b: int) -> int:
+    """Returns a - b in 32 bit sequence space, negative when a is before b even across a wraparound."""
+    return (a - b + (1 << 31)) % SEQUENCE_MODULO - (1 << 31)
+
+
+class TcpReassembler:
+    """
+    A class for putting the payloads of one direction of a TCP connection back in order.
+
+    Attributes:
+        next_seq (int): The next expected sequence number.
+        delivered (int): The number of stream bytes delivered so far.
+        starts (list): The stream offsets of the buffered intervals, sorted and never overlapping or touching.
+        chunks (list): The bytes of each buffered interval.
+        buffered_bytes (int): The number of bytes held in `chunks`.
+        max_gap_seconds (float): How long a hole may stay open before the data after it is delivered anyway.
+        max_gap_bytes (int): How many bytes may be buffered behind a hole before the data after it is delivered.
+        gap_since (float | None): The time the stream last made progress while a hole was open.
+        last_gap (int): The number of bytes skipped before the data returned by the last call to `add`.
+
+    Methods:
+        on_syn(sequence): Starts the stream after the initial sequence number of a SYN.
+        add(sequence, payload, now): Adds a segment and returns the data that became contiguous, or None.
+
+    Usage:
+        - Create with the sequence number of the first payload byte, or the initial sequence number of a SYN + 1.
+        - Pass every segment to `add` and feed what it returns to the parser.
+
+    Note:
+        Sequence numbers are only ever compared through `sequence_diff`, so the stream survives wrapping around
+        2 ** 32, and they are turned into 64 bit stream offsets before anything is buffered. Out-of-order data is
+        kept as coalesced intervals: an overlapping retransmission only fills the gaps, the bytes received first
+        win, and everything before `delivered` is trimmed away. An in-order segment with nothing buffered after
+        it is returned as it is, without being copied.
+        A segment the capture missed is never retransmitted as far as the reassembler is concerned, so a hole is
+        only waited for within the gap limits. Past them the stream jumps to the first buffered interval and
+        `last_gap` tells the caller the data it gets does not follow what it got before.
+    """
+
+    __slots__ = ("next_seq", "delivered", "starts", "chunks", "buffered_bytes", "max_gap_seconds", "max_gap_bytes",
+                 "gap_since", "last_gap")
+
+    def __init__(self, next_seq: int, max_gap_seconds: float = DEFAULT_MAX_GAP_SECONDS,
+                 max_gap_bytes: int = DEFAULT_MAX_GAP_BYTES):
+        self.next_seq: int = next_seq % SEQUENCE_MODULO
+        self.delivered: int = 0
+        self.starts: list[int] = []
+        self.chunks: list[bytearray] = []
+        self.buffered_bytes: int = 0
+        self.max_gap_seconds: float = max_gap_seconds
+        self.max_gap_bytes: int = max_gap_bytes
+        self.gap_since: float | None = None
+        self.last_gap: int = 0
+
+    def on_syn(self, sequence: int) -> None:
+        # The SYN takes up one sequence number, data starts right after it
+        self.next_seq = (sequence + 1) % SEQUENCE_MODULO
+        self.delivered = 0
+        self.starts.clear()
+        self.chunks.clear()
+        self.buffered_bytes = 0
+        self.gap_since = None
+        self.last_gap = 0
+
+    def add(self, sequence: int, payload: bytes | memoryview, now: float = 0.0) -> bytes | memoryview | None:
+        self.last_gap = 0
+        offset = sequence_diff(sequence, self.next_seq)
+        if not payload or offset + len(payload) <= 0 or offset > MAX_WINDOW:
+            # Empty, entirely retransmitted, or nowhere near the window
+            return None
+        if offset < 0:
+            payload = payload[-offset:]
+            offset = 0
+
+        start = self.delivered + offset
+        if offset == 0 and (not self.starts or self.starts[0] > start + len(payload)):
+            if self.starts:
+                self.gap_since = now
+            return self._advance(payload)
+
+        self._insert(start, payload)
+        if self.starts[0] != self.delivered:
+            if self.gap_since is None:
+                self.gap_since = now
+            if self.buffered_bytes <= self.max_gap_bytes and now - self.gap_since <= self.max_gap_seconds:
+                return None
+            # The missing bytes are not coming, e.g. the capture dropped them, the stream resumes after the hole
+            self.last_gap = self.starts[0] - self.delivered
+            self.delivered = self.starts[0]
+            self.next_seq = (self.next_seq + self.last_gap) % SEQUENCE_MODULO
+        self.starts.pop(0)
+        chunk = self.chunks.pop(0)
+        self.buffered_bytes -= len(chunk)
+        self.gap_since = now if self.starts else None
+        return self._advance(memoryview(chunk))
+
+    def _advance(self, data: bytes | memoryview) -> bytes | memoryview:
+        self.delivered += len(data)
+        self.next_seq = (self.next_seq + len(data)) % SEQUENCE_MODULO
+        return data
+
+    def _insert(self, start: int, data: bytes | memoryview) -> None:
+        end = start + len(data)
+        # The intervals that overlap or touch [start, end) are merged with it
+        first = bisect_left(self.starts, start)
+        if first and self.starts[first - 1] + len(self.chunks[first - 1]) >= start:
+            first -= 1
+        last = first
+        while last < len(self.starts) and self.starts[last] <= end:
+            last += 1
+
+        if first == last:
+            self.starts.insert(first, start)
+            self.chunks.insert(first, bytearray(data))
+            self.buffered_bytes += len(data)
+            return
+
+        replaced_bytes = sum(len(chunk) for chunk in self.chunks[first:last])
+        # The first interval is grown in place, so a run of segments after a hole is not copied over and over
+        merged_start = min(start, self.starts[first])
+        if self.starts[first] <= start:
+            merged = self.chunks[first]
+            position = self.starts[first] + len(merged)
+            intervals = zip(self.starts[first + 1:last], self.chunks[first + 1:last])
+        else:
+            merged = bytearray()
+            position = start
+            intervals = zip(self.starts[first:last], self.chunks[first:last])
+        for interval_start, chunk in intervals:
+            if position < interval_start:
+                merged += data[position - start:interval_start - start]
+            merged += chunk
+            position = interval_start + len(chunk)
+        if position < end:
+            merged += data[position - start:]
+
+        self.buffered_bytes += len(merged) - replaced_bytes
+        self.starts[first:last] = [merged_start]
+        self.chunks[first:last] = [merged]
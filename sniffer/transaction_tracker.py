@@ -0,0 +1,129 @@
+import re
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
+
+from parsers.info_http import InfoHTTP
+from sniffer.latency_histogram import LatencyHistogram, DEFAULT_PERCENTILES
+
+# Requests still waiting for a response are only kept for this many connections, and this many per connection
+MAX_PENDING_CONNECTIONS = 65536
+MAX_PENDING_REQUESTS = 64
+# Endpoints past this many share a single histogram
+MAX_ENDPOINTS = 4096
+OTHER_ENDPOINT = ("*", "*", "*")
+
+# Path segments that look like identifiers: numbers, hex strings, UUIDs
+ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}(-[0-9a-fA-F]{4}){3}-[0-9a-fA-F]{12})$")
+
+
+@lru_cache(maxsize=16384)
+def normalize_path(url: str) -> str:
+    """
+    Reduces a request URL to the endpoint it targets.
+
+    The query string is dropped and identifier-like path segments are replaced with `{id}`,
+    so that `/users/42/orders?page=2` and `/users/7/orders` are the same endpoint.
+    """
+    path = url.split("?", 1)[0].split("#", 1)[0]
+    if "://" in path:
+        # Absolute form, sent to proxies
+        path = "/" + path.split("://", 1)[1].partition("/")[2]
+    return "/".join("{id}" if ID_SEGMENT.match(segment) else segment for segment in path.split("/")) or "/"
+
+
+class TransactionTracker:
+    """
+    A class for matching HTTP responses to their requests and keeping latency statistics per endpoint.
+
+    Attributes:
+        pending (OrderedDict): The requests waiting for a response, by the connection key of the request direction.
+        histograms (dict): A LatencyHistogram per (host, method, normalized path).
+        lock (threading.Lock): Guards `histograms`, so that statistics can be read while capturing.
+        unmatched_responses (int): The number of responses that came without a known request.
+
+    Methods:
+        on_request(connection_key, request): Records a request waiting for its response.
+        on_response(connection_key, response): Returns the request a response answers and records the latency.
+        pending_methods(connection_key): Returns the methods of the requests a response direction still answers.
+        forget(connection_key): Drops the pending requests answered on a closed response direction.
+        percentiles(percentiles): Returns the latency percentiles of every endpoint.
+        report(): Returns the latency percentiles of every endpoint as text.
+
+    Usage:
+        - Pass each completed request, and each completed response, with the directional connection key.
+        - Read `percentiles` or `report` from any thread.
+
+    Note:
+        HTTP/1.1 answers requests in order, so each connection has a FIFO of pending requests and a response
+        answers the oldest one. The latency is measured on capture timestamps, from the packet completing
+        the request to the packet holding the response's status line, which is the server's think time plus
+        one network round trip at the capture point.
+    """
+
+    def __init__(self):
+        self.pending: OrderedDict[tuple, deque[InfoHTTP]] = OrderedDict()
+        self.histograms: dict[tuple[str, str, str], LatencyHistogram] = {}
+        self.lock = threading.Lock()
+        self.unmatched_responses = 0
+
+    def on_request(self, connection_key: tuple, request: InfoHTTP) -> None:
+        requests = self.pending.get(connection_key)
+        if requests is None:
+            if len(self.pending) >= MAX_PENDING_CONNECTIONS:
+                self.pending.popitem(last=False)
+            requests = self.pending[connection_key] = deque(maxlen=MAX_PENDING_REQUESTS)
+        requests.append(request)
+
+    def on_response(self, connection_key: tuple, response: InfoHTTP) -> tuple[InfoHTTP, float] | None:
+        source, dest, source_port, dest_port = connection_key
+        request_key = (dest, source, dest_port, source_port)
+        requests = self.pending.get(request_key)
+        if not requests:
+            self.unmatched_responses += 1
+            return None
+        if response.status_code < 200:
+            # An interim response, the final one is still to come
+            return None
+        request = requests.popleft()
+        if not requests:
+            del self.pending[request_key]
+
+        latency = max(response.start_time - request.end_time, 0.0)
+        endpoint = (self.host(request, dest, dest_port), request.http_method, normalize_path(request.url))
+        with self.lock:
+            histogram = self.histograms.get(endpoint)
+            if histogram is None:
+                if len(self.histograms) >= MAX_ENDPOINTS:
+                    endpoint = OTHER_ENDPOINT
+                histogram = self.histograms.setdefault(endpoint, LatencyHistogram())
+            histogram.record(latency)
+        return request, latency
+
+    @staticmethod
+    def host(request: InfoHTTP, dest: str, dest_port: int) -> str:
+        host = request.get_header(b"host")
+        return host.decode("utf-8", "replace") if host is not None else f"{dest}:{dest_port}"
+
+    def pending_methods(self, connection_key: tuple) -> list[str]:
+        source, dest, source_port, dest_port = connection_key
+        return [request.http_method for request in self.pending.get((dest, source, dest_port, source_port), ())]
+
+    def forget(self, connection_key: tuple) -> None:
+        source, dest, source_port, dest_port = connection_key
+        self.pending.pop((dest, source, dest_port, source_port), None)
+
+    def percentiles(self, percentiles: tuple[float, ...] = DEFAULT_PERCENTILES) -> dict:
+        with self.lock:
+            histograms = list(self.histograms.items())
+        return {endpoint: histogram.percentiles(percentiles) for endpoint, histogram in histograms}
+
+    def report(self) -> str:
+        lines = [f"{'host':<30}{'method':<8}{'path':<40}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}"
+                 f"{'max ms':>10}"]
+        endpoints = sorted(self.percentiles().items(), key=lambda item: item[1]["count"], reverse=True)
+        for (host, method, path), summary in endpoints:
+            lines.append(f"{host[:29]:<30}{method:<8}{path[:39]:<40}{summary['count']:>8}"
+                         f"{summary['p50'] * 1e3:>10.2f}{summary['p90'] * 1e3:>10.2f}{summary['p99'] * 1e3:>10.2f}"
+                         f"{summary['max'] * 1e3:>10.2f}")
+        return "\n".join(lines)